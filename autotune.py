@@ -0,0 +1,201 @@
+# autotune.py
+# Find the fastest stable CPU training settings for this machine and dataset.
+#
+# Each probe trains the real model on the real dataset YAML for a few
+# iterations in a fresh process (thread pools can only be sized before torch
+# starts working), and measures images/s after a warm-up plus the peak RSS
+# of the trainer and its loader workers. A probe is stable when it finishes
+# and stays under MEMORY_HEADROOM of the memory that was available.
+#
+# The search is coordinate descent: starting from the notebook's settings,
+# batch size, workers, intra-op threads, inter-op threads and cache mode are
+# varied one at a time, keeping the best value of each. That needs about 15
+# probes instead of the full grid. The result goes to runs/train_config.yaml,
+# which train.py reads.
+#
+#   python autotune.py --data balanced_final/dataset.yaml
+#   python autotune.py --batch 2 4 8 16 --workers 0 2 4 --cache false ram disk
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import yaml
+
+from train import DATA, DEFAULTS, IMGSZ, MODEL, TRAIN_CONFIG, apply_threads, keep_workers, parse_cache
+
+# ========== CONFIGURATION ==========
+CORES = os.cpu_count() or 1
+BATCH_SIZES = [2, 4, 8, 16]
+WORKERS = sorted({0, 2, 4, min(8, CORES)})
+THREADS = sorted({max(1, CORES // 2), CORES})
+INTEROP_THREADS = [1, 2]
+CACHE_MODES = [False, 'ram']
+ITERATIONS = 20         # timed iterations per probe
+WARMUP = 5              # iterations skipped before timing
+MEMORY_HEADROOM = 0.85  # a probe may use at most this fraction of the memory available at start
+# ===================================
+
+
+class ProbeDone(Exception):
+    pass
+
+
+class MemoryMonitor(threading.Thread):
+    """Peak RSS of this process plus its children (the loader workers), sampled in the background"""
+
+    def __init__(self, interval=0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        import psutil
+
+        me = psutil.Process()
+        while not self._stop_event.is_set():
+            total = 0
+            for proc in [me] + me.children(recursive=True):
+                try:
+                    total += proc.memory_info().rss
+                except psutil.Error:
+                    pass
+            self.peak = max(self.peak, total)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _probe(job):
+    """Images/s and peak memory of a few training iterations; runs in its own process"""
+    settings, model, data, imgsz, iterations, warmup = job
+    apply_threads(settings['threads'], settings['interop_threads'])
+    from ultralytics import YOLO
+
+    stamps = []
+
+    def on_batch_end(trainer):
+        stamps.append(time.perf_counter())
+        if len(stamps) >= warmup + iterations:
+            raise ProbeDone
+
+    yolo = YOLO(model)
+    yolo.add_callback('on_train_batch_end', on_batch_end)
+    monitor = MemoryMonitor()
+    monitor.start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            yolo.train(data=str(data), imgsz=imgsz, epochs=1, batch=settings['batch'], workers=settings['workers'],
+                       cache=settings['cache'], trainer=keep_workers(), device='cpu', val=False, plots=False,
+                       save=False, verbose=False, project=tmp, name='probe', exist_ok=True)
+    except ProbeDone:
+        pass
+    finally:
+        monitor.stop()
+
+    if len(stamps) <= warmup:
+        raise RuntimeError(f"only {len(stamps)} iterations ran; the dataset is too small for the warm-up")
+    seconds = (stamps[-1] - stamps[warmup - 1]) / (len(stamps) - warmup) if warmup else \
+        (stamps[-1] - stamps[0]) / max(len(stamps) - 1, 1)
+    return {'images_per_s': settings['batch'] / seconds, 'seconds_per_iter': seconds, 'peak_bytes': monitor.peak}
+
+
+def run_probe(settings, model, data, imgsz, iterations, warmup, limit):
+    """Probe result dict with 'stable' (and 'error' when the probe failed)"""
+    context = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(_probe, (settings, model, data, imgsz, iterations, warmup)).result()
+    except Exception as e:  # including a worker killed for running out of memory
+        return {'images_per_s': 0.0, 'peak_bytes': 0, 'stable': False, 'error': str(e) or type(e).__name__}
+    result['stable'] = result['peak_bytes'] <= limit
+    if not result['stable']:
+        result['error'] = f"peak memory {result['peak_bytes'] / 2**30:.1f} GiB over the {limit / 2**30:.1f} GiB limit"
+    return result
+
+
+def autotune(model=MODEL, data=DATA, imgsz=IMGSZ, space=None, iterations=ITERATIONS, warmup=WARMUP,
+             headroom=MEMORY_HEADROOM, config_path=TRAIN_CONFIG):
+    import psutil
+
+    space = space or {'batch': BATCH_SIZES, 'workers': WORKERS, 'threads': THREADS,
+                      'interop_threads': INTEROP_THREADS, 'cache': CACHE_MODES}
+    limit = headroom * psutil.virtual_memory().available
+
+    print("=" * 60)
+    print("🎛️  CPU TRAINING AUTO-TUNER")
+    print("=" * 60)
+    print(f"{model} on {data} at {imgsz}px, {CORES} cores, memory limit {limit / 2**30:.1f} GiB")
+
+    current = dict(DEFAULTS, threads=CORES, interop_threads=1)
+    results = {}
+
+    def measure(settings):
+        key = tuple(sorted(settings.items(), key=lambda kv: kv[0]))
+        if key not in results:
+            label = ', '.join(f"{k}={v}" for k, v in settings.items())
+            r = run_probe(settings, model, data, imgsz, iterations, warmup, limit)
+            results[key] = r
+            status = (f"{r['images_per_s']:6.2f} img/s, {r['peak_bytes'] / 2**30:.1f} GiB" if r['stable']
+                      else f"❌ {r['error']}")
+            print(f"  {label:<60} {status}")
+        return results[key]
+
+    best = measure(current)
+    for name, values in space.items():
+        print(f"\n🔎 {name}")
+        for value in values:
+            candidate = dict(current, **{name: value})
+            r = measure(candidate)
+            if r['stable'] and (not best['stable'] or r['images_per_s'] > best['images_per_s']):
+                current, best = candidate, r
+
+    if not best['stable']:
+        print("\n❌ No stable configuration found")
+        return None
+
+    print(f"\n✅ Fastest stable: {', '.join(f'{k}={v}' for k, v in current.items())}")
+    print(f"   {best['images_per_s']:.2f} img/s, peak {best['peak_bytes'] / 2**30:.1f} GiB")
+
+    config = dict(current, measured={'images_per_s': round(best['images_per_s'], 3),
+                                     'peak_memory_gib': round(best['peak_bytes'] / 2**30, 2),
+                                     'model': str(model), 'data': str(data), 'imgsz': imgsz,
+                                     'probes': len(results)})
+    config_path = Path(config_path)
+    config_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(config_path, 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+    print(f"📄 Config: {config_path} (used by train.py)")
+    return config
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tune batch size, workers, threads and cache mode for CPU training')
+    parser.add_argument('--model', default=MODEL, help='Model to train')
+    parser.add_argument('--data', default=DATA, help='Dataset YAML')
+    parser.add_argument('--imgsz', type=int, default=IMGSZ, help='Training image size')
+    parser.add_argument('--batch', type=int, nargs='+', default=BATCH_SIZES, help='Batch sizes to try')
+    parser.add_argument('--workers', type=int, nargs='+', default=WORKERS, help='Loader worker counts to try')
+    parser.add_argument('--threads', type=int, nargs='+', default=THREADS, help='torch intra-op thread counts')
+    parser.add_argument('--interop', type=int, nargs='+', default=INTEROP_THREADS, help='torch inter-op thread counts')
+    parser.add_argument('--cache', type=parse_cache, nargs='+', default=CACHE_MODES, help='Cache modes (false, ram, disk)')
+    parser.add_argument('--iterations', type=int, default=ITERATIONS, help='Timed iterations per probe')
+    parser.add_argument('--headroom', type=float, default=MEMORY_HEADROOM,
+                        help='Fraction of the available memory a configuration may use')
+    parser.add_argument('--config', type=Path, default=TRAIN_CONFIG, help='Where to write the result')
+    args = parser.parse_args(argv)
+
+    space = {'batch': args.batch, 'workers': args.workers, 'threads': args.threads,
+             'interop_threads': args.interop, 'cache': args.cache}
+    autotune(args.model, args.data, args.imgsz, space, args.iterations, WARMUP, args.headroom, args.config)
+
+
+if __name__ == "__main__":
+    main()
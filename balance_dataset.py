@@ -5,57 +5,60 @@ Fixes class imbalance through smart augmentation
 """
 
 import os
-import shutil
 import random
-import yaml
+import time
+import argparse
 from pathlib import Path
-from collections import Counter
+from collections import Counter, OrderedDict
 from datetime import datetime
 import cv2
-import albumentations as A
 import numpy as np
 
+from dataset_manifest import (add_entry, load_dataset, materialize, new_manifest, parse_label_text,
+                              read_boxes, save_virtual_dataset)
+from find_duplicates import source_stem
+
 # ================= CONFIGURATION =================
 INPUT_DIR = "/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/data"
 OUTPUT_DIR = "/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/balanced_data"
 TARGET_SAMPLES_PER_CLASS = 500
 CLASS_NAMES = ["Cardboard", "Glass", "Metal", "Mixed Waste", "Organic Waste", "Paper", "Plastic", "Textiles"]
+BASE_SIZE = 640          # every pipeline starts from a BASE_SIZE x BASE_SIZE image
+BASE_CACHE_SIZE = 512    # decoded bases kept in memory (~1.2 MB each)
 # ==================================================
 
+def yolo_boxes_to_annotations(boxes, img_width, img_height):
+    """Convert YOLO [class_id, xc, yc, w, h] boxes to pixel pascal_voc annotations"""
+    annotations = []
+    for box in boxes:
+        class_id = int(box[0])
+        x_center, y_center, width, height = box[1:5]
+
+        # Ensure coordinates are valid
+        x_center = max(0.0, min(1.0, x_center))
+        y_center = max(0.0, min(1.0, y_center))
+        width = max(0.001, min(1.0, width))
+        height = max(0.001, min(1.0, height))
+
+        # Convert to pixel coordinates
+        x_min = max(0.0, (x_center - width/2)) * img_width
+        y_min = max(0.0, (y_center - height/2)) * img_height
+        x_max = min(1.0, (x_center + width/2)) * img_width
+        y_max = min(1.0, (y_center + height/2)) * img_height
+
+        if x_max > x_min and y_max > y_min:
+            annotations.append({
+                'class_id': class_id,
+                'bbox': [x_min, y_min, x_max, y_max]
+            })
+
+    return annotations
+
 def read_yolo_label(label_path, img_width, img_height):
     """Read YOLO format label file"""
     with open(label_path, 'r') as f:
-        lines = f.readlines()
-    
-    annotations = []
-    for line in lines:
-        parts = line.strip().split()
-        if len(parts) >= 5:
-            class_id = int(float(parts[0]))
-            x_center = float(parts[1])
-            y_center = float(parts[2])
-            width = float(parts[3])
-            height = float(parts[4])
-            
-            # Ensure coordinates are valid
-            x_center = max(0.0, min(1.0, x_center))
-            y_center = max(0.0, min(1.0, y_center))
-            width = max(0.001, min(1.0, width))
-            height = max(0.001, min(1.0, height))
-            
-            # Convert to pixel coordinates
-            x_min = max(0.0, (x_center - width/2)) * img_width
-            y_min = max(0.0, (y_center - height/2)) * img_height
-            x_max = min(1.0, (x_center + width/2)) * img_width
-            y_max = min(1.0, (y_center + height/2)) * img_height
-            
-            if x_max > x_min and y_max > y_min:
-                annotations.append({
-                    'class_id': class_id,
-                    'bbox': [x_min, y_min, x_max, y_max]
-                })
-    
-    return annotations
+        boxes = parse_label_text(f.read())
+    return yolo_boxes_to_annotations(boxes, img_width, img_height)
 
 def write_yolo_label(label_path, annotations, img_width, img_height):
     """Write YOLO format label file"""
@@ -76,14 +79,20 @@ def write_yolo_label(label_path, annotations, img_width, img_height):
             
             f.write(f"{ann['class_id']} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n")
 
-def get_augmentation_pipeline(class_id, current_count, target_count):
-    """Get augmentation pipeline based on class imbalance"""
+def get_augmentation_pipeline(class_id, current_count, target_count, resize=True):
+    """Get augmentation pipeline based on class imbalance.
+
+    With resize=False the leading A.Resize(640, 640) is left out, for images
+    that are already 640x640 bases (see load_base_image).
+    """
+    import albumentations as A  # slow to import; only needed once augmenting
+
     augmentation_factor = target_count / max(current_count, 1)
+    first = [A.Resize(BASE_SIZE, BASE_SIZE)] if resize else []
     
     # Heavy augmentation for minority classes
     if augmentation_factor > 5:
-        return A.Compose([
-            A.Resize(640, 640),
+        return A.Compose(first + [
             A.HorizontalFlip(p=0.7),
             A.VerticalFlip(p=0.3),
             A.RandomRotate90(p=0.3),
@@ -96,8 +105,7 @@ def get_augmentation_pipeline(class_id, current_count, target_count):
     
     # Moderate augmentation
     elif augmentation_factor > 2:
-        return A.Compose([
-            A.Resize(640, 640),
+        return A.Compose(first + [
             A.HorizontalFlip(p=0.5),
             A.ShiftScaleRotate(shift_limit=0.1, scale_limit=0.2, rotate_limit=30, p=0.5),
             A.RandomBrightnessContrast(brightness_limit=0.2, contrast_limit=0.2, p=0.5),
@@ -106,94 +114,93 @@ def get_augmentation_pipeline(class_id, current_count, target_count):
     
     # Light augmentation
     else:
-        return A.Compose([
-            A.Resize(640, 640),
+        return A.Compose(first + [
             A.HorizontalFlip(p=0.3),
             A.RandomBrightnessContrast(brightness_limit=0.1, contrast_limit=0.1, p=0.3),
         ], bbox_params=A.BboxParams(format='pascal_voc', label_fields=['class_labels']))
 
-def split_validation_set(output_dir, split_ratio=0.2):
-    """Split training data for validation if needed"""
-    train_img_dir = Path(output_dir) / "train" / "images"
-    train_lbl_dir = Path(output_dir) / "train" / "labels"
-    val_img_dir = Path(output_dir) / "val" / "images"
-    val_lbl_dir = Path(output_dir) / "val" / "labels"
-    
-    val_img_dir.mkdir(parents=True, exist_ok=True)
-    val_lbl_dir.mkdir(parents=True, exist_ok=True)
-    
-    train_images = list(train_img_dir.glob("*"))
-    if len(train_images) == 0:
+def load_base_image(path, size=BASE_SIZE):
+    """Decode an image once into the size x size base the pipelines start from.
+    
+    JPEGs are decoded at 1/2, 1/4 or 1/8 scale when their short side stays at
+    least size (DCT-domain downscaling, never below the base), then area-resized: the same geometry as A.Resize(640, 640)
+    on the full image, for a fraction of the decode and resize cost.
+    """
+    from resize_cache import decode_for_size
+    
+    img = decode_for_size(path, size, square=True)
+    if img is None:
+        return None
+    interp = cv2.INTER_AREA if max(img.shape[:2]) > size else cv2.INTER_LINEAR
+    return cv2.resize(img, (size, size), interpolation=interp)
+
+def split_validation_set(manifest, split_ratio=0.2):
+    """Split training entries for validation if needed.
+
+    An original and all of its augmentations move together, so no
+    augmented copy of a validation image stays in train.
+    """
+    train_entries = manifest['splits'].get('train', [])
+    if len(train_entries) == 0:
         return 0
     
-    num_val = max(1, int(len(train_images) * split_ratio))
-    val_images = random.sample(train_images, num_val)
+    groups = {}
+    for entry in train_entries:
+        groups.setdefault(source_stem(entry['image']), []).append(entry)
     
-    moved = 0
-    for img_file in val_images:
-        if img_file.suffix.lower() in ['.jpg', '.jpeg', '.png']:
-            # Move image
-            dest_img = val_img_dir / img_file.name
-            shutil.move(str(img_file), str(dest_img))
+    num_val = max(1, int(len(groups) * split_ratio))
+    val_stems = set(random.sample(sorted(groups), num_val))
             
-            # Move label
-            label_file = train_lbl_dir / f"{img_file.stem}.txt"
-            if label_file.exists():
-                dest_lbl = val_lbl_dir / f"{img_file.stem}.txt"
-                shutil.move(str(label_file), str(dest_lbl))
-                moved += 1
-    
-    return moved
-
-def balance_dataset():
-    """Main function to balance the dataset"""
-    
-    # Create output directories
-    output_train_img = Path(OUTPUT_DIR) / "train" / "images"
-    output_train_lbl = Path(OUTPUT_DIR) / "train" / "labels"
-    output_val_img = Path(OUTPUT_DIR) / "val" / "images"
-    output_val_lbl = Path(OUTPUT_DIR) / "val" / "labels"
+    manifest['splits']['train'] = [e for stem, g in groups.items() if stem not in val_stems for e in g]
+    manifest['splits']['val'] = [e for stem, g in groups.items() if stem in val_stems for e in g]
     
-    for dir_path in [output_train_img, output_train_lbl, output_val_img, output_val_lbl]:
+    return len(manifest['splits']['val'])
+
+def balance_dataset(input_dir=INPUT_DIR, output_dir=OUTPUT_DIR, virtual=False, base_cache=True):
+    """Main function to balance the dataset.
+    
+    input_dir may be a YOLO folder, a manifest or a folder holding one. Only
+    the augmented images are written; originals are referenced from the
+    output manifest (virtual=True) or copied at the end. With base_cache=False
+    every sample decodes its full-resolution source again (the old behaviour,
+    kept for timing comparisons).
+    """
+    
+    # Augmented samples are the only real files this stage creates
+    output_aug_img = Path(output_dir) / "augmented" / "images"
+    output_aug_lbl = Path(output_dir) / "augmented" / "labels"
+
+    for dir_path in [output_aug_img, output_aug_lbl]:
         dir_path.mkdir(parents=True, exist_ok=True)
     
     # Analyze current distribution
     print("Analyzing dataset distribution...")
     
-    # Use YOUR actual paths
-    input_train_lbl = Path(INPUT_DIR) / "train" / "labels"
-    input_val_lbl = Path(INPUT_DIR) / "validation" / "labels"  # Changed from "val" to "validation"
-    input_train_img = Path(INPUT_DIR) / "train" / "images"
-    input_val_img = Path(INPUT_DIR) / "validation" / "images"   # Changed from "val" to "validation"
+    dataset = load_dataset(input_dir)
+    names = dataset['names'] or CLASS_NAMES  # ids keep the input's meaning
+    train_entries = dataset['splits'].get('train', [])
+    val_entries = dataset['splits'].get('validation') or dataset['splits'].get('val')  # data/ uses "validation"
+
+    print(f"Found {len(train_entries)} training and {len(val_entries or [])} validation images in: {input_dir}")
     
     # Count current class distribution
     class_counts = Counter()
-    image_class_map = {}
-    
-    print(f"Looking for training labels in: {input_train_lbl}")
-    print(f"Looking for validation labels in: {input_val_lbl}")
-    
-    # Process training labels
-    for label_file in input_train_lbl.glob("*.txt"):
-        try:
-            with open(label_file, 'r') as f:
-                classes_in_image = []
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        class_id = int(float(line.split()[0]))
-                        class_counts[class_id] += 1
-                        classes_in_image.append(class_id)
-                
-                if classes_in_image:
-                    image_class_map[label_file.stem] = classes_in_image
-        except Exception as e:
-            print(f"Warning: Could not read {label_file}: {e}")
+    image_class_map = {}  # index into train_entries -> class ids
+    labelled_entries = []
+    
+    for idx, entry in enumerate(train_entries):
+        if 'boxes' not in entry and 'label' not in entry:
+            continue
+        labelled_entries.append(entry)
+        classes_in_image = [int(box[0]) for box in read_boxes(entry)]
+        class_counts.update(classes_in_image)
+        if classes_in_image:
+            image_class_map[idx] = classes_in_image
     
     print(f"\nCurrent class distribution:")
     for class_id in sorted(class_counts.keys()):
-        if class_id < len(CLASS_NAMES):
-            print(f"  Class {class_id} ({CLASS_NAMES[class_id]}): {class_counts[class_id]} samples")
+        if class_id < len(names):
+            print(f"  Class {class_id} ({names[class_id]}): {class_counts[class_id]} samples")
         else:
             print(f"  Class {class_id} (Unknown): {class_counts[class_id]} samples")
     
@@ -202,7 +209,7 @@ def balance_dataset():
     
     # Calculate augmentation factors
     augmentation_factors = {}
-    for class_id in range(len(CLASS_NAMES)):
+    for class_id in range(len(names)):
         current = class_counts.get(class_id, 0)
         if current == 0:
             augmentation_factors[class_id] = 0
@@ -218,21 +225,17 @@ def balance_dataset():
     print("\n" + "="*50)
     print("Processing training set...")
     
-    # Copy all original training images
-    copied_count = 0
-    for img_file in input_train_img.glob("*"):
-        if img_file.suffix.lower() in ['.jpg', '.jpeg', '.png', '.JPG', '.JPEG', '.PNG']:
-            label_file = input_train_lbl / f"{img_file.stem}.txt"
-            if label_file.exists():
-                shutil.copy(img_file, output_train_img / img_file.name)
-                shutil.copy(label_file, output_train_lbl / label_file.name)
-                copied_count += 1
+    # Original training images are referenced, not copied
+    result = new_manifest(names)
+    result['splits']['train'] = list(labelled_entries)
     
-    print(f"Copied {copied_count} original training images")
+    print(f"Kept {len(labelled_entries)} original training images")
     
     # Create augmented versions
     augmented_count = 0
-    for class_id in range(len(CLASS_NAMES)):
+    base_images = OrderedDict()  # image path -> decoded BASE_SIZE base, least recently used first
+    aug_start = time.perf_counter()
+    for class_id in range(len(names)):
         current_count = class_counts.get(class_id, 0)
         if current_count == 0:
             print(f"Skipping Class {class_id} - no samples")
@@ -245,9 +248,9 @@ def balance_dataset():
         
         # Find images containing this class
         images_with_class = []
-        for img_name, classes in image_class_map.items():
+        for idx, classes in image_class_map.items():
             if class_id in classes:
-                images_with_class.append(img_name)
+                images_with_class.append(idx)
         
         if not images_with_class:
             print(f"Warning: No images found for Class {class_id}")
@@ -257,7 +260,8 @@ def balance_dataset():
         needed_augmentations = int(TARGET_SAMPLES_PER_CLASS - current_count)
         print(f"\nClass {class_id}: Creating {needed_augmentations} augmented samples...")
         
-        augment = get_augmentation_pipeline(class_id, current_count, TARGET_SAMPLES_PER_CLASS)
+        augment = get_augmentation_pipeline(class_id, current_count, TARGET_SAMPLES_PER_CLASS,
+                                            resize=not base_cache)
         
         created = 0
         attempts = 0
@@ -265,32 +269,28 @@ def balance_dataset():
         
         while created < needed_augmentations and attempts < max_attempts:
             attempts += 1
-            img_name = random.choice(images_with_class)
-            
-            # Find image file
-            img_file = None
-            for ext in ['.jpg', '.jpeg', '.png', '.JPG', '.JPEG', '.PNG']:
-                test_file = input_train_img / f"{img_name}{ext}"
-                if test_file.exists():
-                    img_file = test_file
-                    break
+            entry = train_entries[random.choice(images_with_class)]
+            img_file = Path(entry['image'])
+            img_name = img_file.stem
             
-            if not img_file:
-                continue
-            
-            label_file = input_train_lbl / f"{img_name}.txt"
-            if not label_file.exists():
-                continue
-            
-            # Read image
-            img = cv2.imread(str(img_file))
+            # Read image: each source is decoded once, later samples reuse the cached base
+            if not base_cache:
+                img = cv2.imread(str(img_file))
+            elif str(img_file) in base_images:
+                img = base_images[str(img_file)]
+                base_images.move_to_end(str(img_file))
+            else:
+                img = load_base_image(img_file)
+                base_images[str(img_file)] = img
+                if len(base_images) > BASE_CACHE_SIZE:
+                    base_images.popitem(last=False)
             if img is None:
                 continue
             
             img_height, img_width = img.shape[:2]
             
             # Read annotations
-            annotations = read_yolo_label(label_file, img_width, img_height)
+            annotations = yolo_boxes_to_annotations(read_boxes(entry), img_width, img_height)
             
             # Filter for this class
             class_annotations = [ann for ann in annotations if ann['class_id'] == class_id]
@@ -317,7 +317,7 @@ def balance_dataset():
                 
                 # Save augmented image
                 aug_img_name = f"{img_name}_aug{class_id}_{created:04d}.jpg"
-                cv2.imwrite(str(output_train_img / aug_img_name), augmented['image'])
+                cv2.imwrite(str(output_aug_img / aug_img_name), augmented['image'])
                 
                 # Combine annotations
                 all_annotations = []
@@ -334,12 +334,14 @@ def balance_dataset():
                     all_annotations.append(ann)
                 
                 # Write label
+                aug_label_file = output_aug_lbl / f"{aug_img_name[:-4]}.txt"
                 write_yolo_label(
-                    output_train_lbl / f"{aug_img_name[:-4]}.txt",
+                    aug_label_file,
                     all_annotations,
                     augmented['image'].shape[1],
                     augmented['image'].shape[0]
                 )
+                add_entry(result, 'train', output_aug_img / aug_img_name, label=aug_label_file)
                 
                 created += 1
                 augmented_count += 1
@@ -350,41 +352,33 @@ def balance_dataset():
             except Exception as e:
                 continue
     
+    aug_elapsed = time.perf_counter() - aug_start
+    if augmented_count:
+        print(f"\nAugmentation: {augmented_count} samples in {aug_elapsed:.1f}s "
+              f"({augmented_count / aug_elapsed:.1f} samples/s, "
+              f"{'cached ' + str(BASE_SIZE) + 'px bases' if base_cache else 'full-resolution decode'})")
+
     # ================== PROCESS VALIDATION SET ==================
     print("\n" + "="*50)
     print("Processing validation set...")
     
-    val_copied = 0
-    if input_val_img.exists() and input_val_lbl.exists():
-        for img_file in input_val_img.glob("*"):
-            if img_file.suffix.lower() in ['.jpg', '.jpeg', '.png', '.JPG', '.JPEG', '.PNG']:
-                label_file = input_val_lbl / f"{img_file.stem}.txt"
-                if label_file.exists():
-                    shutil.copy(img_file, output_val_img / img_file.name)
-                    shutil.copy(label_file, output_val_lbl / label_file.name)
-                    val_copied += 1
-        print(f"Copied {val_copied} validation images")
+    if val_entries:
+        result['splits']['val'] = [e for e in val_entries if 'boxes' in e or 'label' in e]
+        print(f"Kept {len(result['splits']['val'])} validation images")
     else:
-        print(f"Validation folder not found at: {input_val_img}")
+        print(f"Validation split not found in: {input_dir}")
         print("Will split training data for validation...")
-        val_copied = split_validation_set(OUTPUT_DIR, 0.2)
-        print(f"Created {val_copied} validation images from training split")
+        val_count = split_validation_set(result, 0.2)
+        print(f"Created {val_count} validation images from training split")
     
-    # ================== CREATE DATASET.YAML ==================
+    # ================== WRITE DATASET ==================
     print("\n" + "="*50)
-    print("Creating dataset.yaml...")
-    
-    dataset_yaml = {
-        'path': str(Path(OUTPUT_DIR).absolute()),
-        'train': 'train/images',
-        'val': 'val/images',
-        'names': {i: name for i, name in enumerate(CLASS_NAMES)},
-        'nc': len(CLASS_NAMES)
-    }
-    
-    yaml_path = Path(OUTPUT_DIR) / "dataset.yaml"
-    with open(yaml_path, 'w') as f:
-        yaml.dump(dataset_yaml, f, default_flow_style=False, sort_keys=False)
+    if virtual:
+        print("Writing manifest and dataset.yaml...")
+        yaml_path = save_virtual_dataset(result, output_dir, 'dataset.yaml')
+    else:
+        print("Placing images and creating dataset.yaml...")
+        yaml_path = materialize(result, output_dir, 'hardlink', yaml_name='dataset.yaml')
     
     print(f"Created {yaml_path}")
     
@@ -395,29 +389,21 @@ def balance_dataset():
     
     # Count new distribution
     new_class_counts = Counter()
-    for label_file in output_train_lbl.glob("*.txt"):
-        try:
-            with open(label_file, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        class_id = int(float(line.split()[0]))
-                        new_class_counts[class_id] += 1
-        except:
-            continue
+    for entry in result['splits']['train']:
+        new_class_counts.update(int(box[0]) for box in read_boxes(entry))
     
     print("\nNEW class distribution (training):")
     total_new = 0
     for class_id in sorted(new_class_counts.keys()):
         count = new_class_counts[class_id]
         total_new += count
-        if class_id < len(CLASS_NAMES):
-            print(f"  Class {class_id} ({CLASS_NAMES[class_id]}): {count} samples")
+        if class_id < len(names):
+            print(f"  Class {class_id} ({names[class_id]}): {count} samples")
         else:
             print(f"  Class {class_id} (Unknown): {count} samples")
     
-    train_images = len(list(output_train_img.glob("*")))
-    val_images = len(list(output_val_img.glob("*")))
+    train_images = len(result['splits']['train'])
+    val_images = len(result['splits'].get('val', []))
     
     print(f"\nTotal training images: {train_images}")
     print(f"Total validation images: {val_images}")
@@ -426,7 +412,7 @@ def balance_dataset():
     print(f"Augmentations created: {augmented_count}")
     
     # Save report
-    report_path = Path(OUTPUT_DIR) / "balancing_report.txt"
+    report_path = Path(output_dir) / "balancing_report.txt"
     with open(report_path, 'w') as f:
         f.write(f"EcoWheels Balancing Report - {datetime.now()}\n")
         f.write("="*50 + "\n\n")
@@ -443,25 +429,29 @@ def balance_dataset():
     
     print(f"\n📄 Report saved: {report_path}")
     print(f"\n✅ Dataset balancing completed!")
-    print(f"📁 Output: {OUTPUT_DIR}")
+    print(f"📁 Output: {output_dir}")
     
     return yaml_path
 
-if __name__ == "__main__":
+def main(argv=None):
     print("EcoWheels Dataset Balancer")
     print("="*40)
     
-    # Check dependencies
-    try:
-        import albumentations
-        import yaml
-        import cv2
-    except ImportError:
-        print("Installing dependencies...")
-        import subprocess
-        subprocess.check_call(['pip', 'install', 'albumentations', 'pyyaml', 'opencv-python'])
-    
-    yaml_path = balance_dataset()
+    parser = argparse.ArgumentParser(description='Balance classes through offline augmentation')
+    parser.add_argument('--input', default=INPUT_DIR, help='YOLO folder, manifest.json or folder holding one')
+    parser.add_argument('--output', default=OUTPUT_DIR, help='Output folder')
+    parser.add_argument('--virtual', action='store_true',
+                        help='Reference the original images from a manifest instead of copying them')
+    parser.add_argument('--full-decode', action='store_true',
+                        help='Decode the full-resolution source for every sample (slow, for comparison)')
+    parser.add_argument('--seed', type=int, help='Seed for sampling and augmentation (default: random)')
+    args = parser.parse_args(argv)
+    
+    if args.seed is not None:
+        random.seed(args.seed)
+        np.random.seed(args.seed)
+
+    yaml_path = balance_dataset(args.input, args.output, args.virtual, not args.full_decode)
     
     print("\n" + "="*50)
     print("NEXT STEPS:")
@@ -469,4 +459,7 @@ if __name__ == "__main__":
     print("1. Train the model:")
     print(f"   yolo detect train data={yaml_path} model=yolov8n.pt epochs=200")
     print("\n2. For better GPU (your friend's PC):")
-    print("   yolo detect train data=dataset.yaml model=yolov8x.pt epochs=300 batch=64")
\ No newline at end of file
+    print("   yolo detect train data=dataset.yaml model=yolov8x.pt epochs=300 batch=64")
+
+if __name__ == "__main__":
+    main()
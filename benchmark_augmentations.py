@@ -0,0 +1,173 @@
+# benchmark_augmentations.py
+# Throughput of the get_augmentation_pipeline() tiers and of every transform
+# in them, single-core and across worker processes, so slow tiers can be
+# spotted before they starve the training data loader.
+#
+#   python benchmark_augmentations.py
+#   python benchmark_augmentations.py --images data/train/images --sizes 640 1280 --workers 8
+import argparse
+import copy
+import csv
+import os
+import random
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from dataset_utils import IMAGE_EXTENSIONS
+
+# ========== CONFIGURATION ==========
+SIZES = [640, 1280]
+WORKERS = os.cpu_count() or 1
+ITERATIONS = 50
+REQUIRED_RATE = 50.0  # images/s the training loop consumes (batch / step time)
+# ===================================
+
+# (class_id, current_count, target_count) that select each tier of get_augmentation_pipeline()
+TIERS = {
+    'heavy': (0, 1, 10),
+    'moderate': (0, 1, 3),
+    'light': (0, 1, 1),
+}
+
+BOXES = [[0.1, 0.1, 0.4, 0.5], [0.5, 0.3, 0.9, 0.8], [0.3, 0.6, 0.5, 0.95]]
+
+
+def tier_pipeline(tier):
+    from balance_dataset import get_augmentation_pipeline
+    return get_augmentation_pipeline(*TIERS[tier])
+
+
+def single_transform(tier, index):
+    """Transform number index of a tier, alone and forced to always apply"""
+    import albumentations as A
+
+    pipeline = tier_pipeline(tier)
+    transform = copy.deepcopy(pipeline.transforms[index])
+    transform.p = 1.0
+    return A.Compose([transform], bbox_params=A.BboxParams(format='pascal_voc', label_fields=['class_labels']))
+
+
+def make_images(size, count=8, image_dir=None, seed=0):
+    """Synthetic (smooth noise) or real images with their long side resized to size"""
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    if image_dir is None:
+        images = []
+        for _ in range(count):
+            small = rng.integers(0, 256, (size // 16, size // 16, 3), dtype=np.uint8)
+            img = cv2.resize(small, (size, size * 3 // 4), interpolation=cv2.INTER_CUBIC)
+            images.append(cv2.add(img, rng.integers(0, 24, img.shape, dtype=np.uint8)))
+        return images
+
+    paths = sorted(p for p in Path(image_dir).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    random.Random(seed).shuffle(paths)
+    images = []
+    for path in paths[:count]:
+        img = cv2.imread(str(path))
+        if img is not None:
+            r = size / max(img.shape[:2])
+            images.append(cv2.resize(img, (round(img.shape[1] * r), round(img.shape[0] * r)),
+                                     interpolation=cv2.INTER_AREA))
+    return images
+
+
+def _time_pipeline(job):
+    """Images/s of one pipeline on one core; runs in a worker process"""
+    import cv2
+
+    # One thread per process, as in a DataLoader worker, so "1 core" really means one core
+    cv2.setNumThreads(1)
+    warnings.filterwarnings('ignore', category=UserWarning)
+
+    tier, index, size, image_dir, iterations, seed = job
+    pipeline = tier_pipeline(tier) if index is None else single_transform(tier, index)
+    images = make_images(size, image_dir=image_dir, seed=seed)
+
+    # Warm-up (lazy initialisation, caches)
+    for img in images[:2]:
+        h, w = img.shape[:2]
+        pipeline(image=img, bboxes=[[b[0] * w, b[1] * h, b[2] * w, b[3] * h] for b in BOXES],
+                 class_labels=[0] * len(BOXES))
+
+    start = time.perf_counter()
+    for k in range(iterations):
+        img = images[k % len(images)]
+        h, w = img.shape[:2]
+        pipeline(image=img, bboxes=[[b[0] * w, b[1] * h, b[2] * w, b[3] * h] for b in BOXES],
+                 class_labels=[0] * len(BOXES))
+    return iterations / (time.perf_counter() - start)
+
+
+def benchmark(sizes=SIZES, workers=WORKERS, iterations=ITERATIONS, image_dir=None,
+              required_rate=REQUIRED_RATE, per_transform=True):
+    """Rows of (source, size, tier, transform, p, single-core img/s, multi-process img/s)"""
+    warnings.filterwarnings('ignore', category=UserWarning)
+    source = 'real' if image_dir else 'synthetic'
+    rows = []
+
+    print(f"⏱️  Augmentation benchmark ({source} images, {iterations} iterations, {workers} workers)")
+    for size in sizes:
+        print(f"\n📐 {size}px")
+        print(f"  {'tier':<10}{'transform':<28}{'p':>5}{'1 core':>10}{f'{workers} proc':>10}")
+        for tier in TIERS:
+            pipeline = tier_pipeline(tier)
+            targets = [(None, 'ALL', 1.0)]
+            if per_transform:
+                targets += [(i, type(t).__name__, t.p) for i, t in enumerate(pipeline.transforms)]
+
+            for index, name, p in targets:
+                single = _time_pipeline((tier, index, size, image_dir, iterations, 0))
+                multi = single
+                if index is None and workers > 1:
+                    # Workers run concurrently (memory bandwidth and caches are shared);
+                    # pool start-up and imports stay outside the timed loops
+                    jobs = [(tier, None, size, image_dir, iterations, s) for s in range(workers)]
+                    with ProcessPoolExecutor(max_workers=workers) as pool:
+                        multi = sum(pool.map(_time_pipeline, jobs))
+
+                flag = ''
+                if index is None and multi < required_rate:
+                    flag = f"  ⚠️  below {required_rate:.0f} img/s: loader bottleneck"
+                print(f"  {tier:<10}{name:<28}{p:>5.1f}{single:>10.1f}"
+                      f"{(f'{multi:.1f}' if index is None else '-'):>10}{flag}")
+                rows.append((source, size, tier, name, p, round(single, 2),
+                             round(multi, 2) if index is None else ''))
+
+            # Expected cost per image = probability the transform fires x its cost when it does
+            if per_transform:
+                costs = [(row[4] * 1000 / row[5], row[3]) for row in rows[-len(targets) + 1:]]
+                ms, name = max(costs)
+                print(f"  {'':<10}→ dominated by {name} (~{ms:.1f} ms/img expected)")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the balance_dataset.py augmentation tiers')
+    parser.add_argument('--images', help='Folder of real images (default: synthetic images)')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='Input image sizes (long side)')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='Processes for the multi-process run')
+    parser.add_argument('--iterations', type=int, default=ITERATIONS, help='Images per measurement')
+    parser.add_argument('--required', type=float, default=REQUIRED_RATE,
+                        help='Images/s the training loop needs; slower tiers are flagged')
+    parser.add_argument('--tiers-only', action='store_true', help='Skip the per-transform measurements')
+    parser.add_argument('--report', help='Also write the results to this CSV file')
+    args = parser.parse_args()
+
+    rows = benchmark(args.sizes, args.workers, args.iterations, args.images, args.required,
+                     not args.tiers_only)
+
+    if args.report:
+        with open(args.report, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['source', 'size', 'tier', 'transform', 'p', 'single_core_ips', 'multi_process_ips'])
+            writer.writerows(rows)
+        print(f"\n📄 Report: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+# benchmark_models.py
+# Speed/accuracy sweep over model weights, imgsz and the CPU runtimes that are
+# installed (PyTorch, TorchScript, ONNX Runtime, OpenVINO, NCNN), to pick the
+# deployment configuration of the car from measurements.
+#
+# Every (model, imgsz, backend) point runs in a fresh process, so its peak RSS
+# is its own. Each point reports single-image p50/p95 latency (what the car
+# sees), batched throughput and mAP on the validation split (via evaluate.py,
+# replayed from the prediction cache for .pt weights). The results go to a
+# CSV table and a latency/mAP plot with the Pareto front highlighted.
+#
+#   python benchmark_models.py --weights runs/detect/train2/weights/best.pt yolo11n.pt --imgsz 320 416 640
+#   python benchmark_models.py --backends pytorch onnx --val-images 300
+import argparse
+import csv
+import importlib.util
+import multiprocessing
+import random
+import resource
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from evaluate import DATASET_PATH, WEIGHTS, load_split, predict_split, score
+from prediction_cache import CACHE_DIR, STORE_CONF, replay
+
+# ========== CONFIGURATION ==========
+IMGSZ = [320, 416, 640]
+RUNS = 50               # timed single-image predictions per point
+WARMUP = 5
+BATCH = 8               # batch size of the throughput measurement
+VAL_IMAGES = 500        # 0 = the whole split
+OUTPUT_DIR = Path("runs/benchmark")
+# ===================================
+
+# backend -> (Ultralytics export format or None for the .pt itself, modules it needs)
+BACKENDS = {
+    'pytorch': (None, ['torch']),
+    'torchscript': ('torchscript', ['torch']),
+    'onnx': ('onnx', ['onnx', 'onnxruntime']),
+    'openvino': ('openvino', ['openvino']),
+    'ncnn': ('ncnn', ['ncnn']),
+}
+# backend -> (export artifact glob, file the artifact folder must hold, or None for single-file exports)
+ARTIFACTS = {
+    'torchscript': ('*.torchscript', None),
+    'onnx': ('*.onnx', None),
+    'openvino': ('*_openvino_model', '*.xml'),
+    'ncnn': ('*_ncnn_model', 'model.ncnn.param'),
+}
+
+
+def available_backends():
+    if importlib.util.find_spec('ultralytics') is None:
+        return []
+    return [name for name, (_, modules) in BACKENDS.items()
+            if all(importlib.util.find_spec(m) is not None for m in modules)]
+
+
+def export_model(weights, backend, imgsz, out_dir=OUTPUT_DIR):
+    """Path of the weights exported for backend at imgsz (exports are kept and reused)"""
+    fmt = BACKENDS[backend][0]
+    if fmt is None:
+        return Path(weights)
+
+    target_dir = Path(out_dir) / 'exports' / f"{Path(weights).stem}_{imgsz}_{backend}"
+    pattern, inner = ARTIFACTS[backend]
+    for existing in sorted(target_dir.glob(pattern)) if target_dir.exists() else []:
+        if inner is None or (existing.is_dir() and any(existing.glob(inner))):
+            return existing
+
+    from ultralytics import YOLO
+    exported = Path(YOLO(weights).export(format=fmt, imgsz=imgsz, device='cpu', verbose=False))
+    target_dir.mkdir(parents=True, exist_ok=True)
+    # Ultralytics writes next to the weights; move it so other sizes don't overwrite it
+    target = target_dir / exported.name
+    shutil.move(str(exported), str(target))
+    return target
+
+
+def _measure_point(job):
+    """Latency, throughput, peak RSS and mAP of one exported model; runs in its own process"""
+    import cv2
+    from ultralytics import YOLO
+
+    model_path, imgsz, source, split, val_images, runs, batch, seed = job
+    names, records, _ = load_split(source, split)
+    if val_images and len(records) > val_images:
+        records = random.Random(seed).sample(records, val_images)
+
+    model = YOLO(str(model_path), task='detect')
+    images = [cv2.imread(r['image']) for r in records[:max(batch, 16)]]
+    images = [img for img in images if img is not None]
+
+    for img in images[:WARMUP]:
+        model.predict(img, imgsz=imgsz, device='cpu', verbose=False)
+
+    latencies = []
+    for k in range(runs):
+        start = time.perf_counter()
+        model.predict(images[k % len(images)], imgsz=imgsz, device='cpu', verbose=False)
+        latencies.append(time.perf_counter() - start)
+
+    # Exported models have a fixed batch dimension; only the .pt takes a real batch
+    chunk = images[:batch] if Path(model_path).suffix == '.pt' else images[:1]
+    start = time.perf_counter()
+    repeats = max(1, runs // len(chunk))
+    for _ in range(repeats):
+        model.predict(chunk, imgsz=imgsz, device='cpu', verbose=False)
+    throughput = repeats * len(chunk) / (time.perf_counter() - start)
+
+    cache_dir = CACHE_DIR if Path(model_path).is_file() and Path(model_path).suffix == '.pt' else None
+    predictions = predict_split(str(model_path), records, imgsz, batch=len(chunk), cache_dir=cache_dir)
+    predictions = [None if p is None else replay(p, STORE_CONF) for p in predictions]
+    metrics = score(names, records, predictions, imgsz=imgsz)
+
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / 1e6 if sys.platform == 'darwin' else rss / 1024
+    ms = np.array(latencies) * 1000
+    return {
+        'p50_ms': round(float(np.percentile(ms, 50)), 2), 'p95_ms': round(float(np.percentile(ms, 95)), 2),
+        'throughput_ips': round(throughput, 2), 'peak_rss_mb': round(rss_mb, 1),
+        'map50': round(metrics['map50'], 4), 'map50_95': round(metrics['map50_95'], 4), 'val_images': len(records),
+    }
+
+
+def pareto_front(rows, cost='p50_ms', gain='map50_95'):
+    """Rows no other row beats on both cost (lower) and gain (higher)"""
+    front = []
+    for row in rows:
+        dominated = any(o[cost] <= row[cost] and o[gain] >= row[gain] and (o[cost] < row[cost] or o[gain] > row[gain])
+                        for o in rows)
+        if not dominated:
+            front.append(row)
+    return front
+
+
+def plot(rows, front, path):
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("  ⚠️  matplotlib is not installed, skipping the plot")
+        return None
+
+    fig, ax = plt.subplots(figsize=(9, 6))
+    for backend in sorted({r['backend'] for r in rows}):
+        pts = [r for r in rows if r['backend'] == backend]
+        ax.scatter([r['p50_ms'] for r in pts], [r['map50_95'] for r in pts], label=backend, s=40)
+        for r in pts:
+            ax.annotate(f"{r['model']}@{r['imgsz']}", (r['p50_ms'], r['map50_95']), fontsize=7,
+                        xytext=(4, 4), textcoords='offset points')
+    front = sorted(front, key=lambda r: r['p50_ms'])
+    ax.plot([r['p50_ms'] for r in front], [r['map50_95'] for r in front], 'k--', lw=1, label='Pareto front')
+    ax.set_xlabel('p50 latency per image (ms, CPU)')
+    ax.set_ylabel('val mAP50-95')
+    ax.grid(alpha=0.3)
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path, dpi=150)
+    plt.close(fig)
+    return path
+
+
+def benchmark(weights_list, sizes=IMGSZ, backends=None, source=DATASET_PATH, split='val',
+              val_images=VAL_IMAGES, runs=RUNS, batch=BATCH, out_dir=OUTPUT_DIR, seed=0):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    installed = available_backends()
+    backends = backends or installed
+    missing = [b for b in backends if b not in installed]
+    if missing:
+        print(f"⚠️  Not installed, skipped: {', '.join(missing)}")
+    backends = [b for b in backends if b in installed]
+
+    print("=" * 60)
+    print("🏁 MODEL SPEED/ACCURACY BENCHMARK")
+    print("=" * 60)
+    print(f"{len(weights_list)} models x {len(sizes)} sizes x {len(backends)} backends ({', '.join(backends)})")
+
+    rows = []
+    # spawn: a clean interpreter per point, so peak RSS and runtime threads are not inherited
+    context = multiprocessing.get_context('spawn')
+    for weights in weights_list:
+        for imgsz in sizes:
+            for backend in backends:
+                label = f"{Path(weights).stem} @ {imgsz} / {backend}"
+                try:
+                    model_path = export_model(weights, backend, imgsz, out_dir)
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                        result = pool.submit(_measure_point, (model_path, imgsz, source, split, val_images,
+                                                              runs, batch, seed)).result()
+                except Exception as e:
+                    print(f"  ❌ {label}: {e}")
+                    continue
+                row = {'model': Path(weights).stem, 'imgsz': imgsz, 'backend': backend, **result}
+                rows.append(row)
+                print(f"  ✅ {label}: p50 {row['p50_ms']:.1f} ms, p95 {row['p95_ms']:.1f} ms, "
+                      f"{row['throughput_ips']:.1f} img/s, {row['peak_rss_mb']:.0f} MB, mAP50-95 {row['map50_95']:.3f}")
+
+    if not rows:
+        print("❌ No point could be measured")
+        return []
+
+    front = pareto_front(rows)
+    for row in rows:
+        row['pareto'] = row in front
+
+    print(f"\n{'model':<14}{'imgsz':>6}{'backend':>12}{'p50':>8}{'p95':>8}{'img/s':>8}{'RSS MB':>8}"
+          f"{'mAP50':>8}{'50-95':>8}")
+    for row in sorted(rows, key=lambda r: r['p50_ms']):
+        star = ' ★' if row['pareto'] else ''
+        print(f"{row['model'][:13]:<14}{row['imgsz']:>6}{row['backend']:>12}{row['p50_ms']:>8.1f}"
+              f"{row['p95_ms']:>8.1f}{row['throughput_ips']:>8.1f}{row['peak_rss_mb']:>8.0f}"
+              f"{row['map50']:>8.3f}{row['map50_95']:>8.3f}{star}")
+    print("  ★ = Pareto-optimal (no other point is both faster and more accurate)")
+
+    table = out_dir / 'pareto.csv'
+    with open(table, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"\n📄 Table: {table}")
+    figure = plot(rows, front, out_dir / 'pareto.png')
+    if figure:
+        print(f"📈 Plot: {figure}")
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Latency/throughput/memory/mAP sweep over models, sizes and runtimes')
+    parser.add_argument('--weights', nargs='+', default=[WEIGHTS], help='Model weights (.pt) to compare')
+    parser.add_argument('--imgsz', type=int, nargs='+', default=IMGSZ, help='Input sizes')
+    parser.add_argument('--backends', nargs='+', help=f"Runtimes (default: every installed one of {', '.join(BACKENDS)})")
+    parser.add_argument('--data', default=DATASET_PATH, help='Dataset folder or manifest for mAP')
+    parser.add_argument('--split', default='val', help='Split used for mAP')
+    parser.add_argument('--val-images', type=int, default=VAL_IMAGES, help='Images sampled for mAP (0 = all)')
+    parser.add_argument('--runs', type=int, default=RUNS, help='Timed single-image predictions per point')
+    parser.add_argument('--batch', type=int, default=BATCH, help='Batch size for the throughput measurement')
+    parser.add_argument('--output', type=Path, default=OUTPUT_DIR, help='Folder for exports, table and plot')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the validation sample')
+    args = parser.parse_args(argv)
+
+    unknown = set(args.backends or []) - set(BACKENDS)
+    if unknown:
+        parser.error(f"unknown backends: {', '.join(sorted(unknown))}")
+
+    benchmark(args.weights, args.imgsz, args.backends, args.data, args.split, args.val_images, args.runs,
+              args.batch, args.output, args.seed)
+
+
+if __name__ == "__main__":
+    main()
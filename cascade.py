@@ -0,0 +1,99 @@
+# cascade.py
+# Tune the gate of the two-stage detector in src/server.py.
+#
+# The gate is a cheap model (a nano detector at 256-320 px) that runs on every
+# camera frame; the full model only runs on frames where the gate's best
+# detection reaches GATE_CONF. This picks the highest GATE_CONF whose
+# image-level recall (images with litter that the gate lets through) on a
+# labelled split still meets the target, and writes it to the JSON config
+# the server reads. Gate detections come from evaluate.py's prediction
+# cache, so re-tuning for another target does not run the gate again.
+#
+#   python cascade.py --gate yolo11n_gate.pt --gate-imgsz 320 --recall 0.98
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+from evaluate import DATASET_PATH, load_split, predict_split
+from prediction_cache import CACHE_DIR
+
+# ========== CONFIGURATION ==========
+GATE_WEIGHTS = "runs/detect/gate/weights/best.pt"
+GATE_IMGSZ = 320
+RECALL_TARGET = 0.98
+CONFIG_PATH = Path("runs/cascade.json")   # read by src/server.py
+# ===================================
+
+
+def gate_scores(weights, records, imgsz=GATE_IMGSZ, cache_dir=CACHE_DIR):
+    """Highest gate confidence per image (0 when the gate finds nothing); NaN where the image is unreadable"""
+    predictions = predict_split(weights, records, imgsz, cache_dir=cache_dir)
+    return np.array([np.nan if p is None else (p[:, 4].max() if len(p) else 0.0) for p in predictions])
+
+
+def pick_threshold(scores, positive, recall_target=RECALL_TARGET):
+    """Highest threshold whose recall over positive images is at least recall_target"""
+    pos = np.sort(scores[positive])[::-1]
+    if not len(pos):
+        return 0.0
+    # Letting the k highest-scoring positives through needs threshold = their lowest score
+    k = int(np.ceil(recall_target * len(pos)))
+    return float(pos[max(k, 1) - 1])
+
+
+def tune_gate(weights=GATE_WEIGHTS, source=DATASET_PATH, split='val', imgsz=GATE_IMGSZ,
+              recall_target=RECALL_TARGET, config_path=CONFIG_PATH, cache_dir=CACHE_DIR):
+    _, records, _ = load_split(source, split)
+    print("=" * 60)
+    print(f"🚦 GATE TUNING ({weights} @ {imgsz}px, recall target {recall_target:.1%})")
+    print("=" * 60)
+
+    scores = gate_scores(weights, records, imgsz, cache_dir)
+    readable = ~np.isnan(scores)
+    scores = scores[readable]
+    positive = np.array([len(r['gt']) > 0 for r, ok in zip(records, readable) if ok], dtype=bool)
+    print(f"{len(scores):,} images: {positive.sum():,} with litter, {(~positive).sum():,} without")
+
+    threshold = pick_threshold(scores, positive, recall_target)
+    recall = (scores[positive] >= threshold).mean() if positive.any() else 1.0
+    passed = scores >= threshold
+
+    print(f"\n{'conf':>8}{'recall':>10}{'pass rate':>12}{'neg. pass':>12}")
+    for conf in sorted({0.05, 0.1, 0.2, 0.3, 0.5, round(threshold, 4)}):
+        r = (scores[positive] >= conf).mean() if positive.any() else 1.0
+        neg = (scores[~positive] >= conf).mean() if (~positive).any() else float('nan')
+        mark = '  ←' if conf == round(threshold, 4) else ''
+        print(f"{conf:>8.3f}{r:>10.3f}{(scores >= conf).mean():>12.3f}{neg:>12.3f}{mark}")
+
+    print(f"\n✅ GATE_CONF = {threshold:.4f}: recall {recall:.3f}, {passed.mean():.1%} of these images reach the full model")
+    if not (~positive).any():
+        print("  ⚠️  The split has no empty images, so the pass rate on a patrol (mostly empty frames) "
+              "will be lower than this; add background frames to measure it")
+
+    config = {'gate_weights': str(weights), 'gate_imgsz': imgsz, 'gate_conf': round(threshold, 4),
+              'recall_target': recall_target, 'recall': round(float(recall), 4), 'split': f"{source}:{split}"}
+    config_path = Path(config_path)
+    config_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(config_path, 'w') as f:
+        json.dump(config, f, indent=2)
+    print(f"📄 Config: {config_path}")
+    return config
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tune the cascade gate threshold against a recall target')
+    parser.add_argument('--gate', default=GATE_WEIGHTS, help='Gate model weights (.pt)')
+    parser.add_argument('--gate-imgsz', type=int, default=GATE_IMGSZ, help='Gate input size')
+    parser.add_argument('--recall', type=float, default=RECALL_TARGET, help='Image-level recall the gate must keep')
+    parser.add_argument('--data', default=DATASET_PATH, help='Labelled dataset folder or manifest')
+    parser.add_argument('--split', default='val', help='Split to tune on')
+    parser.add_argument('--config', type=Path, default=CONFIG_PATH, help='Where the server reads the gate settings')
+    args = parser.parse_args(argv)
+
+    tune_gate(args.gate, args.data, args.split, args.gate_imgsz, args.recall, args.config)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,87 +1,200 @@
 # simple_coco_yolo.py
+import argparse
 import json
-import shutil
+import os
+import sys
 import yaml
-import random
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter
 from pathlib import Path
 
-# Config
-dataset = Path("/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/Org_dataset")
-output = Path("/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/yolo_taco")
+from dataset_manifest import add_entry, format_label_text, new_manifest, save_virtual_dataset
+from dataset_utils import LINK_MODES, assign_split, is_up_to_date, link_file
 
-print("🚀 Simple COCO to YOLO Converter")
+# ========== CONFIGURATION ==========
+DATASET_PATH = Path("/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/Org_dataset")
+OUTPUT_PATH = Path("/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/yolo_taco")
+SPLIT_RATIOS = {'train': 0.7, 'val': 0.2, 'test': 0.1}
+LINK_MODE = 'hardlink'  # hardlink, reflink, symlink or copy
+WORKERS = min(32, (os.cpu_count() or 1) * 4)
+SEED = 0
+# ===================================
 
-# Find annotations file
-ann_files = list(dataset.glob("*.json"))
-if not ann_files:
-    print("❌ No JSON files found!")
-    exit()
 
-ann_file = ann_files[0]
-print(f"📄 Using: {ann_file.name}")
+def find_source_image(dataset, filename):
+    """Images live in batch folders: batch_X_name.jpg -> batch_X/batch_X_name.jpg"""
+    if '_' in filename:
+        parts = filename.split('_')
+        if len(parts) >= 3:
+            return dataset / f"batch_{parts[1]}" / filename
+    return None
 
-# Load data
-with open(ann_file) as f:
-    data = json.load(f)
 
-print(f"📊 Found: {len(data['images'])} images, {len(data['annotations'])} annotations")
+def coco_boxes(img, anns, cat_map):
+    """COCO annotations of one image -> list of YOLO [class_id, xc, yc, w, h]"""
+    w_img, h_img = img['width'], img['height']
+    boxes = []
+    for ann in anns:
+        x, y, w, h = ann['bbox']
+        xc = (x + w/2) / w_img
+        yc = (y + h/2) / h_img
+        wn = w / w_img
+        hn = h / h_img
+        boxes.append([cat_map[ann['category_id']], xc, yc, wn, hn])
+    return boxes
 
-# Create mapping
-cats = sorted(data['categories'], key=lambda x: x['id'])
-cat_map = {c['id']: i for i, c in enumerate(cats)}
 
-# Create directories
-for split in ['train', 'val', 'test']:
-    (output / split / 'images').mkdir(parents=True, exist_ok=True)
-    (output / split / 'labels').mkdir(parents=True, exist_ok=True)
+def export_image(job, output, splits, link_mode, ann_mtime, force=False):
+    """Link one image and write its label; returns how the image was handled"""
+    src, split, boxes = job
+    filename = src.name
+    label_name = f"{src.stem}.txt"
 
-# Group annotations
-anns_by_img = {}
-for ann in data['annotations']:
-    anns_by_img.setdefault(ann['image_id'], []).append(ann)
+    # Drop outputs left in other splits (e.g. after changing SPLIT_RATIOS)
+    for other in splits:
+        if other != split:
+            for stale in (output / other / 'images' / filename, output / other / 'labels' / label_name):
+                if stale.is_symlink() or stale.exists():
+                    stale.unlink()
 
-# Process each image
-for img in data['images']:
-    filename = img['file_name']
-    
-    # Find image in batch folder
-    if '_' in filename:
-        parts = filename.split('_')
-        if len(parts) >= 3:
-            batch = f"batch_{parts[1]}"
-            src = dataset / batch / filename
-            
-            if src.exists():
-                # Choose split
-                r = random.random()
-                split = 'train' if r < 0.7 else 'val' if r < 0.9 else 'test'
-                
-                # Copy image
-                shutil.copy2(src, output / split / 'images' / filename)
-                
-                # Create label if annotations exist
-                if img['id'] in anns_by_img:
-                    label_file = output / split / 'labels' / f"{Path(filename).stem}.txt"
-                    with open(label_file, 'w') as f:
-                        for ann in anns_by_img[img['id']]:
-                            x, y, w, h = ann['bbox']
-                            xc = (x + w/2) / img['width']
-                            yc = (y + h/2) / img['height']
-                            wn = w / img['width']
-                            hn = h / img['height']
-                            cls = cat_map[ann['category_id']]
-                            f.write(f"{cls} {xc:.6f} {yc:.6f} {wn:.6f} {hn:.6f}\n")
-
-# Create data.yaml
-with open(output / "data.yaml", 'w') as f:
-    yaml.dump({
+    dst = output / split / 'images' / filename
+    if not force and is_up_to_date(src, dst):
+        status = 'skipped'
+    else:
+        status = link_file(src, dst, link_mode)
+
+    label_file = output / split / 'labels' / label_name
+    if boxes is None:
+        if label_file.exists():
+            label_file.unlink()
+    elif force or not label_file.exists() or label_file.stat().st_mtime < ann_mtime:
+        label_file.write_text(format_label_text(boxes))
+
+    return status
+
+
+def convert(dataset=DATASET_PATH, output=OUTPUT_PATH, split_ratios=SPLIT_RATIOS,
+            link_mode=LINK_MODE, workers=WORKERS, seed=SEED, force=False, virtual=False, ann_file=None):
+    """Convert the COCO annotations in dataset into a YOLO dataset at output.
+
+    With virtual=True no images are placed: output only receives a manifest
+    referencing the batch folders plus Ultralytics list files.
+    """
+
+    print("🚀 Simple COCO to YOLO Converter")
+
+    # Find annotations file
+    if ann_file is None:
+        ann_files = sorted(dataset.glob("*.json"))
+        if not ann_files:
+            print("❌ No JSON files found!")
+            return None
+        ann_file = ann_files[0]
+    ann_file = Path(ann_file)
+    print(f"📄 Using: {ann_file.name}")
+
+    # Load data
+    with open(ann_file) as f:
+        data = json.load(f)
+
+    print(f"📊 Found: {len(data['images'])} images, {len(data['annotations'])} annotations")
+
+    # Create mapping
+    cats = sorted(data['categories'], key=lambda x: x['id'])
+    cat_map = {c['id']: i for i, c in enumerate(cats)}
+
+    splits = list(split_ratios)
+
+    # Group annotations
+    anns_by_img = {}
+    for ann in data['annotations']:
+        anns_by_img.setdefault(ann['image_id'], []).append(ann)
+
+    # Plan every image up front: source, split and label contents
+    jobs = []
+    missing = 0
+    for img in data['images']:
+        filename = img['file_name']
+        src = find_source_image(dataset, filename)
+        if src is None or not src.exists():
+            missing += 1
+            continue
+
+        split = assign_split(filename, split_ratios, seed)
+        boxes = None
+        if img['id'] in anns_by_img:
+            boxes = coco_boxes(img, anns_by_img[img['id']], cat_map)
+        jobs.append((src, split, boxes))
+
+    split_counts = Counter(split for _, split, _ in jobs)
+    print(f"📊 Split sizes: " + ", ".join(f"{s}={split_counts[s]}" for s in splits))
+    if missing:
+        print(f"⚠️  {missing} images listed in annotations were not found on disk")
+
+    if virtual:
+        manifest = new_manifest([c['name'] for c in cats])
+        for src, split, boxes in jobs:
+            add_entry(manifest, split, src, boxes=boxes)
+        yaml_path = save_virtual_dataset(manifest, output)
+        print(f"\n✅ Done! Virtual YOLO dataset at: {output} (no images copied)")
+        print(f"🎯 Train with: yolo train data={yaml_path} model=yolov8s.pt epochs=100")
+        return output
+
+    # Create directories
+    for split in splits:
+        (output / split / 'images').mkdir(parents=True, exist_ok=True)
+        (output / split / 'labels').mkdir(parents=True, exist_ok=True)
+
+    print(f"🔗 Exporting {len(jobs)} images ({link_mode}, {workers} workers)...")
+
+    ann_mtime = ann_file.stat().st_mtime
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        statuses = list(pool.map(
+            lambda job: export_image(job, output, splits, link_mode, ann_mtime, force), jobs))
+
+    status_counts = Counter(statuses)
+
+    # Create data.yaml
+    data_yaml = {
         'path': str(output.absolute()),
-        'train': 'train/images',
-        'val': 'val/images',
-        'test': 'test/images',
         'nc': len(cats),
         'names': [c['name'] for c in cats]
-    }, f)
+    }
+    for split in splits:
+        data_yaml[split] = f"{split}/images"
+
+    with open(output / "data.yaml", 'w') as f:
+        yaml.dump(data_yaml, f)
+
+    print(f"\n📦 Images: " + ", ".join(f"{mode}={count}" for mode, count in sorted(status_counts.items())))
+
+    print(f"\n✅ Done! YOLO dataset at: {output}")
+    print(f"🎯 Train with: yolo train data={output}/data.yaml model=yolov8s.pt epochs=100")
+
+    return output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert the TACO COCO annotations to a YOLO dataset')
+    parser.add_argument('--dataset', type=Path, default=DATASET_PATH,
+                        help='Folder with the COCO json and batch_X image folders')
+    parser.add_argument('--output', type=Path, default=OUTPUT_PATH, help='YOLO dataset output folder')
+    parser.add_argument('--link-mode', choices=LINK_MODES, default=LINK_MODE,
+                        help='How images are placed in the output (falls back to copy)')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='Export threads')
+    parser.add_argument('--seed', type=int, default=SEED, help='Seed for the hash-based split assignment')
+    parser.add_argument('--force', action='store_true', help='Re-export images that are already up to date')
+    parser.add_argument('--virtual', action='store_true',
+                        help='Only write a manifest + list files that reference the original images')
+    parser.add_argument('--annotations', type=Path,
+                        help='COCO json to convert (default: the first *.json in --dataset)')
+    args = parser.parse_args(argv)
+
+    output = convert(args.dataset, args.output, SPLIT_RATIOS, args.link_mode, args.workers, args.seed,
+                     args.force, args.virtual, args.annotations)
+    if output is None:
+        sys.exit(1)
+
 
-print(f"\n✅ Done! YOLO dataset at: {output}")
-print(f"🎯 Train with: yolo train data={output}/data.yaml model=yolov8s.pt epochs=100")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
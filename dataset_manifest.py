@@ -0,0 +1,285 @@
+# dataset_manifest.py
+# Virtual datasets: each pipeline stage reads and writes a manifest instead of
+# a full physical copy of the images.
+#
+# A manifest is a JSON file:
+#   {
+#     "format": "ecowheels-manifest", "version": 1,
+#     "names": ["Plastic", "Glass", ...],
+#     "splits": {
+#       "train": [
+#         {"image": "/abs/path/img.jpg", "label": "/abs/path/img.txt"},   # label file reference
+#         {"image": "/abs/path/img2.jpg", "boxes": [[0, xc, yc, w, h]]},   # label override
+#         {"image": "/abs/path/bg.jpg"}                                    # background image
+#       ],
+#       "val": [...]
+#     }
+#   }
+#
+# Images are always referenced, never copied. write_yolo_lists() turns a
+# manifest into list files + data.yaml that Ultralytics reads directly, and
+# materialize() is the only step that writes image files.
+import argparse
+import json
+import os
+import yaml
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from dataset_utils import IMAGE_EXTENSIONS, LINK_MODES, link_file
+
+MANIFEST_FORMAT = 'ecowheels-manifest'
+MANIFEST_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+
+def new_manifest(names):
+    return {'format': MANIFEST_FORMAT, 'version': MANIFEST_VERSION, 'names': list(names), 'splits': {}}
+
+
+def add_entry(manifest, split, image, label=None, boxes=None):
+    """Append an image to a split; boxes (if given) override the label file"""
+    entry = {'image': str(Path(image).absolute())}
+    if boxes is not None:
+        entry['boxes'] = [list(box) for box in boxes]
+    elif label is not None:
+        entry['label'] = str(Path(label).absolute())
+    manifest['splits'].setdefault(split, []).append(entry)
+    return entry
+
+
+def load_manifest(path):
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != MANIFEST_FORMAT:
+        raise ValueError(f"{path} is not a dataset manifest")
+    if manifest.get('version', 0) > MANIFEST_VERSION:
+        raise ValueError(f"{path} uses manifest version {manifest['version']}, "
+                         f"this tool only understands up to {MANIFEST_VERSION}")
+    return manifest
+
+
+def save_manifest(manifest, path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)
+    return path
+
+
+def sibling_label_path(image):
+    """Where Ultralytics looks for the label of an image (.../images/x.jpg -> .../labels/x.txt)"""
+    image = str(image)
+    sa, sb = f"{os.sep}images{os.sep}", f"{os.sep}labels{os.sep}"
+    if sa not in image:
+        return None
+    return Path(sb.join(image.rsplit(sa, 1)).rsplit('.', 1)[0] + '.txt')
+
+
+def parse_label_text(text):
+    """YOLO label text -> list of [class_id, xc, yc, w, h]"""
+    boxes = []
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) >= 5:
+            boxes.append([int(float(parts[0]))] + [float(p) for p in parts[1:5]])
+    return boxes
+
+
+def format_label_text(boxes):
+    return ''.join(f"{int(b[0])} {b[1]:.6f} {b[2]:.6f} {b[3]:.6f} {b[4]:.6f}\n" for b in boxes)
+
+
+def read_boxes(entry):
+    """Boxes of a manifest entry, from its override or its label file"""
+    if 'boxes' in entry:
+        return entry['boxes']
+    if 'label' in entry:
+        try:
+            return parse_label_text(Path(entry['label']).read_text())
+        except OSError:
+            return []
+    return []
+
+
+def manifest_from_yolo_dir(root, names=None):
+    """Describe an existing YOLO dataset folder (split/images + split/labels) as a manifest"""
+    root = Path(root)
+    if names is None:
+        for yaml_name in ['data.yaml', 'dataset.yaml']:
+            if (root / yaml_name).exists():
+                with open(root / yaml_name) as f:
+                    names = yaml.safe_load(f).get('names', [])
+                if isinstance(names, dict):
+                    names = [names[k] for k in sorted(names)]
+                break
+    manifest = new_manifest(names or [])
+
+    for split_dir in sorted(p for p in root.iterdir() if (p / 'images').is_dir()):
+        labels = {}
+        if (split_dir / 'labels').is_dir():
+            labels = {e.name[:-4]: e.path for e in os.scandir(split_dir / 'labels') if e.name.endswith('.txt')}
+        for e in sorted(os.scandir(split_dir / 'images'), key=lambda e: e.name):
+            stem, ext = os.path.splitext(e.name)
+            if ext.lower() in IMAGE_EXTENSIONS:
+                add_entry(manifest, split_dir.name, e.path, label=labels.get(stem))
+    return manifest
+
+
+def load_dataset(source):
+    """Accept either a manifest file, a folder holding manifest.json, or a plain YOLO folder"""
+    source = Path(source)
+    if source.is_file():
+        return load_manifest(source)
+    if (source / MANIFEST_NAME).exists():
+        return load_manifest(source / MANIFEST_NAME)
+    return manifest_from_yolo_dir(source)
+
+
+def unique_names(entries):
+    """Output file names for entries, disambiguating images that share a name"""
+    seen = {}
+    names = []
+    for entry in entries:
+        name = Path(entry['image']).name
+        if name in seen:
+            seen[name] += 1
+            stem, ext = os.path.splitext(name)
+            name = f"{stem}__{seen[name]}{ext}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def write_yolo_lists(manifest, out_dir, yaml_name='data.yaml'):
+    """Write <split>.txt image lists and data.yaml for Ultralytics, without copying images.
+
+    Entries whose label file already sits where Ultralytics expects it are
+    listed by their original path. Entries with label overrides (or labels
+    elsewhere) get a symlink under out_dir/<split>/images and their label
+    written next to it in out_dir/<split>/labels.
+    """
+    out_dir = Path(out_dir)
+    data_yaml = {'path': str(out_dir.absolute())}
+
+    for split, entries in manifest['splits'].items():
+        img_dir = out_dir / split / 'images'
+        lbl_dir = out_dir / split / 'labels'
+        listed = []
+        for entry, name in zip(entries, unique_names(entries)):
+            image = Path(entry['image'])
+            label = entry.get('label')
+            if 'boxes' not in entry and (label is None or sibling_label_path(image) == Path(label)):
+                listed.append(str(image))
+                continue
+
+            img_dir.mkdir(parents=True, exist_ok=True)
+            lbl_dir.mkdir(parents=True, exist_ok=True)
+            link = img_dir / name
+            if not (link.is_symlink() and os.readlink(link) == str(image)):
+                link_file(image, link, 'symlink')
+            (lbl_dir / f"{Path(name).stem}.txt").write_text(format_label_text(read_boxes(entry)))
+            listed.append(str(link.absolute()))
+
+        list_file = out_dir / f"{split}.txt"
+        list_file.parent.mkdir(parents=True, exist_ok=True)
+        list_file.write_text('\n'.join(listed) + '\n')
+        data_yaml[split] = list_file.name
+
+    data_yaml['nc'] = len(manifest['names'])
+    data_yaml['names'] = manifest['names']
+
+    yaml_path = out_dir / yaml_name
+    with open(yaml_path, 'w') as f:
+        yaml.dump(data_yaml, f, default_flow_style=False, sort_keys=False)
+    return yaml_path
+
+
+def save_virtual_dataset(manifest, out_dir, yaml_name='data.yaml'):
+    """Write manifest.json plus the Ultralytics list files for a stage's output"""
+    save_manifest(manifest, Path(out_dir) / MANIFEST_NAME)
+    return write_yolo_lists(manifest, out_dir, yaml_name)
+
+
+def materialize(manifest, out_dir, link_mode='copy', workers=8, yaml_name='data.yaml'):
+    """Write a regular split/images + split/labels folder tree from a manifest"""
+    out_dir = Path(out_dir)
+
+    def place(job):
+        split, entry, name = job
+        image_file = out_dir / split / 'images' / name
+        label_file = out_dir / split / 'labels' / f"{Path(name).stem}.txt"
+        # Files a stage already wrote into out_dir (e.g. augmentations) stay where they are
+        if Path(entry['image']).absolute() != image_file.absolute():
+            link_file(entry['image'], image_file, link_mode)
+        if 'boxes' in entry:
+            label_file.write_text(format_label_text(entry['boxes']))
+        elif 'label' in entry and Path(entry['label']).absolute() != label_file.absolute():
+            if Path(entry['label']).exists():
+                link_file(entry['label'], label_file, link_mode)
+
+    jobs = []
+    for split, entries in manifest['splits'].items():
+        (out_dir / split / 'images').mkdir(parents=True, exist_ok=True)
+        (out_dir / split / 'labels').mkdir(parents=True, exist_ok=True)
+        jobs.extend((split, entry, name) for entry, name in zip(entries, unique_names(entries)))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(place, jobs))
+
+    data_yaml = {'path': str(out_dir.absolute())}
+    for split in manifest['splits']:
+        data_yaml[split] = f"{split}/images"
+    data_yaml['nc'] = len(manifest['names'])
+    data_yaml['names'] = manifest['names']
+
+    yaml_path = out_dir / yaml_name
+    with open(yaml_path, 'w') as f:
+        yaml.dump(data_yaml, f, default_flow_style=False, sort_keys=False)
+    return yaml_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect, export and materialize dataset manifests')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('from-dir', help='Create a manifest from an existing YOLO folder')
+    p.add_argument('dataset', help='YOLO dataset folder (split/images, split/labels)')
+    p.add_argument('output', help='Folder for manifest.json and the list files')
+
+    p = sub.add_parser('lists', help='Write Ultralytics list files + data.yaml for a manifest')
+    p.add_argument('manifest')
+    p.add_argument('output')
+
+    p = sub.add_parser('materialize', help='Write real image/label folders from a manifest')
+    p.add_argument('manifest')
+    p.add_argument('output')
+    p.add_argument('--link-mode', choices=LINK_MODES, default='copy')
+    p.add_argument('--workers', type=int, default=8)
+
+    p = sub.add_parser('info', help='Print split sizes of a manifest')
+    p.add_argument('manifest')
+
+    args = parser.parse_args()
+
+    if args.command == 'from-dir':
+        manifest = manifest_from_yolo_dir(args.dataset)
+        print(f"✅ Wrote {save_virtual_dataset(manifest, args.output)}")
+    elif args.command == 'lists':
+        print(f"✅ Wrote {write_yolo_lists(load_dataset(args.manifest), args.output)}")
+    elif args.command == 'materialize':
+        yaml_path = materialize(load_dataset(args.manifest), args.output, args.link_mode, args.workers)
+        print(f"✅ Materialized dataset: {yaml_path}")
+    elif args.command == 'info':
+        manifest = load_dataset(args.manifest)
+        print(f"Classes: {len(manifest['names'])}")
+        for split, entries in manifest['splits'].items():
+            overrides = sum(1 for e in entries if 'boxes' in e)
+            print(f"  {split}: {len(entries)} images ({overrides} with label overrides)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# dataset_utils.py
+# Shared helpers for the dataset preparation scripts
+import hashlib
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png']
+LINK_MODES = ['hardlink', 'reflink', 'symlink', 'copy']
+
+# ioctl request number for FICLONE on Linux (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    """Clone src into dst sharing data blocks (copy-on-write filesystems only)"""
+    import fcntl
+
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.unlink(dst)
+            raise
+
+
+def link_file(src, dst, mode='hardlink'):
+    """Place src at dst using the requested link mode, falling back to a copy.
+
+    Returns the mode that was actually used ('hardlink', 'reflink',
+    'symlink' or 'copy'). An existing dst is replaced.
+    """
+    if mode not in LINK_MODES:
+        raise ValueError(f"Unknown link mode '{mode}', expected one of {LINK_MODES}")
+
+    src, dst = Path(src), Path(dst)
+    if dst.is_symlink() or dst.exists():
+        dst.unlink()
+
+    try:
+        if mode == 'hardlink':
+            os.link(src, dst)
+            return 'hardlink'
+        if mode == 'reflink':
+            _reflink(src, dst)
+            shutil.copystat(src, dst)
+            return 'reflink'
+        if mode == 'symlink':
+            dst.symlink_to(src.absolute())
+            return 'symlink'
+    except (OSError, ImportError):
+        # Cross-device links, filesystems without reflink support, Windows...
+        pass
+
+    shutil.copy2(src, dst)
+    return 'copy'
+
+
+def is_up_to_date(src, dst):
+    """True if dst already holds the current version of src"""
+    src, dst = Path(src), Path(dst)
+    try:
+        if dst.is_symlink():
+            return dst.resolve() == src.resolve()
+        dst_stat = dst.stat()
+    except OSError:
+        return False
+
+    src_stat = src.stat()
+    if dst_stat.st_ino == src_stat.st_ino and dst_stat.st_dev == src_stat.st_dev:
+        return True
+    return dst_stat.st_size == src_stat.st_size and dst_stat.st_mtime >= src_stat.st_mtime
+
+
+def hash_fraction(key, seed=0):
+    """Map a string to a stable float in [0, 1) that does not depend on PYTHONHASHSEED"""
+    digest = hashlib.blake2b(f"{seed}:{key}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') / 2 ** 64
+
+
+def assign_split(key, ratios, seed=0):
+    """Pick a split name for key from an ordered {split: ratio} mapping.
+
+    The choice only depends on key and seed, so re-running a conversion puts
+    every image back in the same split and new images do not reshuffle old ones.
+    """
+    r = hash_fraction(key, seed) * sum(ratios.values())
+    cumulative = 0.0
+    for split, ratio in ratios.items():
+        cumulative += ratio
+        if r < cumulative:
+            return split
+    return split
+
+
+def file_hash(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class HashCache:
+    """Content hashes of files, reused while (size, mtime) is unchanged"""
+
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+
+    def hashes(self, paths, workers=16):
+        todo = []
+        result = {}
+        for path in paths:
+            st = os.stat(path)
+            key = f"{st.st_size}:{st.st_mtime_ns}"
+            cached = self.entries.get(path)
+            if cached and cached[0] == key:
+                result[path] = cached[1]
+            else:
+                todo.append((path, key))
+
+        if todo:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for (path, key), digest in zip(todo, pool.map(lambda job: file_hash(job[0]), todo)):
+                    self.entries[path] = [key, digest]
+                    result[path] = digest
+        return result, len(todo)
+
+
+def box_iou(a, b):
+    """IoU matrix between (N, 4) and (M, 4) xyxy boxes"""
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(br - tl, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
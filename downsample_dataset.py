@@ -1,179 +1,171 @@
-import os
+import argparse
+import heapq
 import random
-import shutil
+import time
 from pathlib import Path
 from collections import Counter
-import yaml
+
+from dataset_manifest import (load_dataset, materialize, new_manifest, read_boxes,
+                              save_virtual_dataset)
 
 INPUT_DIR = "/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/balanced_data"
 OUTPUT_DIR = "/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/balanced_final"
 TARGET_PER_CLASS = 800  # Target images per class
+CLASS_NAMES = ["Cardboard", "Glass", "Metal", "Mixed Waste", "Organic Waste", "Paper", "Plastic", "Textiles"]
 
-print("Starting downsampling...")
-print(f"Input: {INPUT_DIR}")
-print(f"Output: {OUTPUT_DIR}")
-print(f"Target: {TARGET_PER_CLASS} images per class\n")
-
-# Create output directories
-output_train_img = Path(OUTPUT_DIR) / "train" / "images"
-output_train_lbl = Path(OUTPUT_DIR) / "train" / "labels"
-output_val_img = Path(OUTPUT_DIR) / "val" / "images"
-output_val_lbl = Path(OUTPUT_DIR) / "val" / "labels"
-
-for d in [output_train_img, output_train_lbl, output_val_img, output_val_lbl]:
-    d.mkdir(parents=True, exist_ok=True)
-
-# ====== 1. COPY VALIDATION SET (UNCHANGED) ======
-print("Copying validation set...")
-val_img_src = Path(INPUT_DIR) / "val" / "images"
-val_lbl_src = Path(INPUT_DIR) / "val" / "labels"
-
-if val_img_src.exists() and val_lbl_src.exists():
-    val_copied = 0
-    for img_file in val_img_src.glob("*"):
-        if img_file.suffix.lower() in ['.jpg', '.jpeg', '.png']:
-            label_file = val_lbl_src / f"{img_file.stem}.txt"
-            if label_file.exists():
-                shutil.copy(img_file, output_val_img / img_file.name)
-                shutil.copy(label_file, output_val_lbl / label_file.name)
-                val_copied += 1
-    print(f"  Copied {val_copied} validation images")
-else:
-    print("  WARNING: Validation folder not found!")
-
-# ====== 2. ANALYZE TRAINING DISTRIBUTION ======
-print("\nAnalyzing current distribution...")
-train_img_src = Path(INPUT_DIR) / "train" / "images"
-train_lbl_src = Path(INPUT_DIR) / "train" / "labels"
-
-# Count IMAGES (not annotations) per class
-class_image_counts = Counter()
-image_class_map = {}  # filename -> set of classes
-
-image_files = list(train_img_src.glob("*"))
-print(f"Found {len(image_files)} training images")
-
-for img_file in image_files:
-    if img_file.suffix.lower() in ['.jpg', '.jpeg', '.png']:
-        label_file = train_lbl_src / f"{img_file.stem}.txt"
-        
-        if not label_file.exists():
-            continue
-        
-        # Read classes in this image
-        classes_in_image = set()
-        try:
-            with open(label_file, 'r') as f:
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        class_id = int(float(line.split()[0]))
-                        classes_in_image.add(class_id)
-        except:
+
+def image_class_sets(entries):
+    """Classes present in each labelled entry; unlabelled entries are dropped"""
+    class_sets = []
+    for entry in entries:
+        if 'boxes' not in entry and 'label' not in entry:
             continue
-        
+        classes_in_image = {int(box[0]) for box in read_boxes(entry)}
         if classes_in_image:
-            image_class_map[img_file.stem] = classes_in_image
-            for class_id in classes_in_image:
-                class_image_counts[class_id] += 1
-
-print("\nCurrent IMAGE distribution per class:")
-for class_id in sorted(class_image_counts.keys()):
-    count = class_image_counts[class_id]
-    print(f"  Class {class_id}: {count} images")
-
-# ====== 3. CALCULATE KEEP PROBABILITIES ======
-print("\nCalculating keep probabilities...")
-keep_probabilities = {}
-for class_id in class_image_counts:
-    current = class_image_counts[class_id]
-    if current > TARGET_PER_CLASS:
-        prob = TARGET_PER_CLASS / current
-        keep_probabilities[class_id] = prob
-        print(f"  Class {class_id}: {current} → {TARGET_PER_CLASS} (keep {prob:.1%})")
-    else:
-        keep_probabilities[class_id] = 1.0
-        print(f"  Class {class_id}: {current} → {current} (keep 100%)")
+            class_sets.append((entry, classes_in_image))
+    return class_sets
 
-# ====== 4. DOWNSAMPLE TRAINING SET ======
-print("\nDownsampling training set...")
-images_kept = 0
-images_skipped = 0
 
-for img_file in train_img_src.glob("*"):
-    if img_file.suffix.lower() in ['.jpg', '.jpeg', '.png']:
-        label_file = train_lbl_src / f"{img_file.stem}.txt"
+def select_subset(class_sets, targets, seed=0):
+    """Pick a subset of images whose per-class image counts are close to targets.
+
+    class_sets is the per-image list of class sets (a sparse image x class
+    matrix). Starting from all images, the image whose removal reduces
+    sum_c |count_c - target_c| the most is dropped until no removal helps.
+    Removing an image only ever lowers the gain of the others, so a lazy
+    max-heap of gains gives the exact greedy order without rescoring
+    everything after each step. Ties are broken by a seeded random key.
+
+    Returns (keep, counts): a boolean keep flag per image and the achieved
+    Counter of images per class.
+    """
+    rng = random.Random(seed)
+    class_sets = [tuple(classes) for classes in class_sets]
+
+    counts = Counter()
+    for classes in class_sets:
+        counts.update(classes)
+
+    def gain(classes):
+        # +1 for every class still above target, -1 for every class at/below it
+        return sum(1 if counts[c] > targets.get(c, counts[c]) else -1 for c in classes)
+
+    heap = [(-gain(classes), rng.random(), i) for i, classes in enumerate(class_sets)]
+    heap = [item for item in heap if item[0] < 0]
+    heapq.heapify(heap)
         
-        if not label_file.exists():
+    keep = [True] * len(class_sets)
+    while heap:
+        neg_gain, tie, i = heapq.heappop(heap)
+        current = gain(class_sets[i])
+        if current <= 0:
+            continue
+        if heap and -current > heap[0][0]:
+            # Gain went down since it was pushed; re-queue with the fresh value
+            heapq.heappush(heap, (-current, tie, i))
             continue
+        keep[i] = False
+        counts.subtract(class_sets[i])
         
-        # Get classes in this image
-        classes_in_image = image_class_map.get(img_file.stem, set())
+    return keep, +counts
         
-        if not classes_in_image:
-            continue
+
+def downsample(input_dir=INPUT_DIR, output_dir=OUTPUT_DIR, target_per_class=TARGET_PER_CLASS,
+               virtual=False, seed=0):
+    print("Starting downsampling...")
+    print(f"Input: {input_dir}")
+    print(f"Output: {output_dir}")
+    print(f"Target: {target_per_class} images per class\n")
+
+    dataset = load_dataset(input_dir)
+    result = new_manifest(dataset['names'] or CLASS_NAMES)
+
+    # ====== 1. KEEP VALIDATION SET (UNCHANGED) ======
+    print("Keeping validation set...")
+    val_entries = dataset['splits'].get('val') or dataset['splits'].get('validation')
+    if val_entries:
+        result['splits']['val'] = [entry for entry, _ in image_class_sets(val_entries)]
+        print(f"  Kept {len(result['splits']['val'])} validation images")
+    else:
+        print("  WARNING: Validation folder not found!")
+
+    # ====== 2. ANALYZE TRAINING DISTRIBUTION ======
+    print("\nAnalyzing current distribution...")
+    train_entries = dataset['splits'].get('train', [])
+    print(f"Found {len(train_entries)} training images")
+
+    # Count IMAGES (not annotations) per class
+    image_class_map = image_class_sets(train_entries)
+    class_image_counts = Counter()
+    for _, classes_in_image in image_class_map:
+        class_image_counts.update(classes_in_image)
+        
+    print("\nCurrent IMAGE distribution per class:")
+    for class_id in sorted(class_image_counts.keys()):
+        count = class_image_counts[class_id]
+        print(f"  Class {class_id}: {count} images")
+        
+    # ====== 3. PER-CLASS TARGETS ======
+    print("\nPer-class targets...")
+    targets = {}
+    for class_id in sorted(class_image_counts):
+        current = class_image_counts[class_id]
+        targets[class_id] = min(current, target_per_class)
+        print(f"  Class {class_id}: {current} → {targets[class_id]}")
         
-        # Calculate keep probability
-        # Keep image if ANY class in it needs to be kept
-        keep_prob = 1.0
-        for class_id in classes_in_image:
-            if class_id in keep_probabilities:
-                keep_prob = min(keep_prob, keep_probabilities[class_id])
+    # ====== 4. SELECT TRAINING SUBSET ======
+    print("\nSelecting training subset...")
+    start = time.perf_counter()
+    keep, new_class_counts = select_subset([classes for _, classes in image_class_map], targets, seed)
+    elapsed = time.perf_counter() - start
         
-        # Randomly decide to keep
-        if random.random() <= keep_prob:
-            shutil.copy(img_file, output_train_img / img_file.name)
-            shutil.copy(label_file, output_train_lbl / label_file.name)
-            images_kept += 1
-        else:
-            images_skipped += 1
-
-print(f"\nDownsampling results:")
-print(f"  Images kept: {images_kept}")
-print(f"  Images skipped: {images_skipped}")
-print(f"  Keep rate: {images_kept/(images_kept+images_skipped):.1%}")
-
-# ====== 5. VERIFY NEW DISTRIBUTION ======
-print("\nVerifying new distribution...")
-new_class_counts = Counter()
-for label_file in output_train_lbl.glob("*.txt"):
-    try:
-        with open(label_file, 'r') as f:
-            classes_in_file = set()
-            for line in f:
-                line = line.strip()
-                if line:
-                    class_id = int(float(line.split()[0]))
-                    classes_in_file.add(class_id)
+    kept = [entry for (entry, _), k in zip(image_class_map, keep) if k]
+    result['splits']['train'] = kept
+    images_kept = len(kept)
+    images_skipped = len(image_class_map) - images_kept
+        
+    print(f"\nDownsampling results ({elapsed:.2f}s):")
+    print(f"  Images kept: {images_kept}")
+    print(f"  Images skipped: {images_skipped}")
+    print(f"  Keep rate: {images_kept/max(1, images_kept+images_skipped):.1%}")
+
+    # ====== 5. ACHIEVED DISTRIBUTION ======
+    print("\nNew IMAGE distribution per class (target, error):")
+    for class_id in sorted(targets):
+        achieved = new_class_counts[class_id]
+        print(f"  Class {class_id}: {achieved} images ({targets[class_id]}, {achieved - targets[class_id]:+d})")
+
+    # ====== 6. WRITE DATASET ======
+    if virtual:
+        print("\nWriting manifest and image lists...")
+        yaml_path = save_virtual_dataset(result, output_dir, 'dataset.yaml')
+    else:
+        print("\nCopying selected images...")
+        yaml_path = materialize(result, output_dir, 'copy', yaml_name='dataset.yaml')
             
-            for class_id in classes_in_file:
-                new_class_counts[class_id] += 1
-    except:
-        continue
-
-print("\nNew IMAGE distribution per class:")
-for class_id in sorted(new_class_counts.keys()):
-    print(f"  Class {class_id}: {new_class_counts[class_id]} images")
-
-# ====== 6. CREATE DATASET.YAML ======
-print("\nCreating dataset.yaml...")
-dataset_yaml = {
-    'path': str(Path(OUTPUT_DIR).absolute()),
-    'train': 'train/images',
-    'val': 'val/images',
-    'names': {0: "Cardboard", 1: "Glass", 2: "Metal", 3: "Mixed Waste", 
-              4: "Organic Waste", 5: "Paper", 6: "Plastic", 7: "Textiles"},
-    'nc': 8
-}
-
-yaml_path = Path(OUTPUT_DIR) / "dataset.yaml"
-with open(yaml_path, 'w') as f:
-    yaml.dump(dataset_yaml, f, default_flow_style=False, sort_keys=False)
-
-print(f"Created {yaml_path}")
-
-print(f"\n✅ Downsampling complete!")
-print(f"📁 Original: {INPUT_DIR} (unchanged)")
-print(f"📁 New balanced: {OUTPUT_DIR}")
-print(f"📊 Target: ~{TARGET_PER_CLASS} images per class")
-print(f"\nTrain with: yolo detect train data={yaml_path} model=yolov8n.pt")
+    print(f"Created {yaml_path}")
+
+    print(f"\n✅ Downsampling complete!")
+    print(f"📁 Original: {input_dir} (unchanged)")
+    print(f"📁 New balanced: {output_dir}")
+    print(f"📊 Target: ~{target_per_class} images per class")
+    print(f"\nTrain with: yolo detect train data={yaml_path} model=yolov8n.pt")
+
+    return yaml_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Downsample over-represented classes in the training split')
+    parser.add_argument('--input', default=INPUT_DIR, help='YOLO folder, manifest.json or folder holding one')
+    parser.add_argument('--output', default=OUTPUT_DIR, help='Output folder')
+    parser.add_argument('--target', type=int, default=TARGET_PER_CLASS, help='Target images per class')
+    parser.add_argument('--virtual', action='store_true',
+                        help='Write a manifest + list files instead of copying the selected images')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for tie-breaking between equal images')
+    args = parser.parse_args(argv)
+
+    downsample(Path(args.input), Path(args.output), args.target, args.virtual, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+"""EcoWheels waste-detection tooling: dataset preparation, training and evaluation."""
+
+__version__ = "0.1.0"
@@ -0,0 +1,110 @@
+# ecowheels/cli.py
+# `ecowheels` console entry point.
+#
+#   ecowheels dataset convert --workers 16 --link-mode reflink -- --virtual
+#   ecowheels dataset verify --cache-dir ~/.cache/ecowheels --full
+#   ecowheels dataset split --seed 1 --datapath data_raw --stratify
+#
+# Options after the subcommand that are not shared options are passed on to
+# the underlying script, so `ecowheels dataset <cmd> --help` also lists them.
+# Nothing heavy is imported here: each script module (and cv2, albumentations,
+# ultralytics behind it) is imported only when its subcommand runs.
+import argparse
+import importlib
+import os
+import sys
+from pathlib import Path
+
+# subcommand -> (module, help, {shared option: function building the script's own arguments})
+DATASET_COMMANDS = {
+    'convert': ('coco_to_yolo', 'Convert the COCO annotations to a YOLO dataset', {
+        'workers': lambda v: ['--workers', str(v)],
+        'link_mode': lambda v: ['--link-mode', v],
+        'seed': lambda v: ['--seed', str(v)],
+    }),
+    'merge': ('material_based_merger', 'Merge the TACO classes into material categories', {}),
+    'balance': ('balance_dataset', 'Balance classes through offline augmentation', {
+        'seed': lambda v: ['--seed', str(v)],
+    }),
+    'downsample': ('downsample_dataset', 'Downsample over-represented classes', {
+        'seed': lambda v: ['--seed', str(v)],
+    }),
+    'split': ('train_val_split', 'Split images and labels into train and validation', {
+        'link_mode': lambda v: ['--link_mode', v],
+        'seed': lambda v: ['--seed', str(v)],
+        'cache_dir': lambda v: ['--dedup_cache', str(Path(v) / 'phash_cache.json')],
+    }),
+    'verify': ('verify_dataset', 'Verify the renamed dataset and its annotations', {
+        'workers': lambda v: ['--workers', str(v)],
+        'cache_dir': lambda v: ['--cache-file', str(Path(v) / 'verify_cache.json')],
+    }),
+}
+
+LINK_MODES = ['hardlink', 'reflink', 'symlink', 'copy']  # dataset_utils.LINK_MODES, without importing it
+
+
+def shared_options(prog=None):
+    parser = argparse.ArgumentParser(prog=prog, add_help=False)
+    group = parser.add_argument_group('shared options')
+    group.add_argument('--workers', type=int, help='Parallel workers')
+    group.add_argument('--link-mode', choices=LINK_MODES, help='How images are placed in outputs')
+    group.add_argument('--seed', type=int, help='Random seed')
+    group.add_argument('--cache-dir', type=Path, help='Folder for caches (hashes, verification results)')
+    return parser
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='ecowheels', description='EcoWheels dataset and model tools')
+    sub = parser.add_subparsers(dest='group', required=True)
+
+    dataset = sub.add_parser('dataset', help='Dataset preparation tools')
+    commands = dataset.add_subparsers(dest='command', required=True)
+    for name, (module, help_text, _) in DATASET_COMMANDS.items():
+        # -h is left to the script so its own options are listed too
+        commands.add_parser(name, help=help_text, description=help_text, parents=[shared_options()],
+                            add_help=False, allow_abbrev=False)
+    return parser
+
+
+def run_dataset_command(name, args, rest):
+    module_name, _, mapping = DATASET_COMMANDS[name]
+
+    script_argv = []
+    for option, value in (('workers', args.workers), ('link_mode', args.link_mode),
+                          ('seed', args.seed), ('cache_dir', args.cache_dir)):
+        if value is None:
+            continue
+        if option not in mapping:
+            print(f"⚠️  --{option.replace('_', '-')} has no effect on 'dataset {name}'", file=sys.stderr)
+            continue
+        if option == 'cache_dir':
+            os.makedirs(value, exist_ok=True)
+        script_argv += mapping[option](value)
+    if rest and rest[0] == '--':
+        rest = rest[1:]
+    script_argv += rest
+
+    if '-h' in script_argv or '--help' in script_argv:
+        shared_options(f"ecowheels dataset {name}").print_help()
+        print()
+
+    # The scripts live next to the package (installed as top-level modules)
+    root = str(Path(__file__).resolve().parent.parent)
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    module = importlib.import_module(module_name)
+    sys.argv = [f"ecowheels dataset {name}"] + script_argv
+    return module.main(script_argv)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args, rest = parser.parse_known_args(argv)
+    if args.group == 'dataset':
+        return run_dataset_command(args.command, args, rest)
+    parser.error(f"unknown command group '{args.group}'")
+
+
+if __name__ == "__main__":
+    main()
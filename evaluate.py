@@ -0,0 +1,454 @@
+# evaluate.py
+# Full-split evaluation and error analysis of a trained detector.
+#
+# Every image of the split goes through batched inference while a thread pool
+# decodes the next batches (at reduced JPEG scale, see resize_cache.py). All
+# predictions are then scored at once: per-class AP (IoU .50:.95, 101-point
+# interpolation as in Ultralytics/COCO), a confusion matrix, and FP/FN counts
+# by box size, with IoU matching vectorised in NumPy.
+#
+# Raw detections are kept in the prediction cache (prediction_cache.py), so
+# re-scoring the same model on the same images at another conf/iou, with a
+# class merge, or as a threshold sweep does not run the model again.
+#
+#   python evaluate.py
+#   python evaluate.py --sweep 0.1 0.2 0.3 0.4 0.5 --nms-iou 0.5
+#   python evaluate.py --weights runs/detect/train2/weights/best.pt --data yolo_taco_material_merged --split test
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from dataset_manifest import load_dataset, read_boxes
+from dataset_utils import box_iou
+from prediction_cache import CACHE_DIR, MAX_DET, STORE_CONF, STORE_IOU, PredictionStore, image_hashes, replay
+
+# ========== CONFIGURATION ==========
+DATASET_PATH = "/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/yolo_taco_material_merged"
+WEIGHTS = "runs/detect/train2/weights/best.pt"
+SPLIT = "val"
+IMGSZ = 640
+BATCH = 16
+DECODE_WORKERS = min(8, os.cpu_count() or 1)
+PREFETCH = 2          # batches decoded ahead of the one being inferred
+NMS_IOU = 0.7         # replayed from the stored detections, at most prediction_cache.STORE_IOU
+REPORT_CONF = 0.25    # operating point for the confusion matrix and FP/FN breakdown
+REPORT_IOU = 0.5
+# ===================================
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+# COCO size buckets, in pixels of the image as the model sees it (long side = imgsz)
+SIZE_BUCKETS = [('small', 32 ** 2), ('medium', 96 ** 2), ('large', float('inf'))]
+FP_TYPES = ['background', 'wrong class', 'localization', 'duplicate']
+
+
+def load_split(source, split):
+    """Dataset class names and the split's records: image path + ground truth [cls, x1, y1, x2, y2] (normalized)"""
+    manifest = load_dataset(source)
+    if split not in manifest['splits']:
+        raise ValueError(f"{source} has no '{split}' split (has: {', '.join(manifest['splits'])})")
+
+    records = []
+    bad_labels = 0
+    for entry in manifest['splits'][split]:
+        boxes = np.array(read_boxes(entry), dtype=np.float32).reshape(-1, 5)
+        known = (boxes[:, 0] >= 0) & (boxes[:, 0] < len(manifest['names']))
+        bad_labels += int((~known).sum())
+        boxes = boxes[known]
+        xy, wh = boxes[:, 1:3], boxes[:, 3:5]
+        gt = np.concatenate([boxes[:, :1], xy - wh / 2, xy + wh / 2], axis=1)
+        bad_labels += int(((gt[:, 1:] < -0.01) | (gt[:, 1:] > 1.01)).any(axis=1).sum() + (wh <= 0).any(axis=1).sum())
+        records.append({'image': entry['image'], 'gt': gt})
+    return manifest['names'], records, bad_labels
+
+
+def decode_batches(paths, imgsz=IMGSZ, batch=BATCH, workers=DECODE_WORKERS, prefetch=PREFETCH, stats=None):
+    """Yield (indices, images) batches of decoded images (long side = imgsz) while later batches decode.
+
+    Unreadable images are left out of the batch; stats['decode_wait'] accumulates
+    the time inference spent waiting for the decoders.
+    """
+    from resize_cache import decode_for_size, resize_long_side
+
+    def load(path):
+        img = decode_for_size(path, imgsz)
+        return None if img is None else resize_long_side(img, imgsz)
+
+    stats = stats if stats is not None else {}
+    stats.setdefault('decode_wait', 0.0)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        queued = 0
+        while queued < len(paths) or pending:
+            # Keep (prefetch + 1) batches in flight
+            while queued < len(paths) and len(pending) < batch * (prefetch + 1):
+                pending.append((queued, pool.submit(load, paths[queued])))
+                queued += 1
+
+            indices, images = [], []
+            start = time.perf_counter()
+            for _ in range(min(batch, len(pending))):
+                i, future = pending.popleft()
+                img = future.result()
+                if img is not None:
+                    indices.append(i)
+                    images.append(img)
+            stats['decode_wait'] += time.perf_counter() - start
+            if images:
+                yield indices, images
+
+
+def predict_split(weights, records, imgsz=IMGSZ, batch=BATCH, workers=DECODE_WORKERS, device='cpu',
+                  stats=None, cache_dir=CACHE_DIR):
+    """Raw predictions [x1, y1, x2, y2, conf, cls] (normalized, at STORE_CONF/STORE_IOU) for every record.
+
+    None where the image is unreadable. With a cache_dir, images already in the
+    prediction cache are not decoded and the model is only loaded for the rest.
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault('inference', 0.0)
+    predictions = [None] * len(records)
+    paths = [r['image'] for r in records]
+    todo = list(range(len(records)))
+
+    store = None
+    if cache_dir is not None:
+        store = PredictionStore(weights, imgsz, cache_dir)
+        hashes = image_hashes(paths, cache_dir)
+        todo = []
+        for i, h in enumerate(hashes):
+            hit = store.get(h) if h else None
+            if hit is None:
+                todo.append(i)
+            else:
+                predictions[i], records[i]['shape'] = hit
+        print(f"  🗄️  {len(records) - len(todo):,} of {len(records):,} images replayed from the prediction cache")
+    if not todo:
+        return predictions
+
+    from ultralytics import YOLO
+
+    model = YOLO(weights)
+    done = 0
+    for indices, images in decode_batches([paths[i] for i in todo], imgsz, batch, workers, stats=stats):
+        indices = [todo[i] for i in indices]
+        start = time.perf_counter()
+        results = model.predict(images, imgsz=imgsz, conf=STORE_CONF, iou=STORE_IOU, max_det=MAX_DET,
+                                device=device, verbose=False)
+        stats['inference'] += time.perf_counter() - start
+
+        for i, img, result in zip(indices, images, results):
+            boxes = result.boxes
+            predictions[i] = np.concatenate([boxes.xyxyn.cpu().numpy(), boxes.conf.cpu().numpy()[:, None],
+                                             boxes.cls.cpu().numpy()[:, None]], axis=1).astype(np.float32)
+            records[i]['shape'] = img.shape[:2]
+            if store is not None:
+                store.add(hashes[i], predictions[i], img.shape[:2])
+        done += len(indices)
+        print(f"\r  {done}/{len(todo)} images", end='', flush=True)
+    print()
+    if store is not None:
+        store.save()
+    return predictions
+
+
+def greedy_match(iou, threshold):
+    """(pred, gt) index pairs, best IoU first, each prediction and ground truth used at most once"""
+    p, g = np.nonzero(iou >= threshold)
+    if not len(p):
+        return p, g
+    order = np.argsort(-iou[p, g], kind='stable')
+    p, g = p[order], g[order]
+    keep = np.sort(np.unique(p, return_index=True)[1])
+    p, g = p[keep], g[keep]
+    keep = np.sort(np.unique(g, return_index=True)[1])
+    return p[keep], g[keep]
+
+
+def match_predictions(pred, gt, thresholds=IOU_THRESHOLDS):
+    """(N_pred, T) bool: prediction is a true positive at each IoU threshold (same class required)"""
+    correct = np.zeros((len(pred), len(thresholds)), dtype=bool)
+    if not len(pred) or not len(gt):
+        return correct
+    iou = box_iou(pred[:, :4], gt[:, 1:]) * (pred[:, 5:6] == gt[None, :, 0])
+    for k, t in enumerate(thresholds):
+        p, _ = greedy_match(iou, t)
+        correct[p, k] = True
+    return correct
+
+
+def average_precision(correct, conf, num_gt):
+    """AP at each IoU threshold for one class, 101-point interpolated"""
+    if num_gt == 0 or not len(correct):
+        return np.zeros(correct.shape[1])
+    order = np.argsort(-conf, kind='stable')
+    tp = np.cumsum(correct[order], axis=0)
+    fp = np.cumsum(~correct[order], axis=0)
+    recall = tp / num_gt
+    precision = tp / (tp + fp)
+    precision = np.flip(np.maximum.accumulate(np.flip(precision, axis=0), axis=0), axis=0)  # envelope
+
+    points = np.linspace(0, 1, 101)
+    ap = np.zeros(correct.shape[1])
+    for k in range(correct.shape[1]):
+        idx = np.searchsorted(recall[:, k], points, side='left')
+        valid = idx < len(recall)
+        ap[k] = precision[idx[valid], k].sum() / len(points)
+    return ap
+
+
+def size_bucket(boxes, shape, imgsz=IMGSZ):
+    """Size bucket index of normalized xyxy boxes, measured at the model's input scale"""
+    h, w = shape
+    s = imgsz / max(h, w)
+    area = (boxes[:, 2] - boxes[:, 0]) * w * s * (boxes[:, 3] - boxes[:, 1]) * h * s
+    return np.searchsorted([limit for _, limit in SIZE_BUCKETS], area, side='right')
+
+
+def score(names, records, predictions, report_conf=REPORT_CONF, report_iou=REPORT_IOU, imgsz=IMGSZ):
+    """Per-class AP, confusion matrix and FP/FN breakdown of predictions against the records' ground truth"""
+    nc = len(names)
+    correct_all, conf_all, cls_all = [], [], []
+    gt_counts = np.zeros(nc, dtype=int)
+    image_counts = np.zeros(nc, dtype=int)
+    confusion = np.zeros((nc + 1, nc + 1), dtype=int)  # [true, predicted], last row/column = background
+    sizes = {name: {'gt': 0, 'tp': 0, 'fn': 0, 'fp': 0} for name, _ in SIZE_BUCKETS}
+    fp_types = dict.fromkeys(FP_TYPES, 0)
+    fn_per_class = np.zeros(nc, dtype=int)
+    scored = 0
+
+    for record, pred in zip(records, predictions):
+        if pred is None:
+            continue
+        scored += 1
+        gt = record['gt']
+        gt_cls = gt[:, 0].astype(int)
+        gt_counts += np.bincount(gt_cls, minlength=nc)[:nc]
+        image_counts[np.unique(gt_cls)] += 1
+
+        correct_all.append(match_predictions(pred, gt))
+        conf_all.append(pred[:, 4])
+        cls_all.append(pred[:, 5].astype(int))
+
+        # Everything below is at the operating point
+        pred = pred[pred[:, 4] >= report_conf]
+        pred_cls = pred[:, 5].astype(int)
+        iou = box_iou(pred[:, :4], gt[:, 1:]) if len(pred) and len(gt) else np.zeros((len(pred), len(gt)))
+
+        # Confusion matrix: class-agnostic matching, as in Ultralytics
+        p, g = greedy_match(iou, report_iou)
+        np.add.at(confusion, (gt_cls[g], pred_cls[p]), 1)
+        np.add.at(confusion, (np.delete(gt_cls, g), nc), 1)
+        np.add.at(confusion, (nc, np.delete(pred_cls, p)), 1)
+
+        # True positives need the right class too
+        same_class = pred_cls[:, None] == gt_cls[None, :]
+        tp_p, tp_g = greedy_match(iou * same_class, report_iou)
+        fp_mask = np.ones(len(pred), dtype=bool)
+        fp_mask[tp_p] = False
+        fn_mask = np.ones(len(gt), dtype=bool)
+        fn_mask[tp_g] = False
+        fn_per_class += np.bincount(gt_cls[fn_mask], minlength=nc)[:nc]
+
+        gt_bucket = size_bucket(gt[:, 1:], record['shape'], imgsz)
+        pred_bucket = size_bucket(pred[:, :4], record['shape'], imgsz)
+        for b, (name, _) in enumerate(SIZE_BUCKETS):
+            sizes[name]['gt'] += int((gt_bucket == b).sum())
+            sizes[name]['tp'] += int((gt_bucket[tp_g] == b).sum())
+            sizes[name]['fn'] += int((gt_bucket[fn_mask] == b).sum())
+            sizes[name]['fp'] += int((pred_bucket[fp_mask] == b).sum())
+
+        # Why each false positive is wrong
+        for i in np.nonzero(fp_mask)[0]:
+            row, same = iou[i], same_class[i]
+            if (row[same] >= report_iou).any():
+                fp_types['duplicate'] += 1
+            elif (row[~same] >= report_iou).any():
+                fp_types['wrong class'] += 1
+            elif (row[same] >= 0.1).any():
+                fp_types['localization'] += 1
+            else:
+                fp_types['background'] += 1
+
+    correct = np.concatenate(correct_all) if correct_all else np.zeros((0, len(IOU_THRESHOLDS)), dtype=bool)
+    conf = np.concatenate(conf_all) if conf_all else np.zeros(0)
+    cls = np.concatenate(cls_all) if cls_all else np.zeros(0, dtype=int)
+
+    classes = []
+    for c, name in enumerate(names):
+        mask = cls == c
+        ap = average_precision(correct[mask], conf[mask], gt_counts[c])
+        at_op = mask & (conf >= report_conf)
+        tp = int(correct[at_op, 0].sum())
+        classes.append({
+            'name': name, 'images': int(image_counts[c]), 'instances': int(gt_counts[c]),
+            'precision': tp / max(int(at_op.sum()), 1), 'recall': tp / max(int(gt_counts[c]), 1),
+            'map50': float(ap[0]), 'map50_95': float(ap.mean()), 'fn': int(fn_per_class[c]),
+        })
+
+    present = [c for c in classes if c['instances']]
+    return {
+        'images': scored,
+        'instances': int(gt_counts.sum()),
+        'map50': float(np.mean([c['map50'] for c in present])) if present else 0.0,
+        'map50_95': float(np.mean([c['map50_95'] for c in present])) if present else 0.0,
+        'classes': classes,
+        'confusion': confusion.tolist(),
+        'sizes': sizes,
+        'fp_types': fp_types,
+    }
+
+
+def print_report(names, metrics, stats, report_conf=REPORT_CONF, report_iou=REPORT_IOU):
+    print("\n" + "=" * 60)
+    print("📊 EVALUATION REPORT")
+    print("=" * 60)
+    print(f"{metrics['images']:,} images, {metrics['instances']:,} instances")
+    print(f"mAP50: {metrics['map50']:.3f}   mAP50-95: {metrics['map50_95']:.3f}")
+
+    print(f"\n{'class':<16}{'images':>8}{'inst':>8}{'P':>8}{'R':>8}{'mAP50':>8}{'50-95':>8}")
+    for c in metrics['classes']:
+        print(f"{c['name'][:15]:<16}{c['images']:>8}{c['instances']:>8}{c['precision']:>8.3f}"
+              f"{c['recall']:>8.3f}{c['map50']:>8.3f}{c['map50_95']:>8.3f}")
+
+    print(f"\n🔀 Confusion matrix (rows: true, columns: predicted; conf >= {report_conf}, IoU >= {report_iou})")
+    labels = [n[:7] for n in names] + ['backgr']
+    print(f"{'':<9}" + ''.join(f"{label:>8}" for label in labels))
+    for label, row in zip(labels, metrics['confusion']):
+        print(f"{label:<9}" + ''.join(f"{v:>8}" for v in row))
+
+    print(f"\n📐 Errors by box size (at {report_conf} conf)")
+    print(f"{'size':<10}{'GT':>8}{'TP':>8}{'FN':>8}{'miss %':>8}{'FP':>8}")
+    for name, s in metrics['sizes'].items():
+        miss = 100 * s['fn'] / s['gt'] if s['gt'] else 0.0
+        print(f"{name:<10}{s['gt']:>8}{s['tp']:>8}{s['fn']:>8}{miss:>7.1f}%{s['fp']:>8}")
+
+    total_fp = sum(metrics['fp_types'].values())
+    print(f"\n❌ False positives: {total_fp:,}")
+    for name, count in metrics['fp_types'].items():
+        print(f"  {name:<14}{count:>8}  ({100 * count / max(total_fp, 1):.1f}%)")
+
+    if stats:
+        total = stats['total']
+        print(f"\n⏱️  {metrics['images'] / total:.1f} images/s ({total:.1f}s total: "
+              f"inference {stats.get('inference', 0):.1f}s, waiting on decode {stats.get('decode_wait', 0):.1f}s, "
+              f"scoring {stats['scoring']:.1f}s)")
+        if stats.get('decode_wait', 0) > 0.2 * stats.get('inference', 0):
+            print("  ⚠️  Decoding is a bottleneck: raise --workers or evaluate a resize_cache.py copy")
+
+
+def sweep(names, records, predictions, confs, report_iou=REPORT_IOU, imgsz=IMGSZ):
+    """Overall precision/recall/F1 at each confidence threshold"""
+    print(f"\n🎚️  Confidence sweep (IoU >= {report_iou})")
+    print(f"{'conf':>8}{'TP':>8}{'FP':>8}{'FN':>8}{'P':>8}{'R':>8}{'F1':>8}")
+    rows = []
+    for conf in confs:
+        sizes = score(names, records, predictions, conf, report_iou, imgsz)['sizes'].values()
+        tp, fp, fn = (sum(s[k] for s in sizes) for k in ('tp', 'fp', 'fn'))
+        p, r = tp / max(tp + fp, 1), tp / max(tp + fn, 1)
+        f1 = 2 * p * r / max(p + r, 1e-9)
+        print(f"{conf:>8.3f}{tp:>8}{fp:>8}{fn:>8}{p:>8.3f}{r:>8.3f}{f1:>8.3f}")
+        rows.append({'conf': conf, 'tp': tp, 'fp': fp, 'fn': fn, 'precision': p, 'recall': r, 'f1': f1})
+    best = max(rows, key=lambda row: row['f1'])
+    print(f"  → best F1 {best['f1']:.3f} at conf {best['conf']:.3f}")
+    return rows
+
+
+def merge_classes(names, records, scheme):
+    """Apply a material_based_merger scheme to the ground truth; returns (new names, lookup table)"""
+    from material_based_merger import MERGE_SCHEMES, build_lookup_table
+
+    classes = np.concatenate([r['gt'][:, 0] for r in records] + [np.zeros(0)]).astype(int)
+    counts = np.bincount(classes, minlength=len(names))
+    merge_map, _, merged_names = MERGE_SCHEMES[scheme](counts.tolist())
+    lut = build_lookup_table(merge_map, len(names))
+    for r in records:
+        r['gt'][:, 0] = lut[r['gt'][:, 0].astype(int)]
+    return merged_names, lut
+
+
+def evaluate(weights=WEIGHTS, source=DATASET_PATH, split=SPLIT, imgsz=IMGSZ, batch=BATCH, workers=DECODE_WORKERS,
+             device='cpu', report_conf=REPORT_CONF, report_iou=REPORT_IOU, report=None, nms_iou=NMS_IOU,
+             merge=None, sweep_confs=None, cache_dir=CACHE_DIR):
+    names, records, bad_labels = load_split(source, split)
+    if merge:
+        from material_based_merger import NUM_TACO_CLASSES
+        # The merge schemes map class ids of the original TACO layout
+        if len(names) != NUM_TACO_CLASSES:
+            print(f"❌ --merge {merge} expects the {NUM_TACO_CLASSES} original TACO classes, "
+                  f"but {source} has {len(names)}; evaluate an unmerged dataset or drop --merge")
+            return None
+    print(f"🔍 Evaluating {weights} on {len(records):,} '{split}' images at {imgsz}px (batch {batch})")
+    if bad_labels:
+        print(f"  ⚠️  {bad_labels} label boxes have an unknown class, are out of [0, 1] or empty: check the label files")
+    if nms_iou > STORE_IOU:
+        print(f"  ⚠️  NMS IoU {nms_iou} is looser than the stored detections ({STORE_IOU}); using {STORE_IOU}")
+        nms_iou = STORE_IOU
+
+    stats = {}
+    start = time.perf_counter()
+    predictions = predict_split(weights, records, imgsz, batch, workers, device, stats, cache_dir)
+    unreadable = sum(p is None for p in predictions)
+    if unreadable:
+        print(f"  ⚠️  {unreadable} images could not be read and were skipped")
+
+    score_start = time.perf_counter()
+    lut = None
+    if merge:
+        names, lut = merge_classes(names, records, merge)
+    predictions = [None if p is None else replay(p, STORE_CONF, nms_iou, lut) for p in predictions]
+    metrics = score(names, records, predictions, report_conf, report_iou, imgsz)
+    stats['scoring'] = time.perf_counter() - score_start
+    stats['total'] = time.perf_counter() - start
+
+    print_report(names, metrics, stats, report_conf, report_iou)
+    if sweep_confs:
+        metrics['sweep'] = sweep(names, records, predictions, sweep_confs, report_iou, imgsz)
+    if report:
+        metrics['throughput'] = {k: round(v, 3) for k, v in stats.items()}
+        with open(report, 'w') as f:
+            json.dump(metrics, f, indent=2)
+        print(f"\n📄 Report: {report}")
+    return metrics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Evaluate a detector on a whole split with error analysis')
+    parser.add_argument('--weights', default=WEIGHTS, help='Model weights (.pt)')
+    parser.add_argument('--data', default=DATASET_PATH, help='Dataset folder or manifest')
+    parser.add_argument('--split', default=SPLIT, help='Split to evaluate (val, test, ...)')
+    parser.add_argument('--imgsz', type=int, default=IMGSZ, help='Inference image size')
+    parser.add_argument('--batch', type=int, default=BATCH, help='Images per inference batch')
+    parser.add_argument('--workers', type=int, default=DECODE_WORKERS, help='Image decoding threads')
+    parser.add_argument('--device', default='cpu', help="Inference device ('cpu', '0', ...)")
+    parser.add_argument('--conf', type=float, default=REPORT_CONF,
+                        help='Confidence of the operating point (confusion matrix, P/R, FP/FN)')
+    parser.add_argument('--iou', type=float, default=REPORT_IOU, help='IoU for a match at the operating point')
+    parser.add_argument('--nms-iou', type=float, default=NMS_IOU, help='NMS IoU applied to the stored detections')
+    parser.add_argument('--merge', help='Score with merged classes (a material_based_merger.py scheme)')
+    parser.add_argument('--sweep', type=float, nargs='+', help='Also report P/R/F1 at these confidences')
+    parser.add_argument('--cache', type=Path, default=CACHE_DIR, help='Prediction cache folder')
+    parser.add_argument('--no-cache', action='store_true', help='Always run the model, store nothing')
+    parser.add_argument('--report', help='Also write the metrics to this JSON file')
+    args = parser.parse_args(argv)
+
+    if args.merge:
+        from material_based_merger import MERGE_SCHEMES
+        if args.merge not in MERGE_SCHEMES:
+            parser.error(f"unknown merge scheme '{args.merge}' (choose from {', '.join(MERGE_SCHEMES)})")
+
+    metrics = evaluate(args.weights, args.data, args.split, args.imgsz, args.batch, args.workers, args.device,
+                       args.conf, args.iou, args.report, args.nms_iou, args.merge, args.sweep,
+                       None if args.no_cache else args.cache)
+    if metrics is None:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+# find_duplicates.py
+# Near-duplicate and train/val leakage detector based on perceptual hashes
+import argparse
+import csv
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+
+from dataset_manifest import load_dataset, new_manifest, save_virtual_dataset
+
+# ========== CONFIGURATION ==========
+RADIUS = 6          # max Hamming distance (of 64 bits) to call two images near-duplicates
+CHUNKS = 4          # multi-index hashing: the 64-bit hash is split into 4 x 16-bit tables
+WORKERS = os.cpu_count() or 1
+# ===================================
+
+# balance_dataset.py names augmentations <stem>_aug<class>_<n>.jpg
+AUG_SUFFIX = re.compile(r'_aug\d+_\d+$')
+
+_POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def phash(path):
+    """64-bit DCT perceptual hash of an image, or None if it cannot be read"""
+    import cv2
+
+    # Reduced decode: the JPEG decoder downscales in the DCT domain, which is
+    # far cheaper than a full-resolution decode and plenty for a 32x32 hash
+    img = cv2.imread(str(path), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if img is None:
+        return None
+    img = cv2.resize(img, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(img)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def _hash_job(job):
+    path, key = job
+    return key, phash(path)
+
+
+def compute_hashes(paths, workers=WORKERS, cache_file=None):
+    """Hash all images in a process pool, reusing cached hashes for unchanged files"""
+    cache = {}
+    if cache_file and Path(cache_file).exists():
+        with open(cache_file, 'r') as f:
+            cache = json.load(f)
+
+    hashes = [None] * len(paths)
+    jobs = []
+    for i, path in enumerate(paths):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        key = f"{st.st_mtime_ns}:{st.st_size}"
+        cached = cache.get(str(path))
+        if cached and cached[0] == key:
+            hashes[i] = cached[1]
+        else:
+            jobs.append((i, path, key))
+
+    print(f"🔢 Hashing {len(jobs):,} images ({len(paths) - len(jobs):,} cached) with {workers} processes...")
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(_hash_job, [(path, key) for _, path, key in jobs], chunksize=32)
+            for (i, path, _), (key, value) in zip(jobs, results):
+                hashes[i] = value
+                if value is not None:
+                    cache[str(path)] = [key, value]
+
+    if cache_file:
+        tmp = Path(str(cache_file) + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp, cache_file)
+
+    return hashes
+
+
+def hamming(a, b):
+    """Bitwise Hamming distance between two uint64 arrays"""
+    x = np.bitwise_xor(a, b)
+    return _POPCOUNT8[x.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def find_pairs(hashes, radius=RADIUS, chunks=CHUNKS):
+    """All index pairs (i < j) with Hamming distance <= radius.
+
+    Multi-index hashing: if two 64-bit hashes differ in at most radius bits,
+    at least one of the `chunks` substrings differs in at most
+    radius // chunks bits (pigeonhole). Each substring table is a sorted
+    array probed with every such bit flip through np.searchsorted, so the
+    candidate search is vectorised and sub-quadratic; candidates are then
+    checked with the full Hamming distance.
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    n = len(hashes)
+    bits = 64 // chunks
+    sub_radius = radius // chunks
+    masks = [0]
+    for r in range(1, sub_radius + 1):
+        for flip in combinations(range(bits), r):
+            masks.append(sum(1 << b for b in flip))
+
+    found = []
+    for c in range(chunks):
+        values = ((hashes >> np.uint64(c * bits)) & np.uint64((1 << bits) - 1)).astype(np.int64)
+        order = np.argsort(values, kind='stable')
+        # Table: distinct substring values -> run of indices in `order`
+        keys, starts, sizes = np.unique(values[order], return_index=True, return_counts=True)
+        if len(keys) == 0:
+            continue
+        for mask in masks:
+            probe = values ^ mask
+            pos = np.minimum(np.searchsorted(keys, probe), len(keys) - 1)
+            counts = np.where(keys[pos] == probe, sizes[pos], 0)
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            i = np.repeat(np.arange(n), counts)
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            j = order[np.repeat(starts[pos], counts) + offsets]
+            keep = i < j
+            i, j = i[keep], j[keep]
+            # Verify right away so only true pairs are kept around
+            dist = hamming(hashes[i], hashes[j])
+            close = dist <= radius
+            found.append(np.stack([i[close], j[close], dist[close].astype(np.int64)], axis=1))
+
+    if not found:
+        return np.empty((0, 3), dtype=np.int64)
+
+    # The same pair can be found through several substrings
+    return np.unique(np.concatenate(found), axis=0)
+
+
+def source_stem(path):
+    """Stem of the original image an augmentation was derived from"""
+    return AUG_SUFFIX.sub('', Path(path).stem)
+
+
+def source_groups(paths):
+    """Index lists of the images derived from one source photo.
+
+    Originals are keyed by folder and stem, so batch_1/000001.jpg and
+    batch_2/000001.jpg stay apart. An augmentation joins the original with its
+    source stem in its own folder or, when it was written elsewhere (the
+    augmented/ folder of balance_dataset.py), every original with that stem.
+    """
+    keys = [(str(Path(p).parent), source_stem(p)) for p in paths]
+    is_aug = [AUG_SUFFIX.search(Path(p).stem) is not None for p in paths]
+    folders = {}
+    for (folder, stem), aug in zip(keys, is_aug):
+        if not aug:
+            folders.setdefault(stem, set()).add(folder)
+
+    parent = {}
+
+    def find(key):
+        parent.setdefault(key, key)
+        while parent[key] != key:
+            key = parent[key]
+        return key
+
+    for (folder, stem), aug in zip(keys, is_aug):
+        if aug and folder not in folders.get(stem, ()):
+            for other in folders.get(stem, ()):
+                parent[find((other, stem))] = find((folder, stem))
+
+    groups = {}
+    for i, key in enumerate(keys):
+        groups.setdefault(find(key), []).append(i)
+    return list(groups.values())
+
+
+def duplicate_groups(paths, radius=RADIUS, workers=WORKERS, cache_file=None):
+    """Group id per path: near-duplicates and augmentations of one source share a group"""
+    hashes = compute_hashes(paths, workers, cache_file)
+    parent = list(range(len(paths)))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(a, b):
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[rb] = ra
+
+    valid = [i for i, h in enumerate(hashes) if h is not None]
+    for a, b, _ in find_pairs([hashes[i] for i in valid], radius).tolist():
+        union(valid[a], valid[b])
+
+    for members in source_groups(paths):
+        for i in members[1:]:
+            union(members[0], i)
+
+    return [find(i) for i in range(len(paths))]
+
+
+def find_leakage(dataset, radius=RADIUS, workers=WORKERS, cache_file=None, include_same_split=False):
+    """Near-duplicate pairs in a dataset (manifest, manifest folder or YOLO folder)"""
+    manifest = load_dataset(dataset)
+    items = [(split, entry) for split, entries in manifest['splits'].items() for entry in entries]
+    paths = [entry['image'] for _, entry in items]
+
+    hashes = compute_hashes(paths, workers, cache_file)
+    valid = [i for i, h in enumerate(hashes) if h is not None]
+    if len(valid) < len(paths):
+        print(f"⚠️  {len(paths) - len(valid)} images could not be read")
+
+    print(f"🔍 Searching {len(valid):,} hashes for pairs within {radius} bits...")
+    results = []
+    for a, b, dist in find_pairs([hashes[i] for i in valid], radius).tolist():
+        a, b = valid[a], valid[b]
+        if include_same_split or items[a][0] != items[b][0]:
+            results.append((items[a][0], paths[a], items[b][0], paths[b], dist, 'phash'))
+
+    # Augmentations of the same source always count, however different they look
+    seen = {(p1, p2) for _, p1, _, p2, _, _ in results}
+    for members in source_groups(paths):
+        for a, b in combinations(members, 2):
+            if (include_same_split or items[a][0] != items[b][0]) and (paths[a], paths[b]) not in seen:
+                results.append((items[a][0], paths[a], items[b][0], paths[b], -1, 'same_source'))
+
+    return manifest, results
+
+
+def drop_leaked(manifest, pairs, drop_from):
+    """Copy of the manifest without the drop_from images that leak into another split"""
+    leaked = set()
+    for split_a, path_a, split_b, path_b, _, _ in pairs:
+        if split_a == drop_from and split_b != drop_from:
+            leaked.add(path_a)
+        if split_b == drop_from and split_a != drop_from:
+            leaked.add(path_b)
+
+    cleaned = new_manifest(manifest['names'])
+    for split, entries in manifest['splits'].items():
+        cleaned['splits'][split] = [e for e in entries if split != drop_from or e['image'] not in leaked]
+    return cleaned, leaked
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find near-duplicate images and train/val leakage')
+    parser.add_argument('dataset', help='YOLO folder, manifest.json or folder holding one')
+    parser.add_argument('--radius', type=int, default=RADIUS, help='Max Hamming distance of the 64-bit pHash')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='Hashing processes')
+    parser.add_argument('--cache', help='JSON file caching hashes by path/mtime/size')
+    parser.add_argument('--same-split', action='store_true', help='Also report duplicates inside one split')
+    parser.add_argument('--report', default='duplicates_report.csv', help='CSV file listing every pair')
+    parser.add_argument('--output', help='Write a cleaned virtual dataset here')
+    parser.add_argument('--drop-from', default='train', help='Split that loses leaked images in --output')
+    args = parser.parse_args()
+
+    manifest, pairs = find_leakage(args.dataset, args.radius, args.workers, args.cache, args.same_split)
+
+    with open(args.report, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['split_a', 'image_a', 'split_b', 'image_b', 'distance', 'reason'])
+        writer.writerows(pairs)
+
+    cross = [p for p in pairs if p[0] != p[2]]
+    print(f"\n📊 Near-duplicate pairs: {len(pairs):,} ({len(cross):,} across splits)")
+    for split_a, path_a, split_b, path_b, dist, reason in cross[:10]:
+        print(f"  {split_a}/{Path(path_a).name} ↔ {split_b}/{Path(path_b).name} ({reason}, d={dist})")
+    print(f"📄 Report: {args.report}")
+
+    if args.output:
+        cleaned, leaked = drop_leaked(manifest, pairs, args.drop_from)
+        yaml_path = save_virtual_dataset(cleaned, args.output)
+        print(f"\n🧹 Dropped {len(leaked):,} leaked images from {args.drop_from}")
+        print(f"✅ Cleaned dataset: {yaml_path}")
+
+
+if __name__ == "__main__":
+    main()
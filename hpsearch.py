@@ -0,0 +1,300 @@
+# hpsearch.py
+# Multi-fidelity hyperparameter search: successive halving (optionally Hyperband).
+#
+# Many configurations sampled from SEARCH_SPACE start on the cheapest rung: a
+# small class-covering subsample of the dataset, a low imgsz and a few epochs.
+# After each rung only the best 1/ETA of them (by mAP50-95 on the rung's val
+# subsample) are promoted to the next, larger rung, where they train again
+# from the pretrained weights. The last rung is the full dataset at full size.
+# --hyperband runs several such brackets, each starting at a different rung,
+# to hedge against low rungs ranking configurations badly.
+#
+# Trials run in parallel in a process pool, each with its share of the cores.
+# Every finished trial is appended to runs/hpsearch/results.csv straight away;
+# running the same command again skips what the table already holds, so an
+# interrupted search resumes where it stopped. The winner's hyperparameters
+# go to runs/hpsearch/best_hyp.yaml for `train.py --hyp`.
+#
+#   python hpsearch.py --data balanced_final --configs 27 --parallel 4
+#   python train.py --hyp runs/hpsearch/best_hyp.yaml --epochs 150
+import argparse
+import csv
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import yaml
+
+from dataset_manifest import load_dataset, new_manifest, read_boxes, save_virtual_dataset
+from proxy_val import DATASET_PATH, select_proxy
+from train import MODEL, apply_threads, keep_workers, load_train_config
+
+# ========== CONFIGURATION ==========
+OUTPUT_DIR = Path("runs/hpsearch")
+CORES = os.cpu_count() or 1
+PARALLEL = max(1, CORES // 4)    # trials at once; each gets CORES // PARALLEL torch threads
+N_CONFIGS = 27
+ETA = 3                          # keep the best 1/ETA at each rung
+# (train fraction, imgsz, epochs) from cheapest to the full budget
+RUNGS = [(0.1, 320, 3), (0.25, 416, 6), (0.5, 512, 12), (1.0, 640, 25)]
+MIN_VAL_IMAGES = 100             # val subsample floor on the small rungs
+# ('log', lo, hi) | ('uniform', lo, hi) | ('choice', [values]); the notebook's hand-tuned cell is inside the ranges
+SEARCH_SPACE = {
+    'optimizer': ('choice', ['SGD', 'AdamW']),
+    'lr0': ('log', 1e-4, 2e-2),
+    'lrf': ('log', 0.005, 0.2),
+    'cos_lr': ('choice', [False, True]),
+    'warmup_epochs': ('uniform', 0.0, 5.0),
+    'momentum': ('uniform', 0.8, 0.98),
+    'weight_decay': ('log', 1e-5, 1e-3),
+    'degrees': ('uniform', 0.0, 20.0),
+    'translate': ('uniform', 0.0, 0.3),
+    'scale': ('uniform', 0.2, 0.9),
+    'shear': ('uniform', 0.0, 5.0),
+    'hsv_h': ('uniform', 0.0, 0.03),
+    'mosaic': ('uniform', 0.5, 1.0),
+    'mixup': ('uniform', 0.0, 0.3),
+    'copy_paste': ('uniform', 0.0, 0.5),
+    'cls': ('uniform', 0.3, 1.5),
+}
+# ===================================
+
+FIELDS = ['trial', 'bracket', 'rung', 'fraction', 'imgsz', 'epochs', 'status', 'map50', 'map50_95', 'minutes',
+          'error', 'params']
+
+
+def sample_config(rng, space=SEARCH_SPACE):
+    config = {}
+    for name, (kind, *spec) in space.items():
+        if kind == 'choice':
+            config[name] = rng.choice(spec[0])
+        elif kind == 'log':
+            config[name] = float(f"{math.exp(rng.uniform(math.log(spec[0]), math.log(spec[1]))):.3g}")
+        elif kind == 'uniform':
+            config[name] = float(f"{rng.uniform(spec[0], spec[1]):.3g}")
+        else:
+            raise ValueError(f"unknown search space kind '{kind}' for {name}")
+    return config
+
+
+def brackets(n_rungs, n_configs, eta, hyperband=False):
+    """(first rung, configurations) per bracket; plain successive halving is the first Hyperband bracket"""
+    if not hyperband:
+        return [(0, n_configs)]
+    s_max = n_rungs - 1
+    return [(s_max - s, math.ceil(n_configs * (s_max + 1) / (s + 1) / eta ** (s_max - s)))
+            for s in range(s_max, -1, -1)]
+
+
+def rung_dataset(source, fraction, out_dir, seed=0):
+    """Virtual dataset with a class-covering fraction of train (and of val); reused when it exists.
+
+    Every image is symlinked with its label written under the rung's own
+    folder, so the Ultralytics labels.cache of a rung lives there instead of
+    in the source dataset, where each subset would overwrite it.
+    """
+    source_key = hashlib.blake2b(str(Path(source).resolve()).encode(), digest_size=4).hexdigest()
+    out_dir = Path(out_dir) / f"data_{Path(source).name}_{source_key}_s{seed}_{fraction:g}"
+    yaml_path = out_dir / 'data.yaml'
+    if yaml_path.exists():
+        return yaml_path
+
+    manifest = load_dataset(source)
+    subset = new_manifest(manifest['names'])
+    for split, entries in manifest['splits'].items():
+        if fraction < 1.0:
+            size = round(fraction * len(entries))
+            if split != 'train':
+                size = max(size, MIN_VAL_IMAGES)
+            entries = [entries[i] for i in select_proxy(entries, size, seed=seed)]
+        # explicit boxes make write_yolo_lists place the image and its label in out_dir
+        subset['splits'][split] = [dict(e, boxes=read_boxes(e)) for e in entries]
+    save_virtual_dataset(subset, out_dir)
+    sizes = ', '.join(f"{split} {len(entries):,}" for split, entries in subset['splits'].items())
+    print(f"📦 Rung data {fraction:g}: {sizes}")
+    return yaml_path
+
+
+def build_label_cache(data):
+    """Write a rung's labels.cache once, before parallel trials would all race to create it"""
+    from ultralytics.data import YOLODataset
+    from ultralytics.data.utils import check_det_dataset
+
+    info = check_det_dataset(str(data))
+    for split in ('train', 'val'):
+        if info.get(split):
+            YOLODataset(img_path=info[split], data=info, task='detect', augment=False)
+
+
+def _run_trial(job):
+    """mAP50, mAP50-95 and minutes of one configuration at one rung; runs in its own process"""
+    name, params, data, imgsz, epochs, model, threads, settings, project = job
+    start = time.perf_counter()
+    apply_threads(threads, 1)
+    from ultralytics import YOLO
+
+    yolo = YOLO(model)
+    # val=False still validates after the last epoch, which is all a rung needs
+    yolo.train(data=str(data), imgsz=imgsz, epochs=epochs, device='cpu', val=False, plots=False, verbose=False,
+               project=str(project), name=name, exist_ok=True, seed=0, trainer=keep_workers(), **settings, **params)
+    metrics = yolo.trainer.metrics
+    return (metrics.get('metrics/mAP50(B)', 0.0), metrics.get('metrics/mAP50-95(B)', 0.0),
+            (time.perf_counter() - start) / 60)
+
+
+def read_results(path):
+    """Rows of an earlier (possibly interrupted) search, keyed by (trial, rung)"""
+    if not Path(path).exists():
+        return {}
+    with open(path, newline='') as f:
+        return {(row['trial'], int(row['rung'])): row for row in csv.DictReader(f)}
+
+
+def append_result(path, row):
+    path = Path(path)
+    new = not path.exists()
+    with open(path, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        if new:
+            writer.writeheader()
+        writer.writerow(row)
+
+
+def run_rung(trials, bracket, rung, data, model, parallel, settings, out_dir, done, rungs=RUNGS):
+    """Score every trial at a rung, reusing finished rows; returns {trial: mAP50-95}"""
+    fraction, imgsz, epochs = rungs[rung]
+    results_path = out_dir / 'results.csv'
+    scores = {}
+    pending = []
+    for trial, params in trials.items():
+        row = done.get((trial, rung))
+        if row is None:
+            pending.append((trial, params))
+        else:
+            scores[trial] = float(row['map50_95']) if row['status'] == 'ok' else -1.0
+
+    print(f"\n🪜 Bracket {bracket}, rung {rung}: {len(trials)} configs at {fraction:g} of the data, "
+          f"{imgsz}px, {epochs} epochs ({len(scores)} already done)")
+    if not pending:
+        return scores
+
+    build_label_cache(data)
+    threads = max(1, CORES // parallel)
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=parallel, mp_context=context) as pool:
+        futures = {pool.submit(_run_trial, (f"{trial}_r{rung}", params, data, imgsz, epochs, model, threads,
+                                             settings, out_dir / 'trials')): (trial, params)
+                   for trial, params in pending}
+        for future in as_completed(futures):
+            trial, params = futures[future]
+            row = {'trial': trial, 'bracket': bracket, 'rung': rung, 'fraction': fraction, 'imgsz': imgsz,
+                   'epochs': epochs, 'params': json.dumps(params)}
+            try:
+                map50, map50_95, minutes = future.result()
+                row.update(status='ok', map50=round(map50, 4), map50_95=round(map50_95, 4),
+                           minutes=round(minutes, 1))
+                scores[trial] = map50_95
+                print(f"  {trial:<8} mAP50-95 {map50_95:.4f}  mAP50 {map50:.4f}  {minutes:5.1f} min")
+            except Exception as e:  # a diverging or out-of-memory trial just drops out
+                row.update(status='failed', error=str(e) or type(e).__name__)
+                scores[trial] = -1.0
+                print(f"  {trial:<8} ❌ {row['error']}")
+            append_result(results_path, row)
+            done[(trial, rung)] = row
+    return scores
+
+
+def hpsearch(source=DATASET_PATH, model=MODEL, n_configs=N_CONFIGS, eta=ETA, rungs=RUNGS, parallel=PARALLEL,
+             hyperband=False, out_dir=OUTPUT_DIR, seed=0):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    done = read_results(out_dir / 'results.csv')
+    # batch from autotune.py; loader workers stay low and nothing is cached in RAM because trials share the machine
+    config = load_train_config()
+    settings = {'batch': config['batch'], 'workers': min(config['workers'], 2)}
+
+    print("=" * 60)
+    print(f"🔬 HYPERPARAMETER SEARCH ({'Hyperband' if hyperband else 'successive halving'}, eta {eta})")
+    print("=" * 60)
+    print(f"{model} on {source}, {parallel} trials at a time, {max(1, CORES // parallel)} threads each")
+    if done:
+        print(f"♻️  Resuming: {len(done)} finished trials in {out_dir / 'results.csv'}")
+
+    rng = random.Random(seed)
+    finals = []
+    for bracket, (first_rung, count) in enumerate(brackets(len(rungs), n_configs, eta, hyperband)):
+        trials = {f"b{bracket}c{i:02d}": sample_config(rng) for i in range(count)}
+        # a resumed search keeps the configurations it recorded
+        for (trial, _), row in done.items():
+            if trial in trials:
+                trials[trial] = json.loads(row['params'])
+
+        for rung in range(first_rung, len(rungs)):
+            data = rung_dataset(source, rungs[rung][0], out_dir, seed)
+            scores = run_rung(trials, bracket, rung, data, model, parallel, settings, out_dir, done, rungs)
+            ranked = sorted(trials, key=lambda t: scores[t], reverse=True)
+            if rung == len(rungs) - 1:
+                finals += [(scores[t], t, trials[t]) for t in ranked]
+                break
+            keep = max(1, len(trials) // eta)
+            print(f"  ⬆️  Promoting {', '.join(ranked[:keep])}")
+            trials = {t: trials[t] for t in ranked[:keep]}
+
+    finals.sort(key=lambda f: f[0], reverse=True)
+    best_score, best_trial, best_params = finals[0]
+    if best_score < 0:
+        print("\n❌ Every full-budget trial failed")
+        return None
+
+    print("\n" + "=" * 60)
+    print("🏆 FULL-BUDGET RESULTS")
+    print("=" * 60)
+    for score, trial, _ in finals:
+        print(f"  {trial:<8} mAP50-95 {score:.4f}")
+    print(f"\n✅ Best: {best_trial} ({best_score:.4f})")
+    for name, value in best_params.items():
+        print(f"   {name:<14} {value}")
+
+    hyp_path = out_dir / 'best_hyp.yaml'
+    with open(hyp_path, 'w') as f:
+        yaml.safe_dump(best_params, f, sort_keys=False)
+    print(f"📄 Results: {out_dir / 'results.csv'}")
+    print(f"📄 Hyperparameters: {hyp_path} (python train.py --hyp {hyp_path})")
+    return best_params
+
+
+def parse_rung(value):
+    """'fraction,imgsz,epochs' -> (float, int, int)"""
+    try:
+        fraction, imgsz, epochs = value.split(',')
+        return float(fraction), int(imgsz), int(epochs)
+    except ValueError:
+        raise argparse.ArgumentTypeError("rung must be fraction,imgsz,epochs (e.g. 0.25,416,6)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Successive-halving hyperparameter search on dataset subsamples')
+    parser.add_argument('--data', default=DATASET_PATH, help='Dataset folder or manifest')
+    parser.add_argument('--model', default=MODEL, help='Model to train')
+    parser.add_argument('--configs', type=int, default=N_CONFIGS, help='Configurations sampled for the first rung')
+    parser.add_argument('--eta', type=int, default=ETA, help='Keep the best 1/eta at each rung')
+    parser.add_argument('--rung', type=parse_rung, nargs='+', default=RUNGS, dest='rungs',
+                        help='Budgets as fraction,imgsz,epochs from cheapest to full')
+    parser.add_argument('--parallel', type=int, default=PARALLEL, help='Trials trained at once')
+    parser.add_argument('--hyperband', action='store_true', help='Run all Hyperband brackets')
+    parser.add_argument('--seed', type=int, default=0, help='Sampling and subsampling seed')
+    parser.add_argument('--output', type=Path, default=OUTPUT_DIR, help='Output folder (rerun to resume)')
+    args = parser.parse_args(argv)
+
+    hpsearch(args.data, args.model, args.configs, args.eta, args.rungs, args.parallel, args.hyperband, args.output,
+             args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,16 @@
 # material_based_merger.py
-import json
 from pathlib import Path
-import yaml
-import shutil
+import argparse
 from collections import Counter
 
+import numpy as np
+
+from dataset_manifest import add_entry, load_dataset, new_manifest, save_virtual_dataset
+
 # ========== CONFIGURATION ==========
 DATASET_PATH = Path("/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/yolo_taco")
-ORIGINAL_YAML = DATASET_PATH / "data.yaml"
 MERGED_DATASET_PATH = DATASET_PATH.parent / "yolo_taco_material_merged"
+NUM_TACO_CLASSES = 60
 # ===================================
 
 def get_material_based_groups():
@@ -113,38 +115,55 @@ def get_material_based_groups():
     
     return material_groups
 
-def analyze_all_splits():
-    """Analyze class distribution across ALL splits"""
+def pack_labels(entries):
+    """Read the labels of one split into flat NumPy arrays in a single pass.
+
+    Returns (classes, coords, counts): classes[N] and coords[N, 4] hold every
+    box of the split back to back, counts[i] is the number of boxes of entry i.
+    """
+    values = []
+    counts = np.zeros(len(entries), dtype=np.int64)
+
+    for i, entry in enumerate(entries):
+        n = 0
+        if 'boxes' in entry:
+            for box in entry['boxes']:
+                values.extend(box[:5])
+                n += 1
+        elif 'label' in entry:
+            try:
+                text = Path(entry['label']).read_text()
+            except OSError:
+                text = ''
+            for line in text.splitlines():
+                parts = line.split()
+                if len(parts) >= 5:
+                    values.extend(parts[:5])
+                    n += 1
+        counts[i] = n
+
+    packed = np.array(values, dtype=np.float64).reshape(-1, 5)
+    return packed[:, 0].astype(np.int64), packed[:, 1:], counts
+
+def analyze_all_splits(packed_splits, num_classes=NUM_TACO_CLASSES):
+    """Measure the class distribution (boxes per class) of every split"""
     
     print("📊 Analyzing class distribution across all splits...")
     
-    # Your provided distributions
-    train_dist = {59: 503, 36: 333, 58: 321, 29: 206, 39: 191, 5: 176, 12: 152, 7: 133, 9: 130, 
-                  55: 98, 57: 79, 14: 76, 6: 75, 21: 73, 50: 71, 8: 62, 27: 58, 17: 55, 33: 51, 
-                  0: 49, 40: 43, 20: 42, 16: 35, 4: 33, 31: 31, 10: 29, 42: 27, 38: 25, 45: 24, 
-                  34: 21, 18: 21, 51: 18, 49: 18, 15: 9, 22: 9, 46: 9, 52: 8, 28: 8, 25: 7, 
-                  11: 7, 43: 7, 54: 6, 2: 6, 53: 5, 47: 5, 30: 5, 32: 5, 37: 4, 26: 4, 44: 3, 
-                  56: 3, 48: 3, 41: 3, 23: 3, 19: 2, 13: 2, 1: 2, 24: 1}
-    
-    val_dist = {58: 162, 59: 113, 36: 83, 5: 77, 7: 52, 12: 52, 55: 52, 39: 52, 29: 44, 
-                21: 27, 6: 24, 57: 22, 20: 20, 33: 18, 50: 16, 27: 15, 8: 14, 52: 12, 
-                49: 12, 14: 12, 45: 11, 40: 11, 51: 10, 31: 10, 42: 9, 0: 9, 4: 9, 18: 8, 
-                9: 7, 30: 7, 46: 6, 17: 6, 16: 5, 32: 5, 34: 5, 22: 4, 10: 3, 23: 3, 11: 3, 
-                38: 3, 43: 2, 28: 2, 26: 2, 25: 1, 53: 1, 15: 1, 37: 1, 54: 1, 44: 1, 56: 1, 
-                19: 1, 3: 1}
-    
-    test_dist = {59: 51, 36: 35, 58: 34, 5: 32, 12: 25, 7: 24, 29: 23, 39: 17, 33: 13, 
-                 50: 12, 57: 11, 4: 8, 49: 7, 55: 7, 40: 7, 20: 5, 16: 5, 6: 5, 14: 5, 
-                 21: 4, 8: 4, 27: 4, 0: 4, 42: 3, 45: 3, 13: 3, 38: 3, 17: 3, 32: 2, 
-                 10: 2, 34: 1, 24: 1, 18: 1, 48: 1, 15: 1, 51: 1, 53: 1, 47: 1, 9: 1, 31: 1}
+    # Class ids beyond the expected range still get counted
+    for classes, _, _ in packed_splits.values():
+        if len(classes):
+            num_classes = max(num_classes, int(classes.max()) + 1)
     
-    # Combine all splits
-    total_dist = Counter()
-    for dist in [train_dist, val_dist, test_dist]:
-        total_dist.update(dist)
+    split_counts = {}
+    for split, (classes, _, counts) in packed_splits.items():
+        split_counts[split] = np.bincount(classes, minlength=num_classes)
+        print(f"  {split}: {len(counts)} images, {len(classes)} boxes")
     
-    # Convert to array for all 60 classes
-    total_counts = [total_dist.get(i, 0) for i in range(60)]
+    # Combine all splits
+    total = np.sum(list(split_counts.values()), axis=0) if split_counts else np.zeros(num_classes, dtype=np.int64)
+    total_counts = total.tolist()
+    total_dist = Counter({i: int(c) for i, c in enumerate(total_counts) if c})
     
     return total_counts, total_dist
 
@@ -154,14 +173,14 @@ def create_material_based_merge(total_counts):
     print(f"\n🔀 Creating material-based merge mapping...")
     
     material_groups = get_material_based_groups()
-    
-    # Load original names
-    with open(ORIGINAL_YAML, 'r') as f:
-        original_config = yaml.safe_load(f)
-    original_names = original_config['names']
+    display_names = {
+        'plastic': "Plastic", 'glass': "Glass", 'metal': "Metal", 'cardboard': "Cardboard",
+        'paper': "Paper", 'special': "Special_Waste", 'misc': "Unlabeled_Litter", 'cigarette': "Cigarette",
+    }
     
     # Start assigning new IDs
     merge_map = {}
+    material_names = []
     new_id_counter = 0
     
     print(f"\n📦 Material Groups:")
@@ -179,43 +198,25 @@ def create_material_based_merge(total_counts):
         # Assign all classes in this group to the same new ID
         for class_id in class_ids:
             merge_map[class_id] = new_id_counter
+        material_names.append(display_names.get(material, material.title()))
         
         new_id_counter += 1
     
-    # Check for any unassigned classes
-    unassigned = [i for i in range(60) if i not in merge_map]
+    # Check for any unassigned classes (including groups without samples)
+    unassigned = [i for i in range(len(total_counts)) if i not in merge_map]
     if unassigned:
         print(f"\n⚠️  {len(unassigned)} unassigned classes: {unassigned}")
         for class_id in unassigned:
             merge_map[class_id] = new_id_counter
+        material_names.append("Other")
         new_id_counter += 1
     
     num_final_classes = len(set(merge_map.values()))
     
     print(f"\n📊 Merge summary:")
-    print(f"  Original: 60 classes")
+    print(f"  Original: {len(total_counts)} classes")
     print(f"  Merged: {num_final_classes} material-based classes")
     
-    # Create material-based names
-    material_names = []
-    for material in material_groups.keys():
-        if material == 'plastic':
-            material_names.append("Plastic")
-        elif material == 'glass':
-            material_names.append("Glass")
-        elif material == 'metal':
-            material_names.append("Metal")
-        elif material == 'cardboard':
-            material_names.append("Cardboard")
-        elif material == 'paper':
-            material_names.append("Paper")
-        elif material == 'special':
-            material_names.append("Special_Waste")
-        elif material == 'misc':
-            material_names.append("Unlabeled_Litter")
-        elif material == 'cigarette':
-            material_names.append("Cigarette")
-    
     return merge_map, num_final_classes, material_names
 
 def simple_material_merge():
@@ -257,101 +258,38 @@ def simple_material_merge():
     
     return merge_map, len(material_names), material_names
 
-def merge_dataset_simple():
-    """Simple material-based merge"""
-    
-    print("=" * 60)
-    print("🔄 MATERIAL-BASED CLASS MERGER")
-    print("=" * 60)
-    
-    # Get simple material merge
-    merge_map, num_merged_classes, material_names = simple_material_merge()
-    
-    # Load original names for reporting
-    with open(ORIGINAL_YAML, 'r') as f:
-        original_config = yaml.safe_load(f)
-    original_names = original_config['names']
-    
-    # Create new dataset directory
-    MERGED_DATASET_PATH.mkdir(parents=True, exist_ok=True)
-    
-    # Process each split
-    splits = ['train', 'val', 'test']
-    total_updated = 0
-    
-    for split in splits:
-        print(f"\n📁 Processing {split} split...")
-        
-        # Create directories
-        images_dir = MERGED_DATASET_PATH / split / 'images'
-        labels_dir = MERGED_DATASET_PATH / split / 'labels'
-        images_dir.mkdir(parents=True, exist_ok=True)
-        labels_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Copy images
-        src_images = DATASET_PATH / split / 'images'
-        if src_images.exists():
-            image_files = list(src_images.glob("*"))
-            for img_file in image_files:
-                shutil.copy2(img_file, images_dir / img_file.name)
-            print(f"  Copied {len(image_files)} images")
-        
-        # Update label files
-        src_labels = DATASET_PATH / split / 'labels'
-        if src_labels.exists():
-            label_files = list(src_labels.glob("*.txt"))
-            updated = 0
-            
-            for label_file in label_files:
-                new_lines = []
-                
-                with open(label_file, 'r') as f:
-                    lines = f.readlines()
-                
-                for line in lines:
-                    parts = line.strip().split()
-                    if len(parts) >= 5:
-                        old_class_id = int(parts[0])
-                        new_class_id = merge_map.get(old_class_id, old_class_id)
-                        parts[0] = str(new_class_id)
-                        new_lines.append(' '.join(parts))
-                
-                if new_lines:
-                    output_file = labels_dir / label_file.name
-                    with open(output_file, 'w') as f:
-                        f.write('\n'.join(new_lines))
-                    updated += 1
-            
-            print(f"  Updated {updated} label files")
-            total_updated += updated
-    
-    # Create new data.yaml
-    new_config = {
-        'path': str(MERGED_DATASET_PATH.absolute()),
-        'train': 'train/images',
-        'val': 'val/images',
-        'test': 'test/images',
-        'nc': num_merged_classes,
-        'names': material_names
-    }
-    
-    new_yaml = MERGED_DATASET_PATH / "data.yaml"
-    with open(new_yaml, 'w') as f:
-        yaml.dump(new_config, f, default_flow_style=False)
-    
-    print(f"\n" + "=" * 60)
-    print("🎉 MATERIAL MERGE COMPLETE!")
-    print("=" * 60)
-    print(f"\n📁 New dataset: {MERGED_DATASET_PATH}")
-    print(f"📊 60 classes → {num_merged_classes} material categories")
-    
-    # Create simple report
+def build_lookup_table(merge_map, num_classes):
+    """Dense old-id -> new-id array; ids missing from merge_map keep their value"""
+    size = max(num_classes, max(merge_map, default=-1) + 1)
+    lut = np.arange(size, dtype=np.int64)
+    for old_id, new_id in merge_map.items():
+        lut[old_id] = new_id
+    return lut
+    
+# Named merge schemes: scheme(total_counts) -> (merge_map, num_classes, names)
+MERGE_SCHEMES = {
+    'simple_material': lambda total_counts: simple_material_merge(),
+    'material_groups': create_material_based_merge,
+}
+    
+def scheme_output_path(scheme, source=DATASET_PATH):
+    """Output next to the source: yolo_taco -> yolo_taco_material_merged / yolo_taco_<scheme>"""
+    source = Path(source)
+    if source == DATASET_PATH and scheme == 'simple_material':
+        return MERGED_DATASET_PATH
+    if scheme == 'simple_material':
+        return source.parent / f"{source.name}_material_merged"
+    return source.parent / f"{source.name}_{scheme}"
+    
+def write_merge_report(output, merge_map, material_names, original_names, split_before, split_after):
+    """Material merge report with the measured per-split distributions"""
+    num_original = len(original_names) if original_names else 60
     report = [
         "=" * 60,
         "MATERIAL-BASED CLASS MERGING",
         "=" * 60,
-        f"\nOriginal: 60 specific trash items",
-        f"Merged: {num_merged_classes} material categories",
+        f"\nOriginal: {num_original} specific trash items",
+        f"Merged: {len(material_names)} material categories",
         f"\nMaterial Categories:",
         "-" * 40
     ]
@@ -361,7 +299,8 @@ def merge_dataset_simple():
         original_in_material = []
         for old_id, new_id in merge_map.items():
             if new_id == i:
-                original_in_material.append(f"{old_id}: {original_names[old_id]}")
+                name = original_names[old_id] if old_id < len(original_names) else old_id
+                original_in_material.append(f"{old_id}: {name}")
         
         report.append(f"\n{i}: {material}")
         report.append(f"  Contains {len(original_in_material)} original classes:")
@@ -370,15 +309,98 @@ def merge_dataset_simple():
         if len(original_in_material) > 5:
             report.append(f"    ... and {len(original_in_material)-5} more")
     
-    report_file = MERGED_DATASET_PATH / "material_merge_report.txt"
+    report.extend(["", "MEASURED DISTRIBUTION (boxes per class)", "-" * 40])
+    for split in split_after:
+        report.append(f"\n{split}: {int(split_before[split].sum())} boxes")
+        for i, material in enumerate(material_names):
+            report.append(f"  {i}: {material}: {int(split_after[split][i])}")
+    
+    report_file = Path(output) / "material_merge_report.txt"
     with open(report_file, 'w') as f:
         f.write('\n'.join(report))
+    return report_file
+    
+def merge_dataset(source=DATASET_PATH, schemes=('simple_material',), outputs=None):
+    """Apply one or more merge schemes to a dataset in a single pass.
+    
+    Labels of each split are read once into packed arrays, every scheme is a
+    NumPy lookup table applied to all boxes of a split at once, and the
+    outputs are virtual datasets that share the source images.
+    """
     
-    print(f"📄 Report: {report_file}")
-    print(f"\n🚀 Train with: yolo train data={new_yaml} model=yolov8x.pt epochs=300")
+    print("=" * 60)
+    print("🔄 MATERIAL-BASED CLASS MERGER")
+    print("=" * 60)
+    
+    manifest = load_dataset(source)
+    original_names = manifest['names']
+    num_classes = max(len(original_names), NUM_TACO_CLASSES)
     
-    return MERGED_DATASET_PATH
+    packed_splits = {split: pack_labels(entries) for split, entries in manifest['splits'].items()}
+    total_counts, _ = analyze_all_splits(packed_splits, num_classes)
+    num_classes = len(total_counts)
+    
+    outputs = outputs or {}
+    results = {}
+    
+    for scheme in schemes:
+        merge_map, num_merged_classes, material_names = MERGE_SCHEMES[scheme](total_counts)
+        lut = build_lookup_table(merge_map, num_classes)
+        output = Path(outputs.get(scheme, scheme_output_path(scheme, source)))
+        
+        merged = new_manifest(material_names)
+        split_before, split_after = {}, {}
+        
+        for split, entries in manifest['splits'].items():
+            classes, coords, counts = packed_splits[split]
+            new_classes = lut[classes]
+            
+            split_before[split] = np.bincount(classes, minlength=num_classes)
+            split_after[split] = np.bincount(new_classes, minlength=num_merged_classes)
+            
+            # Unpack per image; entries without a label stay background images
+            new_classes = new_classes.tolist()
+            coords = coords.tolist()
+            start = 0
+            for entry, n in zip(entries, counts.tolist()):
+                boxes = None
+                if 'boxes' in entry or 'label' in entry:
+                    boxes = [[c] + xywh for c, xywh in zip(new_classes[start:start + n], coords[start:start + n])]
+                add_entry(merged, split, entry['image'], boxes=boxes)
+                start += n
+            
+            dist = ", ".join(f"{material_names[i] if i < len(material_names) else i}={c}"
+                             for i, c in enumerate(split_after[split].tolist()))
+            print(f"  {split}: {dist}")
+        
+        yaml_path = save_virtual_dataset(merged, output)
+        report_file = write_merge_report(output, merge_map, material_names, original_names,
+                                         split_before, split_after)
+        
+        print(f"\n📁 {scheme}: {output} ({num_classes} → {num_merged_classes} classes, images shared)")
+        print(f"📄 Report: {report_file}")
+        print(f"🚀 Train with: yolo train data={yaml_path} model=yolov8x.pt epochs=300")
+        results[scheme] = output
+    
+    print(f"\n" + "=" * 60)
+    print("🎉 MATERIAL MERGE COMPLETE!")
+    print("=" * 60)
+    
+    return results
+
+def merge_dataset_simple():
+    """Simple material-based merge"""
+    return merge_dataset(DATASET_PATH, ['simple_material'])['simple_material']
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Merge the 60 TACO classes into material categories')
+    parser.add_argument('--source', type=Path, default=DATASET_PATH,
+                        help='YOLO folder, manifest.json or folder holding one')
+    parser.add_argument('--schemes', nargs='+', choices=list(MERGE_SCHEMES), default=['simple_material'],
+                        help='Merge schemes to generate side by side')
+    args = parser.parse_args(argv)
+
+    merge_dataset(args.source, args.schemes)
 
 if __name__ == "__main__":
-    # Run the simple material merge
-    merged_path = merge_dataset_simple()
\ No newline at end of file
+    main()
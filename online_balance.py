@@ -0,0 +1,279 @@
+# online_balance.py
+# Class balancing inside the training data loader instead of offline.
+#
+# balance_dataset.py writes (TARGET_SAMPLES_PER_CLASS - count) augmented JPEGs
+# per minority class. Here the same samples are drawn on the fly: an epoch
+# holds every original image once plus the same number of "extra" slots the
+# offline stage would have written. Each extra slot picks a class c with
+# probability needed_c / total_needed, then a random image containing c, and
+# augments it with the same get_augmentation_pipeline() tier c would get
+# offline. The expected per-class sample counts match the offline dataset,
+# but every epoch sees fresh augmentations and nothing is written to disk.
+#
+#   python online_balance.py plan --input data
+#   python online_balance.py bench --input data --workers 4
+#
+#   from ultralytics import YOLO
+#   from online_balance import balanced_detection_trainer
+#   YOLO('yolo11s.pt').train(data='data/dataset.yaml', trainer=balanced_detection_trainer(500))
+import argparse
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from dataset_manifest import load_dataset, read_boxes
+
+# ========== CONFIGURATION ==========
+INPUT_DIR = "/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/data"
+TARGET_SAMPLES_PER_CLASS = 500
+IMGSZ = 640             # bench: the loader resizes the long side to this before the tier
+WORKERS = os.cpu_count() or 1
+# ===================================
+
+
+class BalancedSchedule:
+    """Epoch layout of an online-balanced training split.
+
+    class_lists holds the class id of every box per image (box counts, as in
+    balance_dataset.py). Indices below num_images are the originals; the
+    following num_extra indices are drawn by draw() with class rarity weights.
+    """
+
+    def __init__(self, class_lists, target=TARGET_SAMPLES_PER_CLASS):
+        self.num_images = len(class_lists)
+        self.target = target
+        self.class_counts = Counter(int(c) for classes in class_lists for c in classes)
+
+        self.images_with = {}
+        for i, classes in enumerate(class_lists):
+            for c in set(int(c) for c in classes):
+                self.images_with.setdefault(c, []).append(i)
+
+        self.needed = {c: target - n for c, n in self.class_counts.items() if n < target}
+        self.classes = sorted(self.needed)
+        self.cum_needed = np.cumsum([self.needed[c] for c in self.classes])
+        self.num_extra = int(self.cum_needed[-1]) if self.classes else 0
+
+    def __len__(self):
+        return self.num_images + self.num_extra
+
+    def draw(self, index, rng=random):
+        """(image index, class whose augmentation tier applies or None) for an epoch slot"""
+        if index < self.num_images:
+            return index, None
+        k = int(np.searchsorted(self.cum_needed, rng.random() * self.num_extra, side='right'))
+        class_id = self.classes[min(k, len(self.classes) - 1)]
+        return rng.choice(self.images_with[class_id]), class_id
+
+    def image_weights(self):
+        """Expected extra draws per image: sum over its classes of needed_c / images_c"""
+        weights = np.zeros(self.num_images)
+        for c, n in self.needed.items():
+            weights[self.images_with[c]] += n / len(self.images_with[c])
+        return weights
+
+
+class TierPipelines:
+    """get_augmentation_pipeline() per class, built lazily in each worker process"""
+
+    def __init__(self, class_counts, target):
+        self.class_counts = class_counts
+        self.target = target
+        self._cache = {}
+
+    def __getstate__(self):
+        return {'class_counts': self.class_counts, 'target': self.target, '_cache': {}}
+
+    def __call__(self, class_id):
+        if class_id not in self._cache:
+            from balance_dataset import get_augmentation_pipeline
+            # The loader's image keeps its aspect ratio; a square resize would distort the oversampled classes
+            self._cache[class_id] = get_augmentation_pipeline(
+                class_id, self.class_counts[class_id], self.target, resize=False)
+        return self._cache[class_id]
+
+
+def augment_pixel_boxes(pipeline, img, boxes, classes):
+    """Run a tier on an image with pixel xyxy boxes; returns (img, boxes, classes)"""
+    h, w = img.shape[:2]
+    boxes = np.clip(np.asarray(boxes, dtype=np.float32).reshape(-1, 4), 0, [w, h, w, h])
+    valid = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+    out = pipeline(image=img, bboxes=boxes[valid].tolist(),
+                   class_labels=[int(c) for c in np.asarray(classes).reshape(-1)[valid]])
+    return (out['image'], np.array(out['bboxes'], dtype=np.float32).reshape(-1, 4),
+            np.array(out['class_labels'], dtype=np.float32).reshape(-1))
+
+
+def _ultralytics_dataset_class():
+    from ultralytics.data import YOLODataset
+    from ultralytics.utils.instance import Instances
+
+    class BalancedYOLODataset(YOLODataset):
+        """Training split with the BalancedSchedule extra slots appended"""
+
+        def __init__(self, *args, target=TARGET_SAMPLES_PER_CLASS, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.schedule = BalancedSchedule([label['cls'].reshape(-1) for label in self.labels], target)
+            self.pipelines = TierPipelines(self.schedule.class_counts, target)
+
+        def __len__(self):
+            return len(self.schedule)
+
+        def get_image_and_label(self, index):
+            # Mosaic/MixUp pick partners with randint(0, len(self) - 1), which can land on an extra slot
+            if index >= self.schedule.num_images:
+                index, _ = self.schedule.draw(index)
+            return super().get_image_and_label(index)
+
+        def __getitem__(self, index):
+            # Python's random is reseeded per DataLoader worker, so workers draw differently
+            i, class_id = self.schedule.draw(index)
+            label = self.get_image_and_label(i)
+            if class_id is not None:
+                label = self.augment_tier(label, class_id)
+            return self.transforms(label)
+
+        def augment_tier(self, label, class_id):
+            instances = label['instances']
+            h, w = label['img'].shape[:2]
+            instances.convert_bbox('xyxy')
+            instances.denormalize(w, h)
+            img, boxes, classes = augment_pixel_boxes(
+                self.pipelines(class_id), label['img'], instances.bboxes, label['cls'])
+            label['img'] = img
+            label['cls'] = classes.reshape(-1, 1)
+            label['instances'] = Instances(boxes, segments=np.zeros((0, 1000, 2), dtype=np.float32),
+                                           bbox_format='xyxy', normalized=False)
+            label['resized_shape'] = img.shape[:2]
+            return label
+
+    return BalancedYOLODataset
+
+
+def balanced_detection_trainer(target=TARGET_SAMPLES_PER_CLASS):
+    """DetectionTrainer whose training dataset is balanced online (validation is untouched)"""
+    from ultralytics.data import build_yolo_dataset
+    from ultralytics.models.yolo.detect import DetectionTrainer
+    from ultralytics.utils import colorstr
+
+    dataset_class = _ultralytics_dataset_class()
+
+    class BalancedDetectionTrainer(DetectionTrainer):
+        def build_dataset(self, img_path, mode='train', batch=None):
+            stride = max(int(self.model.stride.max() if self.model else 0), 32)
+            if mode != 'train':
+                return build_yolo_dataset(self.args, img_path, batch, self.data, mode=mode,
+                                          rect=mode == 'val', stride=stride)
+            return dataset_class(
+                img_path=img_path,
+                imgsz=self.args.imgsz,
+                batch_size=batch,
+                augment=True,
+                hyp=self.args,
+                rect=False,
+                cache=self.args.cache or None,
+                single_cls=self.args.single_cls or False,
+                stride=stride,
+                pad=0.0,
+                prefix=colorstr(f"{mode}: "),
+                task=self.args.task,
+                classes=self.args.classes,
+                data=self.data,
+                target=target,
+            )
+
+    return BalancedDetectionTrainer
+
+
+def load_schedule(input_dir, target):
+    dataset = load_dataset(input_dir)
+    entries = [e for e in dataset['splits'].get('train', []) if 'boxes' in e or 'label' in e]
+    boxes = [read_boxes(e) for e in entries]
+    return entries, boxes, BalancedSchedule([[b[0] for b in bs] for bs in boxes], target)
+
+
+def _bench_sample(job):
+    """Load one image and apply its tier, as a loader worker would"""
+    import cv2
+
+    from balance_dataset import get_augmentation_pipeline, yolo_boxes_to_annotations
+    from resize_cache import resize_long_side
+
+    path, boxes, class_id, count, target, imgsz = job
+    img = cv2.imread(path)
+    if img is None or class_id is None:
+        return img is not None
+    img = resize_long_side(img, imgsz)
+    anns = yolo_boxes_to_annotations(boxes, img.shape[1], img.shape[0])
+    pipeline = get_augmentation_pipeline(class_id, count, target, resize=False)
+    augment_pixel_boxes(pipeline, img, [a['bbox'] for a in anns], [a['class_id'] for a in anns])
+    return True
+
+
+def plan(input_dir=INPUT_DIR, target=TARGET_SAMPLES_PER_CLASS):
+    entries, _, schedule = load_schedule(input_dir, target)
+    print(f"📊 {schedule.num_images:,} training images, target {target} samples per class\n")
+    for c in sorted(schedule.class_counts):
+        extra = schedule.needed.get(c, 0)
+        print(f"  Class {c}: {schedule.class_counts[c]} → +{extra} augmented draws per epoch")
+
+    weights = schedule.image_weights()
+    sizes = [os.path.getsize(e['image']) for e in entries[:200] if os.path.exists(e['image'])]
+    avg_size = sum(sizes) / max(1, len(sizes))
+    print(f"\nEpoch length: {len(schedule):,} samples ({schedule.num_extra:,} drawn online)")
+    print(f"Most re-drawn image: {weights.max() if len(weights) else 0:.1f} extra draws per epoch")
+    print(f"Disk not written vs balance_dataset.py: ~{schedule.num_extra * avg_size / 1e6:.0f} MB")
+    return schedule
+
+
+def bench(input_dir=INPUT_DIR, target=TARGET_SAMPLES_PER_CLASS, samples=200, workers=WORKERS, seed=0):
+    """Samples/second of online loading (decode + tier) over the extra slots"""
+    entries, boxes, schedule = load_schedule(input_dir, target)
+    if not schedule.num_extra:
+        print("Nothing to balance: every class already reaches the target")
+        return None
+
+    rng = random.Random(seed)
+    jobs = []
+    for _ in range(samples):
+        i, c = schedule.draw(schedule.num_images + rng.randrange(schedule.num_extra), rng)
+        jobs.append((entries[i]['image'], boxes[i], c, schedule.class_counts[c], target, IMGSZ))
+
+    results = {}
+    for n in sorted({1, workers}):
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=n) as pool:
+            list(pool.map(_bench_sample, jobs, chunksize=8))
+        results[n] = samples / (time.perf_counter() - start)
+        print(f"  {n:>2} workers: {results[n]:.1f} augmented samples/s")
+
+    seconds = schedule.num_extra / results[max(results)]
+    print(f"\nOnline balancing costs ~{seconds:.0f}s of loader time per epoch with {max(results)} workers")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Class-balanced sampling with augmentation in the data loader')
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in [('plan', 'Show the per-epoch sampling plan'),
+                            ('bench', 'Measure online augmentation throughput')]:
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument('--input', default=INPUT_DIR, help='YOLO folder, manifest.json or folder holding one')
+        p.add_argument('--target', type=int, default=TARGET_SAMPLES_PER_CLASS, help='Target samples per class')
+    p.add_argument('--samples', type=int, default=200, help='Augmented samples to time')
+    p.add_argument('--workers', type=int, default=WORKERS, help='Loader worker processes')
+    args = parser.parse_args()
+
+    if args.command == 'plan':
+        plan(Path(args.input), args.target)
+    else:
+        bench(Path(args.input), args.target, args.samples, args.workers)
+
+
+if __name__ == "__main__":
+    main()
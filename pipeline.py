@@ -0,0 +1,306 @@
+# pipeline.py
+# Incremental runner for the dataset scripts.
+#
+# Every stage declares the files it reads and writes. A stage runs only when
+# the content hash of its inputs (plus its command line) differs from the one
+# recorded after its last successful run; stages whose inputs are unchanged
+# are skipped, and a stage that rewrites identical outputs does not trigger
+# its dependents. Within a stage, the scripts themselves skip images that are
+# already up to date (link/label mtimes in coco_to_yolo.py, the verify cache,
+# the rename plan), so new images cost time proportional to their number.
+#
+# File hashes are cached by (size, mtime) in .pipeline_state.json, so an
+# unchanged tree is fingerprinted from stat() calls alone.
+#
+#   python pipeline.py                 # run whatever is out of date
+#   python pipeline.py --dry-run       # only show what would run
+#   python pipeline.py --force convert # re-run a stage and everything after it
+import argparse
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+from dataset_utils import HashCache
+
+# ========== CONFIGURATION ==========
+PROJECT_PATH = Path("/home/immaculatapatrickumoh/Documents/EcoWheels_Proj")
+STATE_FILE = ".pipeline_state.json"
+JOBS = 2            # stages run concurrently when they do not depend on each other
+HASH_WORKERS = 16
+# ===================================
+
+SCRIPTS = Path(__file__).resolve().parent
+
+# {org}, {yolo}, ... are folders relative to the project root
+FOLDERS = {
+    'org': 'Org_dataset',
+    'yolo': 'yolo_taco',
+    'merged': 'yolo_taco_material_merged',
+    'balanced': 'balanced_data',
+    'final': 'balanced_final',
+}
+
+# name -> command, input paths/globs, output paths, stages it must run after;
+# 'keep_names' stages must write the class names of their input manifest
+STAGES = {
+    'rename': {
+        'cmd': ['rename_images.py', '--dataset', '{org}'],
+        'inputs': ['{org}/annotations.json', '{org}/batch_*/*'],
+        'outputs': ['{org}/annotations_updated.json'],
+        'after': [],
+    },
+    'verify': {
+        'cmd': ['verify_dataset.py', '--dataset', '{org}', '--full'],
+        'inputs': ['{org}/annotations_updated.json', '{org}/batch_*/*'],
+        'outputs': ['{org}/final_verification_report.txt'],
+        'after': ['rename'],
+    },
+    'convert': {
+        'cmd': ['coco_to_yolo.py', '--dataset', '{org}', '--annotations', '{org}/annotations_updated.json',
+                '--output', '{yolo}', '--virtual'],
+        'inputs': ['{org}/annotations_updated.json', '{org}/batch_*/*'],
+        'outputs': ['{yolo}/manifest.json'],
+        'after': ['rename'],
+    },
+    'duplicates': {
+        'cmd': ['find_duplicates.py', '{yolo}', '--report', '{yolo}/duplicates_report.csv',
+                '--cache', '{yolo}/.phash_cache.json'],
+        'inputs': ['{yolo}/manifest.json'],
+        'outputs': ['{yolo}/duplicates_report.csv'],
+        'after': ['convert'],
+    },
+    'merge': {
+        'cmd': ['material_based_merger.py', '--source', '{yolo}', '--schemes', 'simple_material'],
+        'inputs': ['{yolo}/manifest.json'],
+        'outputs': ['{merged}/manifest.json'],
+        'after': ['convert'],
+    },
+    'balance': {
+        'cmd': ['balance_dataset.py', '--input', '{merged}', '--output', '{balanced}', '--virtual'],
+        'inputs': ['{merged}/manifest.json'],
+        'outputs': ['{balanced}/manifest.json'],
+        'after': ['merge'],
+        'keep_names': True,
+    },
+    'downsample': {
+        'cmd': ['downsample_dataset.py', '--input', '{balanced}', '--output', '{final}', '--virtual'],
+        'inputs': ['{balanced}/manifest.json'],
+        'outputs': ['{final}/manifest.json'],
+        'after': ['balance'],
+        'keep_names': True,
+    },
+}
+
+
+def expand(template, root):
+    return template.format(**{k: str(root / v) for k, v in FOLDERS.items()})
+
+
+def input_files(stage, root):
+    """Sorted list of existing files matched by a stage's input patterns"""
+    files = set()
+    for pattern in STAGES[stage]['inputs']:
+        for path in glob.glob(expand(pattern, root)):
+            if os.path.isfile(path):
+                files.add(path)
+    return sorted(files)
+
+
+def fingerprint(stage, root, cache):
+    """Hash of a stage's command line and the contents of all its input files"""
+    files = input_files(stage, root)
+    hashes, rehashed = cache.hashes(files, HASH_WORKERS)
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps([expand(arg, root) for arg in STAGES[stage]['cmd']]).encode())
+    for path in files:
+        h.update(f"{path}\0{hashes[path]}\n".encode())
+    return h.hexdigest(), len(files), rehashed
+
+
+def names_match(stage, root):
+    """False when a 'keep_names' stage's output manifest has other class names than its input"""
+    spec = STAGES[stage]
+    if not spec.get('keep_names'):
+        return True
+    names = []
+    for path in [spec['inputs'][0], spec['outputs'][0]]:
+        with open(expand(path, root), 'r') as f:
+            names.append(json.load(f).get('names'))
+    return names[0] == names[1]
+
+
+def load_state(root):
+    path = root / STATE_FILE
+    if path.exists():
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {'stages': {}, 'files': {}}
+
+
+def save_state(root, state):
+    tmp = root / (STATE_FILE + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, root / STATE_FILE)
+
+
+def upstream(stages):
+    """The given stages plus every stage they (transitively) run after"""
+    selected = set()
+    todo = list(stages)
+    while todo:
+        name = todo.pop()
+        if name not in selected:
+            selected.add(name)
+            todo.extend(STAGES[name]['after'])
+    return selected
+
+
+def downstream(stages):
+    """The given stages plus every stage that (transitively) runs after them"""
+    selected = set(stages)
+    changed = True
+    while changed:
+        changed = False
+        for name, spec in STAGES.items():
+            if name not in selected and selected & set(spec['after']):
+                selected.add(name)
+                changed = True
+    return selected
+
+
+def run_stage(stage, root, log_dir):
+    """Run one stage script; its output goes to a log file so parallel stages don't interleave"""
+    cmd = [sys.executable, str(SCRIPTS / STAGES[stage]['cmd'][0])]
+    cmd += [expand(arg, root) for arg in STAGES[stage]['cmd'][1:]]
+    log_file = log_dir / f"{stage}.log"
+    start = time.perf_counter()
+    with open(log_file, 'w') as log:
+        code = subprocess.call(cmd, stdout=log, stderr=subprocess.STDOUT, cwd=root)
+    return code, time.perf_counter() - start, log_file
+
+
+def run_pipeline(root=PROJECT_PATH, targets=None, force=(), jobs=JOBS, dry_run=False):
+    root = Path(root).resolve()
+    state = load_state(root)
+    cache = HashCache(state['files'])
+    log_dir = root / '.pipeline_logs'
+    log_dir.mkdir(exist_ok=True)
+
+    wanted = upstream(targets or STAGES)  # dependencies of a target are needed too
+    forced = downstream(force)
+
+    done, failed, skipped, would_run = set(), set(), set(), set()
+    running = {}
+    total_start = time.perf_counter()
+
+    print("=" * 60)
+    print("🔁 DATASET PIPELINE")
+    print("=" * 60)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while True:
+            for name in STAGES:
+                if name not in wanted or name in done | failed | skipped or name in running:
+                    continue
+                deps = set(STAGES[name]['after']) & wanted
+                if deps & (failed | skipped):
+                    skipped.add(name)
+                    print(f"⏭️  {name}: skipped, an earlier stage failed")
+                    continue
+                if not deps <= done:
+                    continue
+
+                if dry_run and deps & would_run:
+                    print(f"🔸 {name}: would run (after {', '.join(sorted(deps & would_run))})")
+                    would_run.add(name)
+                    done.add(name)
+                    continue
+
+                digest, num_files, rehashed = fingerprint(name, root, cache)
+                outputs_exist = all(os.path.exists(expand(o, root)) for o in STAGES[name]['outputs'])
+                names_ok = outputs_exist and names_match(name, root)
+                if name not in forced and names_ok and state['stages'].get(name) == digest:
+                    print(f"✅ {name}: up to date ({num_files:,} input files)")
+                    done.add(name)
+                    continue
+
+                if name in forced:
+                    reason = 'forced'
+                elif name not in state['stages']:
+                    reason = 'never run'
+                elif not outputs_exist:
+                    reason = 'outputs missing'
+                elif not names_ok:
+                    reason = 'output class names differ from the input'
+                else:
+                    reason = f"inputs changed, {rehashed:,} of {num_files:,} files re-hashed"
+                if dry_run:
+                    print(f"🔸 {name}: would run ({reason})")
+                    would_run.add(name)
+                    done.add(name)
+                    continue
+                print(f"▶️  {name}: running ({reason})")
+                running[name] = pool.submit(run_stage, name, root, log_dir)
+
+            if not running:
+                break
+
+            finished, _ = wait(running.values(), return_when=FIRST_COMPLETED)
+            for name in [n for n, f in running.items() if f in finished]:
+                code, elapsed, log_file = running.pop(name).result()
+                if code != 0:
+                    failed.add(name)
+                    print(f"❌ {name}: failed after {elapsed:.1f}s (exit {code}), see {log_file}")
+                    continue
+                # Not every script exits nonzero on failure; a stage is done only if it wrote its outputs
+                missing = [expand(o, root) for o in STAGES[name]['outputs']]
+                missing = [o for o in missing if not os.path.exists(o)]
+                if missing:
+                    failed.add(name)
+                    print(f"❌ {name}: exited 0 but did not write {', '.join(missing)}, see {log_file}")
+                    continue
+                if not names_match(name, root):
+                    failed.add(name)
+                    print(f"❌ {name}: wrote other class names than its input, see {log_file}")
+                    continue
+                # Fingerprint after the run: stages may touch their own inputs (rename)
+                state['stages'][name] = fingerprint(name, root, cache)[0]
+                done.add(name)
+                save_state(root, state)
+                print(f"✔️  {name}: done in {elapsed:.1f}s")
+
+    state['files'] = cache.entries
+    save_state(root, state)
+
+    print(f"\n⏱️  Pipeline finished in {time.perf_counter() - total_start:.1f}s "
+          f"({len(failed)} failed, {len(skipped)} skipped)")
+    return not failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the dataset scripts, re-running only what changed')
+    parser.add_argument('stages', nargs='*', help=f"Stages to bring up to date (default: all of {', '.join(STAGES)})")
+    parser.add_argument('--root', type=Path, default=PROJECT_PATH, help='Project folder holding the datasets')
+    parser.add_argument('--force', nargs='+', default=[], choices=list(STAGES),
+                        help='Re-run these stages and everything after them')
+    parser.add_argument('--jobs', type=int, default=JOBS, help='Stages run in parallel')
+    parser.add_argument('--dry-run', action='store_true', help='Only report which stages are out of date')
+    args = parser.parse_args()
+
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    ok = run_pipeline(args.root, args.stages, args.force, args.jobs, args.dry_run)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
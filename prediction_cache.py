@@ -0,0 +1,199 @@
+# prediction_cache.py
+# On-disk store of raw detections, keyed by (weights hash, imgsz, image content hash).
+#
+# Detections are stored once at a very low confidence (STORE_CONF) and a loose
+# NMS IoU (STORE_IOU). Any stricter conf/iou, or a class merge such as the
+# simple_material scheme, is then replayed from the store in NumPy, without loading the model.
+#
+# One store per (weights, imgsz) is a single .npz with flat columns:
+#   hashes[N]      image content hashes (blake2b, hex)
+#   shapes[N, 2]   decoded image (h, w), for box sizes in pixels
+#   offsets[N + 1] detections of image i are rows offsets[i]:offsets[i + 1]
+#   boxes[K, 4]    normalized xyxy      conf[K]   cls[K]
+# Image hashes are cached by (size, mtime) so unchanged images are not re-read.
+#
+#   python prediction_cache.py info
+#   python prediction_cache.py clear --weights runs/detect/train2/weights/best.pt
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from dataset_utils import HashCache, box_iou, file_hash
+
+# ========== CONFIGURATION ==========
+CACHE_DIR = Path("runs/prediction_cache")
+STORE_CONF = 0.001
+STORE_IOU = 0.7     # replays can use any NMS IoU up to this one
+MAX_DET = 300
+# ===================================
+
+HASHES_NAME = "image_hashes.json"
+
+
+def load_hash_cache(cache_dir=CACHE_DIR):
+    path = Path(cache_dir) / HASHES_NAME
+    if path.exists():
+        with open(path, 'r') as f:
+            return HashCache(json.load(f))
+    return HashCache()
+
+
+def save_hash_cache(cache, cache_dir=CACHE_DIR):
+    path = Path(cache_dir) / HASHES_NAME
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(cache.entries, f)
+    os.replace(tmp, path)
+
+
+def image_hashes(paths, cache_dir=CACHE_DIR):
+    """Content hash of every image (None where the file is missing)"""
+    cache = load_hash_cache(cache_dir)
+    existing = [p for p in paths if os.path.isfile(p)]
+    hashes, rehashed = cache.hashes(existing)
+    if rehashed:
+        save_hash_cache(cache, cache_dir)
+    return [hashes.get(p) for p in paths]
+
+
+class PredictionStore:
+    """Detections of one model at one imgsz, for any number of images"""
+
+    def __init__(self, weights, imgsz, cache_dir=CACHE_DIR):
+        self.weights = str(weights)
+        self.imgsz = imgsz
+        self.key = f"{file_hash(weights)}_{imgsz}"
+        self.path = Path(cache_dir) / f"{self.key}.npz"
+        self.index = {}
+        self.columns = None
+        self.new = []   # (hash, shape, detections) added since the last save
+
+        if self.path.exists():
+            with np.load(self.path) as data:
+                self.columns = {k: data[k] for k in data.files}
+            self.index = {h: i for i, h in enumerate(self.columns['hashes'])}
+
+    def __len__(self):
+        return len(self.index) + len(self.new)
+
+    def get(self, image_hash):
+        """(detections [x1, y1, x2, y2, conf, cls], (h, w)) or None if the image is not stored"""
+        i = self.index.get(image_hash)
+        if i is None:
+            return None
+        c = self.columns
+        a, b = c['offsets'][i], c['offsets'][i + 1]
+        pred = np.concatenate([c['boxes'][a:b], c['conf'][a:b, None], c['cls'][a:b, None].astype(np.float32)], axis=1)
+        return pred, tuple(int(v) for v in c['shapes'][i])
+
+    def add(self, image_hash, pred, shape):
+        if image_hash not in self.index:
+            self.new.append((image_hash, shape, pred))
+
+    def save(self):
+        """Merge the new detections into the store file"""
+        if not self.new:
+            return self.path
+        old = self.columns or {
+            'hashes': np.zeros(0, dtype='U32'), 'shapes': np.zeros((0, 2), dtype=np.int32),
+            'offsets': np.zeros(1, dtype=np.int64), 'boxes': np.zeros((0, 4), dtype=np.float32),
+            'conf': np.zeros(0, dtype=np.float32), 'cls': np.zeros(0, dtype=np.uint16),
+        }
+        counts = np.array([len(p) for _, _, p in self.new], dtype=np.int64)
+        preds = np.concatenate([p for _, _, p in self.new]) if counts.sum() else np.zeros((0, 6), np.float32)
+        columns = {
+            'hashes': np.concatenate([old['hashes'], np.array([h for h, _, _ in self.new], dtype='U32')]),
+            'shapes': np.concatenate([old['shapes'], np.array([s for _, s, _ in self.new], dtype=np.int32)]),
+            'offsets': np.concatenate([old['offsets'], old['offsets'][-1] + np.cumsum(counts)]),
+            'boxes': np.concatenate([old['boxes'], preds[:, :4].astype(np.float32)]),
+            'conf': np.concatenate([old['conf'], preds[:, 4].astype(np.float32)]),
+            'cls': np.concatenate([old['cls'], preds[:, 5].astype(np.uint16)]),
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp.npz')
+        np.savez(tmp, **columns)
+        os.replace(tmp, self.path)
+
+        with open(self.path.with_suffix('.json'), 'w') as f:
+            json.dump({'weights': self.weights, 'imgsz': self.imgsz, 'conf': STORE_CONF, 'iou': STORE_IOU,
+                       'max_det': MAX_DET, 'images': len(columns['hashes'])}, f, indent=2)
+
+        self.columns = columns
+        self.index = {h: i for i, h in enumerate(columns['hashes'])}
+        self.new = []
+        return self.path
+
+
+def nms(pred, iou_threshold, agnostic=False):
+    """Class-wise (agnostic: cross-class) NMS of [x1, y1, x2, y2, conf, cls] rows; kept rows, highest conf first"""
+    pred = pred[np.argsort(-pred[:, 4], kind='stable')]
+    keep = np.ones(len(pred), dtype=bool)
+    groups = [np.arange(len(pred))] if agnostic else [np.nonzero(pred[:, 5] == c)[0] for c in np.unique(pred[:, 5])]
+    for idx in groups:
+        if len(idx) < 2:
+            continue
+        iou = box_iou(pred[idx, :4], pred[idx, :4])
+        suppressed = np.zeros(len(idx), dtype=bool)
+        for i in range(len(idx)):
+            if not suppressed[i]:
+                suppressed[i + 1:] |= iou[i, i + 1:] > iou_threshold
+        keep[idx[suppressed]] = False
+    return pred[keep]
+
+
+def replay(pred, conf=STORE_CONF, iou=STORE_IOU, lut=None, max_det=MAX_DET):
+    """Stored detections as they would come out of the model at conf/iou, optionally with merged classes"""
+    pred = pred[pred[:, 4] >= conf]
+    if lut is not None:
+        pred = pred.copy()
+        pred[:, 5] = lut[pred[:, 5].astype(int)]
+    # Merged classes may overlap; a stricter IoU needs another NMS pass
+    if len(pred) > 1 and (lut is not None or iou < STORE_IOU):
+        pred = nms(pred, iou)
+    return pred[:max_det]
+
+
+def cache_info(cache_dir=CACHE_DIR):
+    stores = sorted(Path(cache_dir).glob('*.json'))
+    print(f"🗄️  Prediction cache: {cache_dir}")
+    total = 0
+    for meta_path in stores:
+        if meta_path.name == HASHES_NAME:
+            continue
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        size = meta_path.with_suffix('.npz').stat().st_size if meta_path.with_suffix('.npz').exists() else 0
+        total += size
+        print(f"  {meta['weights']} @ {meta['imgsz']}px: {meta['images']:,} images, {size / 1e6:.1f} MB")
+    print(f"  Total: {total / 1e6:.1f} MB")
+
+
+def clear(cache_dir=CACHE_DIR, weights=None):
+    removed = 0
+    for path in Path(cache_dir).glob('*.npz'):
+        if weights is None or path.name.startswith(file_hash(weights) + '_'):
+            path.unlink()
+            path.with_suffix('.json').unlink(missing_ok=True)
+            removed += 1
+    print(f"🗑️  Removed {removed} prediction stores")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inspect or clear the prediction cache used by evaluate.py')
+    parser.add_argument('command', choices=['info', 'clear'])
+    parser.add_argument('--cache', type=Path, default=CACHE_DIR, help='Cache folder')
+    parser.add_argument('--weights', help='clear: only the stores of these weights')
+    args = parser.parse_args(argv)
+
+    if args.command == 'info':
+        cache_info(args.cache)
+    else:
+        clear(args.cache, args.weights)
+
+
+if __name__ == "__main__":
+    main()
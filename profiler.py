@@ -0,0 +1,181 @@
+# profiler.py
+# Training step profiler: is a CPU epoch spent waiting for data or computing?
+#
+# Hooks into an Ultralytics training run and splits every iteration into
+#   data wait   previous step end -> batch start (the loader's next(), i.e. decode + augmentation
+#               not hidden by the workers)
+#   forward     model forward + loss (module hooks on the model)
+#   optimizer   trainer.optimizer_step (optimizer, gradient clipping, EMA)
+#   backward    the rest of the step, almost all of it loss.backward()
+# plus validation (and checkpoint saving) per epoch, and the CPU utilization
+# of the loader worker processes. Rows go to profile.csv next to results.csv,
+# and a summary at the end names the bottleneck.
+#
+#   from profiler import attach_profiler
+#   model = YOLO('yolo11s.pt'); attach_profiler(model); model.train(...)
+#
+#   python train.py --profile ...
+import csv
+import time
+from pathlib import Path
+
+# ========== CONFIGURATION ==========
+DATA_BOUND = 0.3     # data wait above this share of the training loop means the loader is the bottleneck
+# ===================================
+
+FIELDS = ['epoch', 'iterations', 'images', 'epoch_s', 'data_wait_s', 'forward_s', 'backward_s', 'optimizer_s',
+          'val_s', 'data_wait_pct', 'worker_util_pct', 'images_per_s']
+
+
+def _worker_cpu_seconds():
+    """CPU seconds used so far by this process's children (the loader workers); None without psutil"""
+    try:
+        import psutil
+    except ImportError:
+        return None, 0
+    total, count = 0.0, 0
+    for child in psutil.Process().children(recursive=True):
+        try:
+            t = child.cpu_times()
+            total += t.user + t.system
+            count += 1
+        except psutil.Error:
+            pass
+    return total, count
+
+
+class StepProfiler:
+    """Ultralytics callbacks that time each part of the training step"""
+
+    def __init__(self):
+        self.rows = []
+        self._optimizer_time = 0.0
+        self._reset()
+
+    def _reset(self):
+        self.t = dict.fromkeys(['data_wait', 'forward', 'backward', 'optimizer'], 0.0)
+        self.iterations = self.images = 0
+
+    # Model/optimizer instrumentation, once the trainer has built them
+    def on_train_start(self, trainer):
+        self.save_dir = Path(trainer.save_dir)
+        model = trainer.model.module if hasattr(trainer.model, 'module') else trainer.model
+        model.register_forward_pre_hook(self._forward_start)
+        model.register_forward_hook(self._forward_end)
+
+        step = trainer.optimizer_step
+
+        def timed_optimizer_step(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return step(*args, **kwargs)
+            finally:
+                self._optimizer_time += time.perf_counter() - start
+
+        trainer.optimizer_step = timed_optimizer_step
+
+    def _forward_start(self, module, inputs):
+        if module.training:
+            self._forward_t0 = time.perf_counter()
+
+    def _forward_end(self, module, inputs, output):
+        if module.training:
+            self._forward_t1 = time.perf_counter()
+
+    def on_train_epoch_start(self, trainer):
+        self._reset()
+        self.epoch_start = self.last_end = time.perf_counter()
+        self.worker_cpu0, _ = _worker_cpu_seconds()
+
+    def on_train_batch_start(self, trainer):
+        now = time.perf_counter()
+        self.t['data_wait'] += now - self.last_end
+        self._optimizer_time = 0.0
+        self._forward_t0 = self._forward_t1 = None
+
+    def on_train_batch_end(self, trainer):
+        now = time.perf_counter()
+        if self._forward_t0 is not None and self._forward_t1 is not None:
+            self.t['forward'] += self._forward_t1 - self._forward_t0
+            self.t['backward'] += max(0.0, now - self._forward_t1 - self._optimizer_time)
+        self.t['optimizer'] += self._optimizer_time
+        self.iterations += 1
+        self.images += trainer.batch_size
+        self.last_end = now
+
+    def on_train_epoch_end(self, trainer):
+        self.train_end = time.perf_counter()
+        cpu, workers = _worker_cpu_seconds()
+        self.worker_util = None
+        if cpu is not None and self.worker_cpu0 is not None and workers:
+            self.worker_util = 100 * (cpu - self.worker_cpu0) / ((self.train_end - self.epoch_start) * workers)
+
+    def on_fit_epoch_end(self, trainer):
+        """After validation and checkpoint saving"""
+        now = time.perf_counter()
+        loop = self.train_end - self.epoch_start
+        row = {
+            'epoch': trainer.epoch + 1, 'iterations': self.iterations, 'images': self.images,
+            'epoch_s': now - self.epoch_start,
+            'data_wait_s': self.t['data_wait'], 'forward_s': self.t['forward'], 'backward_s': self.t['backward'],
+            'optimizer_s': self.t['optimizer'], 'val_s': now - self.train_end,
+            'data_wait_pct': 100 * self.t['data_wait'] / loop if loop else 0.0,
+            'worker_util_pct': self.worker_util if self.worker_util is not None else '',
+            'images_per_s': self.images / loop if loop else 0.0,
+        }
+        self.rows.append({k: round(v, 3) if isinstance(v, float) else v for k, v in row.items()})
+        self.write_csv()
+
+    def on_train_end(self, trainer):
+        self.write_csv()
+        self.print_summary()
+
+    def write_csv(self):
+        path = self.save_dir / 'profile.csv'
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(self.rows)
+        return path
+
+    def summary(self):
+        """Totals over all epochs and the verdict"""
+        total = {k: sum(r[k] for r in self.rows) for k in
+                 ['epoch_s', 'data_wait_s', 'forward_s', 'backward_s', 'optimizer_s', 'val_s']}
+        loop = total['epoch_s'] - total['val_s']
+        share = total['data_wait_s'] / loop if loop else 0.0
+        compute = total['forward_s'] + total['backward_s'] + total['optimizer_s']
+        if share >= DATA_BOUND:
+            verdict = ("data-bound: the model waits for batches. Raise workers (autotune.py), train from a "
+                       "resize_cache.py/shard_dataset.py copy, or lighten the augmentation")
+        else:
+            verdict = ("compute-bound: forward/backward dominate. Lower imgsz or batch, move to a smaller model "
+                       "(prune.py, pseudo_label.py), or tune the torch threads (autotune.py)")
+        return total, loop, share, compute, verdict
+
+    def print_summary(self):
+        if not self.rows:
+            return
+        total, loop, share, compute, verdict = self.summary()
+        util = [r['worker_util_pct'] for r in self.rows if r['worker_util_pct'] != '']
+
+        print("\n" + "=" * 60)
+        print(f"⏱️  TRAINING PROFILE ({len(self.rows)} epochs, {total['epoch_s'] / len(self.rows):.0f}s per epoch)")
+        print("=" * 60)
+        for name in ['data_wait_s', 'forward_s', 'backward_s', 'optimizer_s', 'val_s']:
+            print(f"  {name[:-2]:<12}{total[name]:>10.1f}s  {100 * total[name] / total['epoch_s']:5.1f}%")
+        other = loop - total['data_wait_s'] - compute
+        print(f"  {'other':<12}{other:>10.1f}s  {100 * other / total['epoch_s']:5.1f}%")
+        if util:
+            print(f"  Loader workers busy {sum(util) / len(util):.0f}% of the time")
+        print(f"\n  → {verdict}")
+        print(f"  📄 {self.save_dir / 'profile.csv'}")
+
+
+def attach_profiler(yolo, profiler=None):
+    """Register a StepProfiler's callbacks on a YOLO model before .train(); returns the profiler"""
+    profiler = profiler or StepProfiler()
+    for event in ['on_train_start', 'on_train_epoch_start', 'on_train_batch_start', 'on_train_batch_end',
+                  'on_train_epoch_end', 'on_fit_epoch_end', 'on_train_end']:
+        yolo.add_callback(event, getattr(profiler, event))
+    return profiler
@@ -0,0 +1,164 @@
+# proxy_val.py
+# Fast per-epoch validation on a small stratified subset of the val split.
+#
+# `build` picks a proxy subset that covers every class (rarest classes first,
+# at least MIN_PER_CLASS images each where possible) and fills the rest at
+# random, then writes a virtual dataset whose `val` is the proxy and whose
+# `val_full` is the whole split. proxy_detection_trainer() validates on the
+# proxy every epoch (early stopping and best.pt follow the proxy fitness) and
+# on the full split every FULL_EVERY epochs and for the final evaluation.
+# Each full validation is paired with the proxy result of the same epoch,
+# so the run reports how well proxy mAP tracks full mAP (proxy_val.csv).
+#
+#   python proxy_val.py build --data balanced_final --size 200 --output runs/proxy_data
+#   python train.py --data runs/proxy_data/data.yaml --full-val-every 10
+import argparse
+import csv
+import random
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from dataset_manifest import MANIFEST_NAME, load_dataset, new_manifest, read_boxes, save_manifest, write_yolo_lists
+
+# ========== CONFIGURATION ==========
+DATASET_PATH = "/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/balanced_final"
+PROXY_SIZE = 200
+MIN_PER_CLASS = 5
+FULL_EVERY = 10
+OUTPUT_DIR = Path("runs/proxy_data")
+# ===================================
+
+MAP_KEY = 'metrics/mAP50-95(B)'
+
+
+def select_proxy(entries, size=PROXY_SIZE, min_per_class=MIN_PER_CLASS, seed=0):
+    """Indices of a subset of entries that covers every class present, rarest classes first"""
+    rng = random.Random(seed)
+    class_sets = [{int(b[0]) for b in read_boxes(e)} for e in entries]
+    counts = Counter(c for classes in class_sets for c in classes)
+
+    chosen = set()
+    have = Counter()
+    for c in sorted(counts, key=lambda c: (counts[c], c)):
+        candidates = [i for i, classes in enumerate(class_sets) if c in classes and i not in chosen]
+        rng.shuffle(candidates)
+        for i in candidates[:max(0, min_per_class - have[c])]:
+            chosen.add(i)
+            have.update(class_sets[i])
+
+    rest = [i for i in range(len(entries)) if i not in chosen]
+    rng.shuffle(rest)
+    chosen.update(rest[:max(0, size - len(chosen))])
+    return sorted(chosen)
+
+
+def build_proxy_dataset(source=DATASET_PATH, out_dir=OUTPUT_DIR, size=PROXY_SIZE, min_per_class=MIN_PER_CLASS,
+                        split='val', seed=0):
+    """Virtual dataset with train, val (the proxy) and val_full; returns the data.yaml path"""
+    manifest = load_dataset(source)
+    entries = manifest['splits'][split]
+    picked = select_proxy(entries, size, min_per_class, seed)
+
+    result = new_manifest(manifest['names'])
+    for name, split_entries in manifest['splits'].items():
+        if name != split:
+            result['splits'][name] = split_entries
+    result['splits']['val'] = [entries[i] for i in picked]
+    result['splits']['val_full'] = entries
+
+    save_manifest(result, Path(out_dir) / MANIFEST_NAME)
+    yaml_path = write_yolo_lists(result, out_dir)
+
+    full = Counter(int(b[0]) for e in entries for b in read_boxes(e))
+    proxy = Counter(int(b[0]) for e in result['splits']['val'] for b in read_boxes(e))
+    print("=" * 60)
+    print(f"🧪 PROXY VALIDATION SET: {len(picked):,} of {len(entries):,} '{split}' images")
+    print("=" * 60)
+    print(f"{'class':<20}{'full':>8}{'proxy':>8}")
+    for c, name in enumerate(manifest['names']):
+        flag = '  ⚠️  not covered' if full[c] and not proxy[c] else ''
+        print(f"{name[:19]:<20}{full[c]:>8}{proxy[c]:>8}{flag}")
+    print(f"\n📄 {yaml_path}")
+    return yaml_path
+
+
+def rank_correlation(a, b):
+    """Spearman correlation of two sequences (no tie correction)"""
+    ra = np.argsort(np.argsort(a))
+    rb = np.argsort(np.argsort(b))
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+
+def proxy_detection_trainer(full_every=FULL_EVERY):
+    """DetectionTrainer validating on data['val'] (the proxy) every epoch and on data['val_full'] periodically"""
+    from ultralytics.models.yolo.detect import DetectionTrainer
+
+    class ProxyDetectionTrainer(DetectionTrainer):
+        def _setup_train(self, *args, **kwargs):
+            super()._setup_train(*args, **kwargs)
+            full = self.data.get('val_full')
+            if full is None:
+                raise ValueError("data.yaml has no 'val_full' split; build it with `python proxy_val.py build`")
+            full = Path(full) if Path(full).is_absolute() else Path(self.data['path']) / full
+            batch = self.batch_size if self.args.task == 'obb' else self.batch_size * 2
+            self.full_loader = self.get_dataloader(str(full), batch_size=batch, rank=-1, mode='val')
+            self.proxy_loader = self.validator.dataloader
+            self.proxy_pairs = []
+
+        def validate_full(self):
+            self.validator.dataloader = self.full_loader
+            try:
+                return self.validator(self)
+            finally:
+                self.validator.dataloader = self.proxy_loader
+
+        def validate(self):
+            metrics, fitness = super().validate()
+            epoch = self.epoch + 1
+            if epoch % full_every == 0 or epoch == self.epochs:
+                full = self.validate_full()
+                self.proxy_pairs.append((epoch, metrics.get(MAP_KEY, 0.0), full.get(MAP_KEY, 0.0)))
+                print(f"🧪 epoch {epoch}: proxy mAP50-95 {self.proxy_pairs[-1][1]:.4f}, "
+                      f"full {self.proxy_pairs[-1][2]:.4f}")
+                self.write_proxy_report()
+            return metrics, fitness
+
+        def final_eval(self):
+            # best.pt is chosen on the proxy; its reported metrics come from the full split
+            self.validator.dataloader = self.full_loader
+            super().final_eval()
+
+        def write_proxy_report(self):
+            with open(Path(self.save_dir) / 'proxy_val.csv', 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['epoch', 'proxy_map50_95', 'full_map50_95'])
+                writer.writerows(self.proxy_pairs)
+            if len(self.proxy_pairs) >= 3:
+                proxy = [p for _, p, _ in self.proxy_pairs]
+                full = [f for _, _, f in self.proxy_pairs]
+                pearson = float(np.corrcoef(proxy, full)[0, 1])
+                spearman = rank_correlation(proxy, full)
+                print(f"   proxy vs full over {len(proxy)} epochs: Pearson {pearson:.3f}, Spearman {spearman:.3f}")
+
+    return ProxyDetectionTrainer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build a stratified proxy validation set for fast per-epoch validation')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='Write a dataset whose val split is the proxy (val_full = whole split)')
+    build.add_argument('--data', default=DATASET_PATH, help='Dataset folder or manifest')
+    build.add_argument('--split', default='val', help='Split to subsample')
+    build.add_argument('--size', type=int, default=PROXY_SIZE, help='Proxy images')
+    build.add_argument('--min-per-class', type=int, default=MIN_PER_CLASS, help='Images per class the proxy keeps')
+    build.add_argument('--seed', type=int, default=0, help='Random seed')
+    build.add_argument('--output', type=Path, default=OUTPUT_DIR, help='Output folder')
+    args = parser.parse_args(argv)
+
+    build_proxy_dataset(args.data, args.output, args.size, args.min_per_class, args.split, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+# prune.py
+# Structured channel pruning of the trained detector, followed by a short fine-tune.
+#
+# Channels are ranked by the magnitude of their BatchNorm scale (network
+# slimming) across the whole model and removed for real, so the convolutions
+# get smaller instead of carrying zeros. Only channels consumed by a single
+# layer are pruned: the hidden channels of every Bottleneck (cv1 -> cv2) and
+# the intermediate convolutions of the Detect head branches. Block inputs and
+# outputs, residuals and concatenations keep their width, so the network
+# stays valid without a dependency graph. The prune ratio is searched until
+# the model reaches the FLOPs target.
+#
+# The result is an ordinary Ultralytics checkpoint: YOLO('.../pruned_finetuned.pt')
+# loads it, so src/server.py can use it as MODEL_PATH.
+#
+#   python prune.py --weights runs/detect/train2/weights/best.pt --target-flops 0.6 --epochs 10
+import argparse
+import copy
+import shutil
+from pathlib import Path
+
+from evaluate import WEIGHTS
+from train import keep_workers
+
+# ========== CONFIGURATION ==========
+DATASET_PATH = "/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/balanced_final"
+TARGET_FLOPS = 0.6      # fraction of the original FLOPs to keep
+MIN_KEEP = 0.25         # never prune a layer below this fraction of its channels
+ROUND_TO = 8            # kept channels are a multiple of this (SIMD-friendly on CPU)
+IMGSZ = 640
+EPOCHS = 10
+BATCH = 8
+WORKERS = 2
+OUTPUT_DIR = Path("runs/prune")
+# ===================================
+
+
+def _is_conv(layer):
+    """Ultralytics Conv/DWConv: a Conv2d followed by BatchNorm"""
+    from torch import nn
+
+    return isinstance(getattr(layer, 'conv', None), nn.Conv2d) and isinstance(getattr(layer, 'bn', None), nn.BatchNorm2d)
+
+
+def _conv2d(layer):
+    return layer.conv if _is_conv(layer) else layer
+
+
+def _is_depthwise(layer):
+    from torch import nn
+
+    conv = _conv2d(layer)
+    return isinstance(conv, nn.Conv2d) and conv.groups > 1 and conv.groups == conv.in_channels == conv.out_channels
+
+
+def _flatten(module):
+    """Leaf layers of nested Sequentials, in execution order"""
+    from torch import nn
+
+    if isinstance(module, nn.Sequential):
+        return [leaf for child in module for leaf in _flatten(child)]
+    return [module]
+
+
+def prunable_groups(model):
+    """(producer, consumers): producer's output channels are only read by the consumers.
+
+    Depthwise consumers pass the channels through, so the layer after them
+    is a consumer too.
+    """
+    groups = []
+    for m in model.modules():
+        name = type(m).__name__
+        if name == 'Bottleneck':
+            groups.append((m.cv1, [m.cv2]))
+        elif name == 'Detect':
+            for branch in list(m.cv2) + list(m.cv3):
+                layers = _flatten(branch)
+                for k, layer in enumerate(layers[:-1]):
+                    if not _is_conv(layer) or _is_depthwise(layer):
+                        continue
+                    consumers = []
+                    j = k + 1
+                    while j < len(layers) and _is_depthwise(layers[j]):
+                        consumers.append(layers[j])
+                        j += 1
+                    if j < len(layers):
+                        consumers.append(layers[j])
+                    groups.append((layer, consumers))
+    return groups
+
+
+def _prune_out(layer, keep):
+    from torch import nn
+
+    conv = _conv2d(layer)
+    conv.weight = nn.Parameter(conv.weight.data[keep].clone())
+    if conv.bias is not None:
+        conv.bias = nn.Parameter(conv.bias.data[keep].clone())
+    conv.out_channels = len(keep)
+    if _is_conv(layer):
+        bn = layer.bn
+        bn.weight = nn.Parameter(bn.weight.data[keep].clone())
+        bn.bias = nn.Parameter(bn.bias.data[keep].clone())
+        bn.running_mean = bn.running_mean[keep].clone()
+        bn.running_var = bn.running_var[keep].clone()
+        bn.num_features = len(keep)
+
+
+def _prune_in(layer, keep):
+    from torch import nn
+
+    conv = _conv2d(layer)
+    if _is_depthwise(layer):
+        _prune_out(layer, keep)
+        conv.groups = len(keep)
+    else:
+        conv.weight = nn.Parameter(conv.weight.data[:, keep].clone())
+    conv.in_channels = len(keep)
+
+
+def plan_keep(groups, ratio, min_keep=MIN_KEEP, round_to=ROUND_TO):
+    """Channels each producer keeps when the weakest `ratio` of all prunable channels (by |BN gamma|) go"""
+    import torch
+
+    scores = [producer.bn.weight.detach().abs() for producer, _ in groups]
+    everything = torch.cat(scores)
+    threshold = torch.quantile(everything.float(), ratio) if ratio > 0 else -1.0
+
+    plan = []
+    for score in scores:
+        n = len(score)
+        count = int((score > threshold).sum())
+        count = max(count, int(min_keep * n + 0.999), 1)
+        count = min(n, -(-count // round_to) * round_to)
+        plan.append(torch.sort(torch.topk(score, count).indices).values)
+    return plan
+
+
+def prune_model(model, ratio, min_keep=MIN_KEEP, round_to=ROUND_TO):
+    """Pruned copy of model; returns (model, channels removed)"""
+    model = copy.deepcopy(model)
+    groups = prunable_groups(model)
+    removed = 0
+    for (producer, consumers), keep in zip(groups, plan_keep(groups, ratio, min_keep, round_to)):
+        removed += producer.bn.num_features - len(keep)
+        if len(keep) == producer.bn.num_features:
+            continue
+        _prune_out(producer, keep)
+        for consumer in consumers:
+            _prune_in(consumer, keep)
+    return model, removed
+
+
+def count_flops(model, imgsz=IMGSZ):
+    """Multiply-adds x 2 of one forward pass at imgsz x imgsz"""
+    import torch
+    from torch import nn
+
+    flops = 0
+
+    def hook(m, inputs, output):
+        nonlocal flops
+        if isinstance(m, nn.Conv2d):
+            flops += 2 * output.numel() * (m.in_channels // m.groups) * m.kernel_size[0] * m.kernel_size[1]
+        else:
+            flops += 2 * output.numel() * m.in_features
+
+    handles = [m.register_forward_hook(hook) for m in model.modules() if isinstance(m, (nn.Conv2d, nn.Linear))]
+    p = next(model.parameters())
+    try:
+        with torch.no_grad():
+            model.eval()(torch.zeros(1, 3, imgsz, imgsz, dtype=p.dtype, device=p.device))
+    finally:
+        for h in handles:
+            h.remove()
+    return flops
+
+
+def count_params(model):
+    return sum(p.numel() for p in model.parameters())
+
+
+def search_ratio(model, target=TARGET_FLOPS, imgsz=IMGSZ, min_keep=MIN_KEEP, round_to=ROUND_TO, steps=12):
+    """Smallest prune ratio whose model is within the FLOPs target (bisection); returns (ratio, model)"""
+    base = count_flops(model, imgsz)
+    lo, hi = 0.0, 1.0
+    best = None
+    for _ in range(steps):
+        mid = (lo + hi) / 2
+        pruned, _ = prune_model(model, mid, min_keep, round_to)
+        if count_flops(pruned, imgsz) <= target * base:
+            best, hi = (mid, pruned), mid
+        else:
+            lo = mid
+    if best is None:
+        pruned, _ = prune_model(model, 1.0, min_keep, round_to)
+        print(f"  ⚠️  {target:.0%} of the FLOPs is out of reach with MIN_KEEP={min_keep}; "
+              f"got {count_flops(pruned, imgsz) / base:.0%}")
+        best = (1.0, pruned)
+    return best
+
+
+def load_checkpoint(weights):
+    import torch
+
+    ckpt = torch.load(weights, map_location='cpu', weights_only=False)
+    model = (ckpt.get('ema') or ckpt['model']).float()
+    return ckpt, model
+
+
+def save_checkpoint(model, ckpt, path):
+    """Same layout as the checkpoints Ultralytics writes, so YOLO(path) loads it"""
+    import torch
+
+    ckpt = dict(ckpt)
+    ckpt.update(model=copy.deepcopy(model).half(), ema=None, updates=None, optimizer=None, epoch=-1)
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    torch.save(ckpt, path)
+    return Path(path)
+
+
+def pruned_detection_trainer():
+    """DetectionTrainer that trains the loaded (pruned) model as it is.
+
+    The stock trainer rebuilds the model from its yaml and copies matching
+    weights over, which would undo the pruning.
+    """
+    from ultralytics.models.yolo.detect import DetectionTrainer
+
+    class PrunedDetectionTrainer(DetectionTrainer):
+        def get_model(self, cfg=None, weights=None, verbose=True):
+            if weights is None:
+                return super().get_model(cfg, weights, verbose)
+            for p in weights.parameters():
+                p.requires_grad = True
+            return weights
+
+    return PrunedDetectionTrainer
+
+
+def dataset_yaml(source):
+    source = Path(source)
+    if source.is_file():
+        return source
+    for name in ['data.yaml', 'dataset.yaml']:
+        if (source / name).exists():
+            return source / name
+    raise FileNotFoundError(f"No data.yaml or dataset.yaml in {source}")
+
+
+def finetune(weights, source=DATASET_PATH, epochs=EPOCHS, imgsz=IMGSZ, batch=BATCH, workers=WORKERS,
+             out_dir=OUTPUT_DIR):
+    from ultralytics import YOLO
+
+    yolo = YOLO(str(weights))
+    yolo.train(data=str(dataset_yaml(source)), trainer=keep_workers(pruned_detection_trainer()), epochs=epochs,
+               imgsz=imgsz, batch=batch, workers=workers, device='cpu', project=str(Path(out_dir).absolute()),
+               name='finetune', exist_ok=True)
+    return Path(yolo.trainer.best)
+
+
+def prune(weights=WEIGHTS, source=DATASET_PATH, target=TARGET_FLOPS, epochs=EPOCHS, imgsz=IMGSZ, batch=BATCH,
+          workers=WORKERS, min_keep=MIN_KEEP, out_dir=OUTPUT_DIR):
+    from benchmark_models import benchmark
+
+    out_dir = Path(out_dir)
+    print("=" * 60)
+    print(f"✂️  STRUCTURED CHANNEL PRUNING (target {target:.0%} of the FLOPs)")
+    print("=" * 60)
+
+    ckpt, model = load_checkpoint(weights)
+    groups = prunable_groups(model)
+    prunable = sum(p.bn.num_features for p, _ in groups)
+    print(f"  {len(groups)} prunable layers, {prunable:,} prunable channels")
+
+    ratio, pruned = search_ratio(model, target, imgsz, min_keep)
+    original = out_dir / 'original.pt'
+    out_dir.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(weights, original)
+    pruned_path = save_checkpoint(pruned, ckpt, out_dir / 'pruned.pt')
+    print(f"  ✂️  Pruned {ratio:.1%} of the prunable channels → {pruned_path}")
+
+    compare = [original, pruned_path]
+    if epochs > 0:
+        print(f"\n🔧 Fine-tuning for {epochs} epochs on {source}")
+        best = finetune(pruned_path, source, epochs, imgsz, batch, workers, out_dir)
+        compare.append(out_dir / 'pruned_finetuned.pt')
+        shutil.copy2(best, compare[-1])
+
+    sizes = {}
+    for path in compare:
+        m = load_checkpoint(path)[1]
+        sizes[path.stem] = (count_flops(m, imgsz), count_params(m))
+
+    print()
+    rows = benchmark([str(p) for p in compare], [imgsz], ['pytorch'], source, 'val', 0,
+                     out_dir=out_dir / 'benchmark')
+
+    print(f"\n{'model':<20}{'GFLOPs':>9}{'params M':>10}{'p50 ms':>9}{'mAP50':>8}{'50-95':>8}")
+    for row in rows:
+        flops, params = sizes[row['model']]
+        print(f"{row['model']:<20}{flops / 1e9:>9.2f}{params / 1e6:>10.2f}{row['p50_ms']:>9.1f}"
+              f"{row['map50']:>8.3f}{row['map50_95']:>8.3f}")
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Prune detector channels to a FLOPs target and fine-tune')
+    parser.add_argument('--weights', default=WEIGHTS, help='Trained checkpoint')
+    parser.add_argument('--data', default=DATASET_PATH, help='Dataset folder (with data.yaml) for fine-tuning and mAP')
+    parser.add_argument('--target-flops', type=float, default=TARGET_FLOPS, help='Fraction of the FLOPs to keep')
+    parser.add_argument('--min-keep', type=float, default=MIN_KEEP, help='Fraction of channels every layer keeps')
+    parser.add_argument('--epochs', type=int, default=EPOCHS, help='Fine-tuning epochs (0 = none)')
+    parser.add_argument('--imgsz', type=int, default=IMGSZ, help='Image size for FLOPs, fine-tuning and mAP')
+    parser.add_argument('--batch', type=int, default=BATCH, help='Fine-tuning batch size')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='Data loader workers')
+    parser.add_argument('--output', type=Path, default=OUTPUT_DIR, help='Output folder')
+    args = parser.parse_args(argv)
+
+    if not 0 < args.target_flops <= 1:
+        parser.error('--target-flops must be in (0, 1]')
+    prune(args.weights, args.data, args.target_flops, args.epochs, args.imgsz, args.batch, args.workers,
+          args.min_keep, args.output)
+
+
+if __name__ == "__main__":
+    main()
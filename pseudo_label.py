@@ -0,0 +1,166 @@
+# pseudo_label.py
+# Train a nano student for the car's CPU on labels extended by the trained detector.
+#
+# This is pseudo-labelling, not knowledge distillation with a soft-target
+# loss: the student only sees the teacher's confident boxes as extra hard
+# labels. The teacher runs once over the training images; its detections are
+# kept in the prediction cache (prediction_cache.py), so re-running with
+# another threshold or student costs no teacher inference. (A per-anchor
+# soft-target loss would need teacher outputs on every augmented mosaic, which
+# a cache of the plain images cannot provide.) Confident teacher detections
+# that no ground-truth box explains are added to the student's training labels
+# in a virtual dataset (the images are not copied), and validation labels stay
+# untouched so mAP remains comparable. The student is then trained with the
+# normal Ultralytics loop, optionally next to the same nano trained on the
+# plain labels, and all models are compared with benchmark_models.py
+# (latency + mAP on the val split).
+#
+#   python pseudo_label.py --teacher runs/detect/train2/weights/best.pt --student yolo11n.pt --epochs 100
+#   python pseudo_label.py --no-baseline --teacher-conf 0.6
+import argparse
+import copy
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from dataset_manifest import load_dataset, read_boxes, save_virtual_dataset
+from dataset_utils import box_iou
+from evaluate import DATASET_PATH, WEIGHTS, predict_split
+from prediction_cache import CACHE_DIR, nms
+from train import keep_workers
+
+# ========== CONFIGURATION ==========
+STUDENT = "yolo11n.pt"
+IMGSZ = 640
+EPOCHS = 100
+BATCH = 8
+WORKERS = 2
+TEACHER_CONF = 0.5     # teacher detections at least this confident become student labels
+MATCH_IOU = 0.5        # ... unless a ground-truth box already covers them this well
+AGNOSTIC_IOU = 0.7     # teacher boxes of different classes overlapping this much are one object
+OUTPUT_DIR = Path("runs/pseudo_label")
+# ===================================
+
+
+def teacher_extra_boxes(pred, gt, conf=TEACHER_CONF, iou=MATCH_IOU):
+    """Teacher detections [cls, xc, yc, w, h] that are confident and not explained by any ground-truth box"""
+    # the cache's NMS is per class: keep only the most confident class per object
+    pred = nms(pred[pred[:, 4] >= conf], AGNOSTIC_IOU, agnostic=True)
+    if not len(pred):
+        return np.zeros((0, 5), dtype=np.float32)
+    if len(gt):
+        gt_xyxy = np.concatenate([gt[:, 1:3] - gt[:, 3:5] / 2, gt[:, 1:3] + gt[:, 3:5] / 2], axis=1)
+        pred = pred[box_iou(pred[:, :4], gt_xyxy).max(axis=1) < iou]
+    xy = (pred[:, :2] + pred[:, 2:4]) / 2
+    wh = pred[:, 2:4] - pred[:, :2]
+    return np.concatenate([pred[:, 5:6], np.clip(xy, 0, 1), np.clip(wh, 0, 1)], axis=1)
+
+
+def pseudo_labelled_manifest(manifest, teacher, imgsz=IMGSZ, conf=TEACHER_CONF, iou=MATCH_IOU, split='train',
+                       cache_dir=CACHE_DIR):
+    """Copy of manifest whose split labels include the teacher's extra detections; returns (manifest, added, images)"""
+    entries = manifest['splits'][split]
+    records = [{'image': e['image']} for e in entries]
+    print(f"🧑‍🏫 Teacher detections on {len(records):,} '{split}' images (cached after the first run)")
+    predictions = predict_split(str(teacher), records, imgsz, cache_dir=cache_dir)
+
+    result = copy.deepcopy(manifest)
+    result['splits'][split] = []
+    added = touched = 0
+    for entry, pred in zip(entries, predictions):
+        gt = np.array(read_boxes(entry), dtype=np.float32).reshape(-1, 5)
+        extra = teacher_extra_boxes(pred, gt, conf, iou) if pred is not None else np.zeros((0, 5))
+        new_entry = dict(entry)
+        if len(extra):
+            new_entry.pop('label', None)
+            new_entry['boxes'] = gt.tolist() + [[int(b[0])] + [float(v) for v in b[1:]] for b in extra]
+            added += len(extra)
+            touched += 1
+        result['splits'][split].append(new_entry)
+    return result, added, touched
+
+
+def train_model(data_yaml, model, name, epochs=EPOCHS, imgsz=IMGSZ, batch=BATCH, workers=WORKERS,
+                out_dir=OUTPUT_DIR):
+    """Train with the notebook's CPU settings; returns the path of the best checkpoint"""
+    from ultralytics import YOLO
+
+    yolo = YOLO(model)
+    yolo.train(data=str(data_yaml), epochs=epochs, imgsz=imgsz, batch=batch, workers=workers, device='cpu',
+               trainer=keep_workers(), project=str(Path(out_dir).absolute()), name=name, exist_ok=True)
+    return Path(yolo.trainer.best)
+
+
+def pseudo_label(teacher=WEIGHTS, student=STUDENT, source=DATASET_PATH, imgsz=IMGSZ, epochs=EPOCHS, batch=BATCH,
+            workers=WORKERS, conf=TEACHER_CONF, iou=MATCH_IOU, baseline=True, out_dir=OUTPUT_DIR):
+    from benchmark_models import benchmark
+
+    out_dir = Path(out_dir)
+    print("=" * 60)
+    print("🏷️  TEACHER PSEUDO-LABELLING")
+    print("=" * 60)
+
+    manifest = load_dataset(source)
+    pl_manifest, added, touched = pseudo_labelled_manifest(manifest, teacher, imgsz, conf, iou)
+    total = sum(len(read_boxes(e)) for e in manifest['splits']['train'])
+    print(f"  ➕ {added:,} teacher boxes added to {touched:,} images "
+          f"({total:,} ground-truth boxes, conf >= {conf}, IoU < {iou} with every GT box)")
+    pl_yaml = save_virtual_dataset(pl_manifest, out_dir / 'data_pseudo')
+
+    # Named copies, so the comparison table tells the models apart
+    compare = [out_dir / 'teacher.pt']
+    out_dir.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(teacher, compare[0])
+
+    print(f"\n🎓 Training the student ({student}) on the pseudo-labelled data")
+    student_best = train_model(pl_yaml, student, 'student', epochs, imgsz, batch, workers, out_dir)
+    compare.append(out_dir / 'student_pseudo.pt')
+    shutil.copy2(student_best, compare[-1])
+
+    if baseline:
+        print(f"\n📏 Training the baseline ({student}) on the plain labels")
+        base_yaml = save_virtual_dataset(manifest, out_dir / 'data_baseline')
+        base_best = train_model(base_yaml, student, 'baseline', epochs, imgsz, batch, workers, out_dir)
+        compare.append(out_dir / 'student_baseline.pt')
+        shutil.copy2(base_best, compare[-1])
+
+    print()
+    rows = {row['model']: row for row in benchmark([str(p) for p in compare], [imgsz], ['pytorch'], source,
+                                                   'val', 0, out_dir=out_dir / 'benchmark')}
+    student_row, teach = rows.get('student_pseudo'), rows.get('teacher')
+    if student_row and teach:
+        print(f"\n🏷️  Student vs teacher: mAP50-95 {student_row['map50_95'] - teach['map50_95']:+.3f}, "
+              f"p50 latency {student_row['p50_ms']:.1f} vs {teach['p50_ms']:.1f} ms "
+              f"({teach['p50_ms'] / student_row['p50_ms']:.1f}x faster)")
+    base = rows.get('student_baseline')
+    if student_row and base:
+        print(f"🏷️  Pseudo-labelled vs plain nano: mAP50 {student_row['map50'] - base['map50']:+.3f}, "
+              f"mAP50-95 {student_row['map50_95'] - base['map50_95']:+.3f}, "
+              f"p50 latency {student_row['p50_ms'] - base['p50_ms']:+.1f} ms")
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train a nano student on labels extended by the trained detector')
+    parser.add_argument('--teacher', default=WEIGHTS, help='Trained teacher weights')
+    parser.add_argument('--student', default=STUDENT, help='Student model to start from (weights or .yaml)')
+    parser.add_argument('--data', default=DATASET_PATH, help='Dataset folder or manifest')
+    parser.add_argument('--imgsz', type=int, default=IMGSZ, help='Image size for the teacher and the students')
+    parser.add_argument('--epochs', type=int, default=EPOCHS, help='Student training epochs')
+    parser.add_argument('--batch', type=int, default=BATCH, help='Training batch size')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='Data loader workers')
+    parser.add_argument('--teacher-conf', type=float, default=TEACHER_CONF,
+                        help='Teacher detections at least this confident become labels')
+    parser.add_argument('--match-iou', type=float, default=MATCH_IOU,
+                        help='Teacher boxes overlapping a ground-truth box this much are not added')
+    parser.add_argument('--no-baseline', action='store_true', help='Skip training the plain nano for comparison')
+    parser.add_argument('--output', type=Path, default=OUTPUT_DIR, help='Output folder')
+    args = parser.parse_args(argv)
+
+    pseudo_label(args.teacher, args.student, args.data, args.imgsz, args.epochs, args.batch, args.workers,
+                 args.teacher_conf, args.match_iou, not args.no_baseline, args.output)
+
+
+if __name__ == "__main__":
+    main()
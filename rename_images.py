@@ -1,245 +1,377 @@
-# rename_images.py - UPDATED VERSION
+# rename_images.py - TRANSACTIONAL VERSION
+# Renames batch_X/name.EXT -> batch_X/batch_X_name.ext and rewrites the
+# annotations in the same pass (replaces running update_annotations.py after).
+#
+# Crash safety without a full-dataset backup:
+#   1. the whole plan (every rename + the new annotations) is computed up front
+#      and written to a journal before any file is touched
+#   2. renames run concurrently, one worker per batch directory, and each
+#      finished rename is appended to the journal
+#   3. the new annotations file is moved into place atomically at the end
+# A rename is just a metadata operation, so the journal is enough to resume
+# an interrupted run (--resume) or undo it (--rollback).
 import os
+import re
+import sys
+import json
+import argparse
+import threading
 from pathlib import Path
-import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from dataset_utils import IMAGE_EXTENSIONS
 
 # ========== CONFIGURATION ==========
 DATASET_PATH = Path("/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/Org_dataset")
-BACKUP_FIRST = True  # Set to True to create backup before renaming
+ANNOTATIONS_FILE = DATASET_PATH / "annotations.json"
+UPDATED_ANNOTATIONS_FILE = DATASET_PATH / "annotations_updated.json"
+JOURNAL_FILE = DATASET_PATH / ".rename_journal.jsonl"
+WORKERS = 8
 # ===================================
 
-def create_backup():
-    """Create backup of original dataset"""
-    backup_path = DATASET_PATH.parent / "Org_dataset_backup"
-    
-    if backup_path.exists():
-        print(f"⚠️  Backup already exists at: {backup_path}")
-        response = input("Overwrite backup? (y/n): ").strip().lower()
-        if response != 'y':
-            print("Skipping backup...")
-            return
-    
-    print(f"📦 Creating backup to: {backup_path}")
-    
-    # Remove existing backup if it exists
-    if backup_path.exists():
-        shutil.rmtree(backup_path)
-    
-    # Copy entire dataset
-    shutil.copytree(DATASET_PATH, backup_path)
-    print(f"✅ Backup created: {len(list(backup_path.rglob('*.*')))} files")
-
-def standardize_extensions():
-    """First, standardize all extensions to lowercase BEFORE renaming"""
-    
-    print("\n🔄 STANDARDIZING FILE EXTENSIONS")
+BATCH_DIR = re.compile(r'^batch_(\d+)$')
+
+
+def set_dataset_path(path):
+    """Work on another dataset folder"""
+    global DATASET_PATH, ANNOTATIONS_FILE, UPDATED_ANNOTATIONS_FILE, JOURNAL_FILE
+    DATASET_PATH = Path(path)
+    ANNOTATIONS_FILE = DATASET_PATH / "annotations.json"
+    UPDATED_ANNOTATIONS_FILE = DATASET_PATH / "annotations_updated.json"
+    JOURNAL_FILE = DATASET_PATH / ".rename_journal.jsonl"
+
+
+def target_name(batch_num, filename):
+    """batch_X_name.ext with a lowercase extension; already-prefixed names only get the extension fixed"""
+    stem, ext = os.path.splitext(filename)
+    prefix = f"batch_{batch_num}_"
+    if stem.startswith(prefix):
+        return stem + ext.lower()
+    return f"{prefix}{stem}{ext.lower()}"
+
+
+def find_batch_dirs():
+    """All batch_X folders, whatever their number"""
+    batches = []
+    for path in DATASET_PATH.iterdir():
+        match = BATCH_DIR.match(path.name)
+        if match and path.is_dir():
+            batches.append((int(match.group(1)), path))
+    return sorted(batches)
+
+
+def plan_renames():
+    """Every (directory, old name, new name) rename, validated before anything moves"""
+
+    print("\n📋 PLANNING RENAMES")
     print("-" * 40)
-    
-    total_standardized = 0
-    
-    for batch_num in range(1, 16):
-        batch_dir = DATASET_PATH / f"batch_{batch_num}"
-        
-        if not batch_dir.exists():
+
+    plan = []
+    problems = []
+
+    for batch_num, batch_dir in find_batch_dirs():
+        names = set(os.listdir(batch_dir))
+        targets = {}
+        batch_plan = []
+
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            new_name = target_name(batch_num, name)
+            if new_name == name:
+                continue
+            if new_name in targets:
+                problems.append(f"{batch_dir.name}: {name} and {targets[new_name]} both map to {new_name}")
+            elif new_name in names:
+                problems.append(f"{batch_dir.name}: {name} → {new_name} would overwrite an existing file")
+            targets[new_name] = name
+            batch_plan.append([batch_dir.name, name, new_name])
+
+        print(f"  {batch_dir.name}: {len(batch_plan)} of {len(names)} files to rename")
+        plan.extend(batch_plan)
+
+    return plan, problems
+
+
+def update_annotation_paths(data, plan):
+    """Rewrite image paths like 'batch_X/name.JPG' to the flat renamed filename"""
+    renamed = {f"{d}/{old}": new for d, old, new in plan}
+    updated = 0
+    errors = []
+
+    for img in data['images']:
+        old_path = img['file_name']
+        if '/' not in old_path:
+            continue  # already flat
+
+        batch_folder, old_filename = old_path.split('/', 1)
+        match = BATCH_DIR.match(batch_folder)
+        if not match:
+            errors.append(f"Folder doesn't start with 'batch_': {batch_folder}")
             continue
-        
-        # Convert uppercase extensions to lowercase
-        for uppercase_ext in ['.JPG', '.JPEG', '.PNG']:
-            for file_path in batch_dir.glob(f"*{uppercase_ext}"):
-                # Create new name with lowercase extension
-                new_name = file_path.stem + uppercase_ext.lower()
-                new_path = batch_dir / new_name
-                
-                # Rename the file
-                file_path.rename(new_path)
-                total_standardized += 1
-                
-                if total_standardized <= 5:
-                    print(f"  Standardized: {file_path.name} → {new_name}")
-    
-    if total_standardized > 0:
-        print(f"\n✅ Standardized {total_standardized} file extensions")
-    else:
-        print("✅ All extensions already standardized")
-
-def rename_all_images():
-    """Rename all image files to include batch number with consistent extensions"""
-    
-    print("\n🔄 RENAMING ALL IMAGES")
-    print("=" * 60)
-    
-    total_renamed = 0
-    
-    for batch_num in range(1, 16):
-        batch_dir = DATASET_PATH / f"batch_{batch_num}"
-        
-        if not batch_dir.exists():
-            print(f"❌ Batch {batch_num} not found: {batch_dir}")
+
+        img['file_name'] = renamed.get(old_path, target_name(int(match.group(1)), old_filename))
+        updated += 1
+
+    return updated, errors
+
+
+def write_journal(plan, annotations_tmp):
+    with open(JOURNAL_FILE, 'w') as f:
+        f.write(json.dumps({'plan': plan, 'annotations_tmp': str(annotations_tmp),
+                            'annotations_out': str(UPDATED_ANNOTATIONS_FILE)}) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_journal():
+    """(header, set of completed renames); the last line may be torn by a crash"""
+    with open(JOURNAL_FILE, 'r') as f:
+        lines = f.read().splitlines()
+    header = json.loads(lines[0])
+    done = set()
+    for line in lines[1:]:
+        try:
+            done.add(tuple(json.loads(line)['done']))
+        except (ValueError, KeyError):
             continue
-        
-        print(f"\n📁 Processing {batch_dir.name}:")
-        
-        # Get all image files (now all lowercase extensions)
-        image_extensions = ['.jpg', '.jpeg', '.png']
-        image_files = []
-        
-        for ext in image_extensions:
-            image_files.extend(sorted(batch_dir.glob(f"*{ext}")))
-        
-        print(f"  Found {len(image_files)} images")
-        
-        # Rename each file
-        batch_renamed = 0
-        for img_path in image_files:
-            # Get original name
-            original_name = img_path.name
-            name_without_ext = img_path.stem
-            extension = img_path.suffix.lower()  # Already lowercase
-            
-            # Create new name: batch_X_originalname.ext (lowercase)
-            new_name = f"batch_{batch_num}_{name_without_ext}{extension}"
-            new_path = batch_dir / new_name
-            
-            # Check if already renamed
-            if original_name == new_name:
-                print(f"  ⚠️  Already renamed: {original_name}")
-                continue
-            
-            # Rename the file
-            try:
-                img_path.rename(new_path)
-                batch_renamed += 1
-                total_renamed += 1
-                
-                if batch_renamed <= 3:  # Show first 3 renames per batch
-                    print(f"  ✅ {original_name} → {new_name}")
-                    
-            except Exception as e:
-                print(f"  ❌ Failed to rename {original_name}: {e}")
-        
-        print(f"  Renamed {batch_renamed} files in this batch")
-    
-    print(f"\n" + "=" * 60)
-    print(f"🎯 TOTAL RENAMED: {total_renamed} images")
-    print("=" * 60)
-    
-    return total_renamed
+    return header, done
+
+
+def rename_batch(ops, journal, direction='forward', journal_lock=None):
+    """Run the renames of one batch directory; the file system is the source of truth.
+
+    Batches run in parallel threads sharing one journal, so each record is
+    written under journal_lock to keep lines whole.
+    """
+    journal_lock = journal_lock or threading.Lock()
+    renamed = 0
+    failed = []
+    for batch, old, new in ops:
+        src, dst = (old, new) if direction == 'forward' else (new, old)
+        src_path = DATASET_PATH / batch / src
+        dst_path = DATASET_PATH / batch / dst
+
+        if not src_path.exists() and dst_path.exists():
+            continue  # finished before the crash
+        if dst_path.exists():
+            failed.append(f"{batch}/{src}: target {dst} exists")
+            continue
+        try:
+            os.rename(src_path, dst_path)
+        except OSError as e:
+            failed.append(f"{batch}/{src}: {e}")
+            continue
+
+        renamed += 1
+        if journal is not None:
+            with journal_lock:
+                journal.write(json.dumps({'done': [batch, old, new]}) + '\n')
+
+    return renamed, failed
+
+
+def run_renames(plan, direction='forward', workers=WORKERS):
+    by_batch = {}
+    for op in plan:
+        by_batch.setdefault(op[0], []).append(op)
+
+    journal_lock = threading.Lock()
+    with open(JOURNAL_FILE, 'a', buffering=1) as journal:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda ops: rename_batch(ops, journal, direction, journal_lock),
+                                    by_batch.values()))
+        journal.flush()
+        os.fsync(journal.fileno())
+
+    total = sum(r for r, _ in results)
+    failed = [f for _, fs in results for f in fs]
+    return total, failed
+
+
+def verify_renaming(data):
+    """Check that every annotated image exists under its new name (all files, not a sample)"""
 
-def verify_renaming():
-    """Verify that files were renamed correctly and have consistent extensions"""
-    
     print("\n🔍 VERIFICATION")
     print("-" * 40)
-    
-    # Check a few batches
-    sample_batches = [1, 5, 10, 15]
-    
-    for batch_num in sample_batches:
-        batch_dir = DATASET_PATH / f"batch_{batch_num}"
-        
-        if not batch_dir.exists():
+
+    on_disk = {}
+    for batch_num, batch_dir in find_batch_dirs():
+        on_disk[batch_num] = set(os.listdir(batch_dir))
+
+    missing = []
+    bad_format = []
+    for img in data['images']:
+        filename = img['file_name']
+        parts = filename.split('_')
+        if len(parts) < 3 or parts[0] != 'batch' or not parts[1].isdigit():
+            bad_format.append(filename)
             continue
-        
-        print(f"\nChecking {batch_dir.name}:")
-        
-        # Get first 5 files
-        image_files = []
-        for ext in ['.jpg', '.jpeg', '.png']:
-            image_files.extend(batch_dir.glob(f"*{ext}"))
-        
-        # Sort and show first 5
-        image_files = sorted(image_files)[:5]
-        
-        for img_path in image_files:
-            filename = img_path.name
-            
-            # Check 1: filename starts with batch_X_
-            correct_prefix = filename.startswith(f"batch_{batch_num}_")
-            
-            # Check 2: extension is lowercase
-            correct_extension = img_path.suffix in ['.jpg', '.jpeg', '.png']
-            
-            if correct_prefix and correct_extension:
-                print(f"  ✅ {filename} (correct)")
-            else:
-                issues = []
-                if not correct_prefix:
-                    issues.append("missing batch prefix")
-                if not correct_extension:
-                    issues.append(f"bad extension: {img_path.suffix}")
-                print(f"  ❌ {filename} ({', '.join(issues)})")
-        
-        # Count file types
-        jpg_count = len(list(batch_dir.glob("*.jpg")))
-        JPG_count = len(list(batch_dir.glob("*.JPG")))  # Should be 0
-        jpeg_count = len(list(batch_dir.glob("*.jpeg")))
-        JPEG_count = len(list(batch_dir.glob("*.JPEG")))  # Should be 0
-        png_count = len(list(batch_dir.glob("*.png")))
-        PNG_count = len(list(batch_dir.glob("*.PNG")))  # Should be 0
-        
-        if JPG_count > 0 or JPEG_count > 0 or PNG_count > 0:
-            print(f"  ⚠️  Uppercase extensions found: .JPG={JPG_count}, .JPEG={JPEG_count}, .PNG={PNG_count}")
-
-def create_rename_report(total_renamed):
+        if os.path.splitext(filename)[1] not in IMAGE_EXTENSIONS:
+            bad_format.append(filename)
+        if filename not in on_disk.get(int(parts[1]), ()):
+            missing.append(filename)
+
+    found = len(data['images']) - len(missing)
+    print(f"  Files found: {found:,}/{len(data['images']):,}")
+    print(f"  Bad filename format: {len(bad_format):,}")
+    for filename in missing[:5]:
+        print(f"    - missing: {filename}")
+
+    return found, missing, bad_format
+
+
+def create_rename_report(total_renamed, found, total):
     """Create a report of the renaming process"""
-    
+
     print("\n📋 CREATING RENAME REPORT")
     print("-" * 40)
-    
+
     report_lines = [
         "=" * 60,
         "IMAGE RENAMING REPORT",
         "=" * 60,
         f"\nDataset: {DATASET_PATH}",
         f"Total images renamed: {total_renamed}",
+        f"Annotations: {UPDATED_ANNOTATIONS_FILE.name} ({found}/{total} files found)",
         f"Timestamp: {os.popen('date').read().strip()}",
         "\nBatch Summary:",
         "-" * 40
     ]
-    
+
     # Count files per batch
-    for batch_num in range(1, 16):
-        batch_dir = DATASET_PATH / f"batch_{batch_num}"
-        
-        if batch_dir.exists():
-            # Count all image files
-            image_count = 0
-            for ext in ['.jpg', '.jpeg', '.png']:
-                image_count += len(list(batch_dir.glob(f"*{ext}")))
-            
-            report_lines.append(f"batch_{batch_num}: {image_count} images")
-    
+    for batch_num, batch_dir in find_batch_dirs():
+        image_count = sum(1 for name in os.listdir(batch_dir)
+                          if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS)
+        report_lines.append(f"batch_{batch_num}: {image_count} images")
+
     # Save report
     report_file = DATASET_PATH / "rename_report.txt"
     with open(report_file, 'w') as f:
         f.write('\n'.join(report_lines))
-    
+
     print(f"📄 Report saved to: {report_file}")
-    
+
     return report_file
 
-if __name__ == "__main__":
+
+def commit(header):
+    """Move the new annotations into place and close the journal"""
+    tmp = Path(header['annotations_tmp'])
+    if tmp.exists():
+        os.replace(tmp, header['annotations_out'])
+    JOURNAL_FILE.unlink()
+
+
+def rename_dataset(dry_run=False, workers=WORKERS):
     print("=" * 60)
     print("🔄 COMPLETE IMAGE RENAMING PROCESS")
     print("=" * 60)
-    
-    # Step 0: Backup if requested
-    if BACKUP_FIRST:
-        create_backup()
-    
-    # Step 1: Standardize extensions to lowercase
-    standardize_extensions()
-    
-    # Step 2: Rename all images
-    total_renamed = rename_all_images()
-    
-    # Step 3: Verify
-    verify_renaming()
-    
-    # Step 4: Create report
-    report_file = create_rename_report(total_renamed)
-    
+
+    plan, problems = plan_renames()
+    if problems:
+        print(f"\n❌ {len(problems)} conflicts, nothing was renamed:")
+        for problem in problems[:10]:
+            print(f"  - {problem}")
+        return None
+
+    with open(ANNOTATIONS_FILE, 'r') as f:
+        data = json.load(f)
+    updated, errors = update_annotation_paths(data, plan)
+
+    print(f"\n📊 Plan: {len(plan):,} renames, {updated:,} annotation paths updated")
+    for old in plan[:5]:
+        print(f"  {old[0]}/{old[1]} → {old[2]}")
+    if errors:
+        print(f"⚠️  {len(errors)} annotation paths not understood, e.g. {errors[0]}")
+
+    if dry_run:
+        print("\n(dry run, nothing changed)")
+        return data, 0
+
+    # New annotations are written next to their final name first, then the journal
+    annotations_tmp = UPDATED_ANNOTATIONS_FILE.with_suffix('.json.tmp')
+    with open(annotations_tmp, 'w') as f:
+        json.dump(data, f, indent=2)
+    write_journal(plan, annotations_tmp)
+
+    total_renamed, failed = run_renames(plan, 'forward', workers)
+    print(f"\n🎯 TOTAL RENAMED: {total_renamed} images")
+
+    if failed:
+        print(f"\n❌ {len(failed)} renames failed; run with --resume after fixing or --rollback:")
+        for failure in failed[:10]:
+            print(f"  - {failure}")
+        return None
+
+    commit({'annotations_tmp': str(annotations_tmp), 'annotations_out': str(UPDATED_ANNOTATIONS_FILE)})
+    return data, total_renamed
+
+
+def resume(workers=WORKERS):
+    header, done = read_journal()
+    pending = [op for op in header['plan'] if tuple(op) not in done]
+    print(f"▶️  Resuming: {len(done)} renames journaled, {len(pending)} left to check")
+    total, failed = run_renames(pending, 'forward', workers)
+    if failed:
+        print(f"❌ {len(failed)} renames still failing, e.g. {failed[0]}")
+        return None
+    commit(header)
+    with open(header['annotations_out'], 'r') as f:
+        data = json.load(f)
+    return data, len(done) + total
+
+
+def rollback(workers=WORKERS):
+    header, _ = read_journal()
+    total, failed = run_renames(header['plan'], 'backward', workers)
+    print(f"⏪ Rolled back {total} renames")
+    if failed:
+        print(f"❌ {len(failed)} files could not be restored, e.g. {failed[0]}")
+        return False
+    Path(header['annotations_tmp']).unlink(missing_ok=True)
+    JOURNAL_FILE.unlink()
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rename batch images and update the annotations in one transaction')
+    parser.add_argument('--dry-run', action='store_true', help='Only print the plan')
+    parser.add_argument('--resume', action='store_true', help='Finish an interrupted run from its journal')
+    parser.add_argument('--rollback', action='store_true', help='Undo an interrupted run from its journal')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='Batch directories renamed in parallel')
+    parser.add_argument('--dataset', type=Path, help=f'Dataset folder (default: {DATASET_PATH})')
+    args = parser.parse_args()
+
+    if args.dataset:
+        set_dataset_path(args.dataset)
+
+    if JOURNAL_FILE.exists() and not (args.resume or args.rollback):
+        print(f"⚠️  Unfinished run found ({JOURNAL_FILE.name}). Use --resume or --rollback.")
+        sys.exit(1)
+
+    # Failures exit nonzero so pipeline.py does not record the stage as done
+    if args.rollback:
+        if not rollback(args.workers):
+            sys.exit(1)
+        return
+
+    result = resume(args.workers) if args.resume else rename_dataset(args.dry_run, args.workers)
+    if result is None:
+        sys.exit(1)
+    if args.dry_run and not args.resume:
+        return
+
+    data, total_renamed = result
+    found, missing, bad_format = verify_renaming(data)
+    create_rename_report(total_renamed, found, len(data['images']))
+
     print("\n" + "=" * 60)
     print("🎉 RENAMING PROCESS COMPLETE!")
     print("=" * 60)
-    print("\nNext step: Run 'python update_annotations.py'")
\ No newline at end of file
+    print(f"\n💾 Annotations: {UPDATED_ANNOTATIONS_FILE}")
+    print("\nNext step: Run 'python verify_dataset.py'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+# resize_cache.py
+# Pre-resized training image cache: decode + downsize every image once instead
+# of once per epoch in the data loader.
+#
+# Ultralytics resizes each image so its long side equals imgsz before any
+# augmentation, so an image already stored at that size skips that step. The
+# pixels are close to, not identical with, a resize of the original: the cache
+# downsizes with INTER_AREA and re-encodes at JPEG_QUALITY. YOLO labels are
+# normalized, so they are reused unchanged.
+#
+# resize_cache.json in the output records imgsz and quality; a run with other
+# settings (or after an interrupted forced run) re-resizes every image.
+#
+#   python resize_cache.py --input balanced_final --output cache_640 --imgsz 640
+#   yolo detect train data=cache_640/dataset.yaml imgsz=640 ...
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from dataset_manifest import (add_entry, format_label_text, load_dataset, new_manifest, save_virtual_dataset,
+                              unique_names)
+from dataset_utils import link_file
+from shard_dataset import pack
+
+# ========== CONFIGURATION ==========
+INPUT_DIR = "/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/balanced_final"
+OUTPUT_DIR = "/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/cache_640"
+IMGSZ = 640
+JPEG_QUALITY = 95
+WORKERS = os.cpu_count() or 1
+# ===================================
+
+SETTINGS_NAME = 'resize_cache.json'
+
+# cv2 can decode JPEGs at 1/2, 1/4 or 1/8 scale directly in the DCT domain
+REDUCED_FLAGS = [(8, 'IMREAD_REDUCED_COLOR_8'), (4, 'IMREAD_REDUCED_COLOR_4'), (2, 'IMREAD_REDUCED_COLOR_2')]
+
+
+def decode_for_size(path, imgsz, square=False):
+    """Decode an image at the smallest reduced scale whose long side is still >= imgsz.
+
+    With square=True the short side must stay >= imgsz instead, for images
+    that are then stretched to imgsz x imgsz: neither side gets upsampled.
+    """
+    import cv2
+    from verify_dataset import read_image_header
+
+    flag = cv2.IMREAD_COLOR
+    try:
+        width, height, _ = read_image_header(path)
+        side = min(width, height) if square else max(width, height)
+        for factor, name in REDUCED_FLAGS:
+            if side // factor >= imgsz:
+                flag = getattr(cv2, name)
+                break
+    except (OSError, ValueError):
+        pass
+    return cv2.imread(str(path), flag)
+
+
+def resize_long_side(img, imgsz):
+    """Same resize Ultralytics applies when loading: long side -> imgsz, aspect kept"""
+    import cv2
+
+    h, w = img.shape[:2]
+    r = imgsz / max(h, w)
+    if r == 1:
+        return img
+    interp = cv2.INTER_AREA if r < 1 else cv2.INTER_LINEAR
+    return cv2.resize(img, (min(imgsz, round(w * r)), min(imgsz, round(h * r))), interpolation=interp)
+
+
+def resize_job(job):
+    """Write one resized image; returns 'cached', 'resized' or 'failed'"""
+    import cv2
+
+    src, dst, imgsz, quality, force = job
+    if not force and os.path.exists(dst) and os.stat(dst).st_mtime >= os.stat(src).st_mtime:
+        return 'cached'
+
+    img = decode_for_size(src, imgsz)
+    if img is None:
+        return 'failed'
+    img = resize_long_side(img, imgsz)
+
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality] if dst.lower().endswith(('.jpg', '.jpeg')) else []
+    tmp = dst + '.tmp' + os.path.splitext(dst)[1]
+    if not cv2.imwrite(tmp, img, params):
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise OSError(f"could not write {dst}")
+    os.replace(tmp, dst)
+    return 'resized'
+
+
+def time_loading(paths, imgsz, n=50):
+    """Seconds per image to load + resize like the training loader does"""
+    import cv2
+
+    paths = paths[:n]
+    if not paths:
+        return 0.0
+    start = time.perf_counter()
+    for path in paths:
+        img = cv2.imread(str(path))
+        if img is not None:
+            resize_long_side(img, imgsz)
+    return (time.perf_counter() - start) / len(paths)
+
+
+def read_settings(output_dir):
+    path = Path(output_dir) / SETTINGS_NAME
+    if not path.exists():
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def write_settings(output_dir, settings):
+    with open(Path(output_dir) / SETTINGS_NAME, 'w') as f:
+        json.dump(settings, f, indent=2)
+
+
+def build_cache(input_dir=INPUT_DIR, output_dir=OUTPUT_DIR, imgsz=IMGSZ, workers=WORKERS,
+                quality=JPEG_QUALITY, memmap=False, force=False, benchmark=False):
+    print("🖼️  Pre-resized image cache")
+    print(f"Input: {input_dir}")
+    print(f"Output: {output_dir}")
+    print(f"Size: long side {imgsz}px\n")
+
+    dataset = load_dataset(input_dir)
+    output_dir = Path(output_dir)
+    cache = new_manifest(dataset['names'])
+
+    # mtimes only say an image is newer than its source, not that it has this size
+    settings = {'imgsz': imgsz, 'quality': quality}
+    previous = read_settings(output_dir)
+    if not force and (previous is None or
+                      {k: previous.get(k) for k in settings} != settings or
+                      (not previous.get('complete') and previous.get('forced'))):
+        if previous is not None:
+            print(f"♻️  Cached images were written with other settings ({previous}), re-resizing all")
+        force = True
+    output_dir.mkdir(parents=True, exist_ok=True)
+    write_settings(output_dir, dict(settings, complete=False, forced=force))
+
+    jobs = []
+    placed = []
+    for split, entries in dataset['splits'].items():
+        (output_dir / split / 'images').mkdir(parents=True, exist_ok=True)
+        (output_dir / split / 'labels').mkdir(parents=True, exist_ok=True)
+        for entry, name in zip(entries, unique_names(entries)):
+            dst = output_dir / split / 'images' / name
+            jobs.append((entry['image'], str(dst), imgsz, quality, force))
+            placed.append((split, entry, dst))
+
+    print(f"🔄 Resizing {len(jobs):,} images with {workers} processes...")
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(resize_job, jobs, chunksize=16))
+    elapsed = time.perf_counter() - start
+    write_settings(output_dir, dict(settings, complete=True))
+
+    status_counts = Counter(results)
+    for (split, entry, dst), status in zip(placed, results):
+        if status == 'failed':
+            print(f"  ⚠️  Could not read {entry['image']}")
+            continue
+        # Labels are normalized, so the original ones stay valid after resizing
+        label = output_dir / split / 'labels' / f"{dst.stem}.txt"
+        if 'boxes' in entry:
+            label.write_text(format_label_text(entry['boxes']))
+            add_entry(cache, split, dst, label=label)
+        elif 'label' in entry and Path(entry['label']).exists():
+            link_file(entry['label'], label, 'hardlink')
+            add_entry(cache, split, dst, label=label)
+        else:
+            add_entry(cache, split, dst)
+
+    print("📦 " + ", ".join(f"{s}={c}" for s, c in sorted(status_counts.items())) + f" ({elapsed:.1f}s)")
+
+    yaml_path = save_virtual_dataset(cache, output_dir, 'dataset.yaml')
+
+    if memmap:
+        # Decoded pixels at imgsz: the loader maps them without decoding or resizing
+        shard_yaml = pack(output_dir, output_dir / 'shards', encoding='raw')
+        print(f"🧱 Raw shards: {shard_yaml}")
+
+    if benchmark:
+        train = dataset['splits'].get('train', [])
+        cached = cache['splits'].get('train', [])
+        before = time_loading([e['image'] for e in train], imgsz)
+        after = time_loading([e['image'] for e in cached], imgsz)
+        print(f"\n⏱️  Image load per epoch ({len(train):,} train images, single core):")
+        print(f"  Original: {before * 1000:.1f} ms/img → {before * len(train):.0f}s per epoch")
+        print(f"  Cached:   {after * 1000:.1f} ms/img → {after * len(train):.0f}s per epoch")
+        if after:
+            print(f"  Speed-up: {before / after:.1f}x")
+
+    print(f"\n✅ Cache ready: {yaml_path}")
+    print(f"🎯 Train with: yolo detect train data={yaml_path} imgsz={imgsz} model=yolo11s.pt")
+    return yaml_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a copy of a dataset with images pre-resized to imgsz')
+    parser.add_argument('--input', default=INPUT_DIR, help='YOLO folder, manifest.json or folder holding one')
+    parser.add_argument('--output', default=OUTPUT_DIR, help='Cache folder')
+    parser.add_argument('--imgsz', type=int, default=IMGSZ, help='Training image size (long side)')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='Resize processes')
+    parser.add_argument('--quality', type=int, default=JPEG_QUALITY, help='JPEG quality of the cached images')
+    parser.add_argument('--memmap', action='store_true',
+                        help='Also pack the cache into raw uint8 shards (see shard_dataset.py)')
+    parser.add_argument('--force', action='store_true', help='Re-resize images that are already cached')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='Time image loading from the originals and from the cache')
+    args = parser.parse_args()
+
+    build_cache(args.input, args.output, args.imgsz, args.workers, args.quality, args.memmap,
+                args.force, args.benchmark)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+# shard_dataset.py
+# Sharded, memory-mapped dataset format: a split is packed into a few large
+# files instead of one image + one label file per sample, so an epoch is a
+# handful of mmaps instead of thousands of small random open()/read() calls.
+#
+# Layout of a packed dataset:
+#   shards.json                 format, names, encoding, shard list per split
+#   data.yaml                   for Ultralytics (train: train, val: val)
+#   <split>/00000.shard ...     image payloads back to back
+#   <split>/index.npy           per image: shard, offset, length, height, width,
+#                               label_start, label_count
+#   <split>/labels.npy          float32 (N, 5) class, xc, yc, w, h of all boxes
+#   <split>/files.txt           original image path of every record
+#
+# encoding='encoded' stores the JPEG/PNG bytes unchanged (decoded on read);
+# encoding='raw' stores decoded uint8 BGR pixels (no decode on read, best
+# combined with resize_cache.py so the pixels are already at imgsz).
+#
+#   python shard_dataset.py pack balanced_final shards_final
+#   python shard_dataset.py info shards_final
+import argparse
+import json
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+from dataset_manifest import load_dataset, read_boxes
+
+SHARD_FORMAT = 'ecowheels-shards'
+SHARD_VERSION = 1
+SHARDS_NAME = 'shards.json'
+ENCODINGS = ['encoded', 'raw']
+SHARD_SIZE_MB = 1024
+WORKERS = min(32, (os.cpu_count() or 1) * 4)
+READ_AHEAD = 2          # records in flight per worker; bounds the memory held by reads not yet written
+
+INDEX_DTYPE = np.dtype([
+    ('shard', '<u4'), ('offset', '<u8'), ('length', '<u8'),
+    ('height', '<u4'), ('width', '<u4'),
+    ('label_start', '<u8'), ('label_count', '<u4'),
+])
+
+
+def _read_record(entry, encoding):
+    """(payload bytes, height, width) of one manifest entry, or None if unreadable"""
+    if encoding == 'raw':
+        import cv2
+
+        img = cv2.imread(entry['image'])
+        if img is None:
+            return None
+        return img.tobytes(), img.shape[0], img.shape[1]
+
+    from verify_dataset import read_image_header
+
+    try:
+        width, height, _ = read_image_header(entry['image'])
+        with open(entry['image'], 'rb') as f:
+            return f.read(), height, width
+    except (OSError, ValueError):
+        return None
+
+
+def _read_ahead(entries, encoding, workers, window):
+    """Yield (entry, record) in order while at most `window` later reads run in a thread pool"""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        queued = 0
+        while queued < len(entries) or pending:
+            while queued < len(entries) and len(pending) < window:
+                pending.append((entries[queued], pool.submit(_read_record, entries[queued], encoding)))
+                queued += 1
+            entry, future = pending.popleft()
+            yield entry, future.result()
+
+
+def pack_split(entries, split_dir, encoding='encoded', shard_size_mb=SHARD_SIZE_MB, workers=WORKERS):
+    """Pack manifest entries into split_dir; returns (shard file names, records written)"""
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}', expected one of {ENCODINGS}")
+
+    split_dir = Path(split_dir)
+    split_dir.mkdir(parents=True, exist_ok=True)
+    shard_limit = shard_size_mb * 1024 * 1024
+
+    index = []
+    boxes = []
+    files = []
+    shards = []
+    shard = None
+    label_start = 0
+
+    # Reads run a bounded distance ahead in a thread pool, writes stay sequential and in order
+    for entry, record in _read_ahead(entries, encoding, workers, workers * READ_AHEAD):
+        if record is None:
+            print(f"  ⚠️  Could not read {entry['image']}")
+            continue
+        payload, height, width = record
+
+        if shard is None or (shard.tell() and shard.tell() + len(payload) > shard_limit):
+            if shard is not None:
+                shard.close()
+            shards.append(f"{len(shards):05d}.shard")
+            shard = open(split_dir / shards[-1], 'wb')
+
+        entry_boxes = read_boxes(entry)
+        index.append((len(shards) - 1, shard.tell(), len(payload), height, width,
+                      label_start, len(entry_boxes)))
+        shard.write(payload)
+        boxes.extend(entry_boxes)
+        label_start += len(entry_boxes)
+        files.append(entry['image'])
+
+    if shard is not None:
+        shard.close()
+
+    np.save(split_dir / 'index.npy', np.array(index, dtype=INDEX_DTYPE))
+    np.save(split_dir / 'labels.npy', np.array(boxes, dtype=np.float32).reshape(-1, 5))
+    (split_dir / 'files.txt').write_text(''.join(f + '\n' for f in files))
+    return shards, len(index)
+
+
+def pack(source, out_dir, encoding='encoded', shard_size_mb=SHARD_SIZE_MB, workers=WORKERS):
+    """Pack every split of a dataset (manifest, manifest folder or YOLO folder)"""
+    manifest = load_dataset(source)
+    out_dir = Path(out_dir)
+    meta = {'format': SHARD_FORMAT, 'version': SHARD_VERSION, 'names': manifest['names'],
+            'encoding': encoding, 'splits': {}}
+
+    for split, entries in manifest['splits'].items():
+        shards, count = pack_split(entries, out_dir / split, encoding, shard_size_mb, workers)
+        meta['splits'][split] = {'count': count, 'shards': shards}
+        size = sum((out_dir / split / s).stat().st_size for s in shards)
+        print(f"🧱 {split}: {count:,} images in {len(shards)} shards ({size / 1e6:.0f} MB)")
+
+    with open(out_dir / SHARDS_NAME, 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    # Ultralytics only checks that the split paths exist; ShardDetectionTrainer reads them
+    data_yaml = {'path': str(out_dir.absolute())}
+    for split in meta['splits']:
+        data_yaml[split] = split
+    data_yaml['nc'] = len(manifest['names'])
+    data_yaml['names'] = manifest['names']
+    with open(out_dir / 'data.yaml', 'w') as f:
+        yaml.dump(data_yaml, f, default_flow_style=False, sort_keys=False)
+    return out_dir / 'data.yaml'
+
+
+def load_shards_meta(root):
+    with open(Path(root) / SHARDS_NAME, 'r') as f:
+        meta = json.load(f)
+    if meta.get('format') != SHARD_FORMAT:
+        raise ValueError(f"{root} is not a sharded dataset")
+    if meta.get('version', 0) > SHARD_VERSION:
+        raise ValueError(f"{root} uses shard version {meta['version']}, "
+                         f"this tool only understands up to {SHARD_VERSION}")
+    return meta
+
+
+class ShardReader:
+    """Random access to the images and labels of one packed split.
+
+    Shards are mapped lazily, once per process, so a reader can be handed to
+    DataLoader worker processes (the maps are not pickled, each worker opens
+    its own).
+    """
+
+    def __init__(self, root, split):
+        self.root = Path(root)
+        self.split = split
+        meta = load_shards_meta(self.root)
+        self.encoding = meta['encoding']
+        self.names = meta['names']
+        self.shard_files = [self.root / split / s for s in meta['splits'][split]['shards']]
+        self.index = np.load(self.root / split / 'index.npy')
+        self.boxes = np.load(self.root / split / 'labels.npy')
+        self.files = (self.root / split / 'files.txt').read_text().splitlines()
+        self._maps = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_maps'] = None
+        return state
+
+    def __len__(self):
+        return len(self.index)
+
+    def _open(self):
+        maps = []
+        for path in self.shard_files:
+            with open(path, 'rb') as f:
+                maps.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        self._maps = maps
+
+    def payload(self, i):
+        """Zero-copy view of the stored bytes of record i"""
+        if self._maps is None:
+            self._open()
+        rec = self.index[i]
+        offset = int(rec['offset'])
+        return np.frombuffer(self._maps[int(rec['shard'])], dtype=np.uint8,
+                             count=int(rec['length']), offset=offset)
+
+    def image(self, i):
+        """BGR uint8 image of record i, as cv2.imread would return it"""
+        data = self.payload(i)
+        rec = self.index[i]
+        if self.encoding == 'raw':
+            return data.reshape(int(rec['height']), int(rec['width']), 3)
+        import cv2
+        return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+    def labels(self, i):
+        """(n, 5) float32 array of class, xc, yc, w, h"""
+        rec = self.index[i]
+        start = int(rec['label_start'])
+        return self.boxes[start:start + int(rec['label_count'])]
+
+    def shape(self, i):
+        rec = self.index[i]
+        return int(rec['height']), int(rec['width'])
+
+
+def _ultralytics_dataset_class():
+    """Build the Ultralytics adapter on first use so the packer works without ultralytics"""
+    import math
+
+    import cv2
+    from ultralytics.data import YOLODataset
+
+    class ShardYOLODataset(YOLODataset):
+        """YOLODataset that reads images and labels from a packed split instead of files"""
+
+        def get_img_files(self, img_path):
+            self.shards = ShardReader(Path(img_path).parent, Path(img_path).name)
+            # Rect mode reorders im_files, so records are looked up by file, not position
+            self.record_of = {f: i for i, f in enumerate(self.shards.files)}
+            return list(self.shards.files)
+
+        def get_labels(self):
+            labels = []
+            for i, im_file in enumerate(self.shards.files):
+                boxes = self.shards.labels(i)
+                labels.append({
+                    'im_file': im_file,
+                    'shape': self.shards.shape(i),
+                    'cls': boxes[:, 0:1].copy(),
+                    'bboxes': boxes[:, 1:5].copy(),
+                    'segments': [],
+                    'keypoints': None,
+                    'normalized': True,
+                    'bbox_format': 'xywh',
+                })
+            return labels
+
+        def load_image(self, i, rect_mode=True):
+            # Same resize and buffer handling as BaseDataset.load_image, minus the file read
+            if self.ims[i] is not None:
+                return self.ims[i], self.im_hw0[i], self.im_hw[i]
+
+            im = self.shards.image(self.record_of[self.im_files[i]])
+            if im is None:
+                raise FileNotFoundError(f"Image not decodable from shards: {self.im_files[i]}")
+            h0, w0 = im.shape[:2]
+            if rect_mode:
+                r = self.imgsz / max(h0, w0)
+                if r != 1:
+                    w, h = min(math.ceil(w0 * r), self.imgsz), min(math.ceil(h0 * r), self.imgsz)
+                    im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+            elif not (h0 == w0 == self.imgsz):
+                im = cv2.resize(im, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+            if not im.flags.writeable:
+                im = im.copy()  # raw images are read-only views into the mmap
+
+            if self.augment:
+                self.ims[i], self.im_hw0[i], self.im_hw[i] = im, (h0, w0), im.shape[:2]
+                self.buffer.append(i)
+                if 1 < len(self.buffer) >= getattr(self, 'max_buffer_length', 0):
+                    j = self.buffer.pop(0)
+                    if self.cache != 'ram':
+                        self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+            return im, (h0, w0), im.shape[:2]
+
+    return ShardYOLODataset
+
+
+def shard_detection_trainer():
+    """DetectionTrainer that builds its datasets from shards.
+
+        from ultralytics import YOLO
+        from shard_dataset import shard_detection_trainer
+        YOLO('yolo11s.pt').train(data='shards_final/data.yaml', trainer=shard_detection_trainer())
+    """
+    from ultralytics.models.yolo.detect import DetectionTrainer
+    from ultralytics.utils import colorstr
+
+    dataset_class = _ultralytics_dataset_class()
+
+    class ShardDetectionTrainer(DetectionTrainer):
+        def build_dataset(self, img_path, mode='train', batch=None):
+            stride = max(int(self.model.stride.max() if self.model else 0), 32)
+            return dataset_class(
+                img_path=img_path,
+                imgsz=self.args.imgsz,
+                batch_size=batch,
+                augment=mode == 'train',
+                hyp=self.args,
+                rect=mode == 'val',
+                cache=self.args.cache or None,
+                single_cls=self.args.single_cls or False,
+                stride=stride,
+                pad=0.0 if mode == 'train' else 0.5,
+                prefix=colorstr(f"{mode}: "),
+                task=self.args.task,
+                classes=self.args.classes,
+                data=self.data,
+            )
+
+    return ShardDetectionTrainer
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack datasets into memory-mapped shards')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('pack', help='Pack a YOLO folder or manifest into shards')
+    p.add_argument('dataset', help='YOLO folder, manifest.json or folder holding one')
+    p.add_argument('output', help='Output folder for the shards')
+    p.add_argument('--encoding', choices=ENCODINGS, default='encoded',
+                   help='encoded: original JPEG/PNG bytes, raw: decoded pixels')
+    p.add_argument('--shard-size', type=int, default=SHARD_SIZE_MB, help='Max shard size in MB')
+    p.add_argument('--workers', type=int, default=WORKERS, help='Reader threads')
+
+    p = sub.add_parser('info', help='Print the contents of a sharded dataset')
+    p.add_argument('output')
+
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        yaml_path = pack(args.dataset, args.output, args.encoding, args.shard_size, args.workers)
+        print(f"✅ Wrote {yaml_path}")
+    elif args.command == 'info':
+        meta = load_shards_meta(args.output)
+        print(f"Classes: {len(meta['names'])}, encoding: {meta['encoding']}")
+        for split, info in meta['splits'].items():
+            print(f"  {split}: {info['count']} images in {len(info['shards'])} shards")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import cv2
+import json
 import time
 import numpy as np
+from pathlib import Path
 from fastapi import FastAPI
 from fastapi.responses import StreamingResponse, JSONResponse
 from ultralytics import YOLO
@@ -8,17 +10,75 @@ from ultralytics import YOLO
 # ================= CONFIG =================
 DROIDCAM_URL = "http://192.168.5.131:4747/video"  # change this
 MODEL_PATH = "/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/runs/detect/train2/weights/best.pt"
+
+# Cascade: a cheap gate model runs on every frame, the full model only where it finds something.
+# Gate settings written by `python cascade.py` override the ones below.
+CASCADE = True
+CASCADE_CONFIG = "/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/runs/cascade.json"
+GATE_MODEL_PATH = "/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/runs/detect/gate/weights/best.pt"
+GATE_IMGSZ = 320
+GATE_CONF = 0.1
+CASCADE_MODE = "frame"   # "frame": full model on the whole frame, "crop": only on the region the gate flagged
+CROP_MARGIN = 0.25       # crop mode: padding around the gate boxes, as a fraction of their extent
 # ==========================================
 
 app = FastAPI()
 model = YOLO(MODEL_PATH)
 
+gate = None
+if CASCADE:
+    if Path(CASCADE_CONFIG).exists():
+        with open(CASCADE_CONFIG) as f:
+            tuned = json.load(f)
+        GATE_MODEL_PATH = tuned.get("gate_weights", GATE_MODEL_PATH)
+        GATE_IMGSZ = tuned.get("gate_imgsz", GATE_IMGSZ)
+        GATE_CONF = tuned.get("gate_conf", GATE_CONF)
+    if Path(GATE_MODEL_PATH).exists():
+        gate = YOLO(GATE_MODEL_PATH)
+    else:
+        print(f"⚠️  Gate model {GATE_MODEL_PATH} not found, running the full model on every frame")
+
+# Cascade counters for /stats
+stats = {"frames": 0, "full_runs": 0, "gate_seconds": 0.0, "full_seconds": 0.0}
+
 cap = cv2.VideoCapture(DROIDCAM_URL)
 
 if not cap.isOpened():
     raise RuntimeError("Could not open DroidCam stream")
 
 
+def gate_region(boxes, shape):
+    """Bounding region (x1, y1, x2, y2) of the gate boxes, padded by CROP_MARGIN"""
+    h, w = shape[:2]
+    x1, y1 = boxes[:, 0].min(), boxes[:, 1].min()
+    x2, y2 = boxes[:, 2].max(), boxes[:, 3].max()
+    pad_x, pad_y = (x2 - x1) * CROP_MARGIN, (y2 - y1) * CROP_MARGIN
+    return (int(max(0, x1 - pad_x)), int(max(0, y1 - pad_y)),
+            int(min(w, x2 + pad_x)), int(min(h, y2 + pad_y)))
+
+
+def detect(frame):
+    """Annotated frame, running the full model only when the gate (if any) flags the frame"""
+    stats["frames"] += 1
+    if gate is not None:
+        start = time.perf_counter()
+        flagged = gate(frame, imgsz=GATE_IMGSZ, conf=GATE_CONF, verbose=False)[0].boxes
+        stats["gate_seconds"] += time.perf_counter() - start
+        if not len(flagged):
+            return frame
+
+    start = time.perf_counter()
+    if gate is not None and CASCADE_MODE == "crop":
+        x1, y1, x2, y2 = gate_region(flagged.xyxy.cpu().numpy(), frame.shape)
+        annotated = frame.copy()
+        annotated[y1:y2, x1:x2] = model(frame[y1:y2, x1:x2], verbose=False)[0].plot()
+    else:
+        annotated = model(frame, verbose=False)[0].plot()
+    stats["full_seconds"] += time.perf_counter() - start
+    stats["full_runs"] += 1
+    return annotated
+
+
 def generate_frames():
     while True:
         start = time.time()
@@ -27,8 +87,7 @@ def generate_frames():
         if not ret:
             continue
 
-        results = model(frame, verbose=False)
-        annotated = results[0].plot()
+        annotated = detect(frame)
 
         _, buffer = cv2.imencode(".jpg", annotated)
         yield (
@@ -48,3 +107,19 @@ def video_feed():
         generate_frames(),
         media_type="multipart/x-mixed-replace; boundary=frame"
     )
+
+
+@app.get("/stats")
+def cascade_stats():
+    frames = max(stats["frames"], 1)
+    return JSONResponse({
+        "cascade": gate is not None,
+        "mode": CASCADE_MODE if gate is not None else "full",
+        "gate_conf": GATE_CONF if gate is not None else None,
+        "frames": stats["frames"],
+        "full_runs": stats["full_runs"],
+        "hit_rate": round(stats["full_runs"] / frames, 4),
+        "avg_gate_ms": round(1000 * stats["gate_seconds"] / frames, 2),
+        "avg_full_ms": round(1000 * stats["full_seconds"] / max(stats["full_runs"], 1), 2),
+        "avg_cost_per_frame_ms": round(1000 * (stats["gate_seconds"] + stats["full_seconds"]) / frames, 2),
+    })
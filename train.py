@@ -0,0 +1,132 @@
+# train.py
+# Training entry point on CPU.
+#
+# Batch size, data loader workers, cache mode and torch thread counts come
+# from runs/train_config.yaml (written by autotune.py) when it exists;
+# command-line options override them. --profile records where each step's
+# time goes (profiler.py); --full-val-every validates on a proxy subset each
+# epoch and on the full split every N epochs (proxy_val.py); --hyp takes the
+# hyperparameters found by hpsearch.py.
+#
+#   python train.py --data balanced_final/dataset.yaml --epochs 100
+#   python train.py --batch 4 --workers 2 --name trash_material_v3
+import argparse
+from pathlib import Path
+
+import yaml
+
+# ========== CONFIGURATION ==========
+MODEL = "yolo11s.pt"
+DATA = "/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/balanced_final/dataset.yaml"
+EPOCHS = 100
+IMGSZ = 640
+PATIENCE = 50
+TRAIN_CONFIG = Path("runs/train_config.yaml")
+# Used when there is no tuned config (the notebook's last working settings)
+DEFAULTS = {'batch': 4, 'workers': 2, 'cache': False, 'threads': None, 'interop_threads': None}
+# ===================================
+
+
+def load_train_config(path=TRAIN_CONFIG):
+    """Tuned loader/thread settings, on top of DEFAULTS"""
+    config = dict(DEFAULTS)
+    if Path(path).exists():
+        with open(path, 'r') as f:
+            tuned = yaml.safe_load(f) or {}
+        config.update({k: tuned[k] for k in DEFAULTS if k in tuned})
+    return config
+
+
+def apply_threads(threads=None, interop_threads=None):
+    """Set torch's intra-/inter-op thread pools; must run before any torch work"""
+    import torch
+
+    if threads:
+        torch.set_num_threads(threads)
+    if interop_threads:
+        torch.set_num_interop_threads(interop_threads)
+
+
+def keep_workers(trainer=None):
+    """Trainer class (DetectionTrainer by default) that keeps the requested data loader workers on CPU.
+
+    Ultralytics' BaseTrainer sets args.workers = 0 whenever the device is
+    cpu, so without this every `workers` setting loads data in the main
+    process.
+    """
+    if trainer is None:
+        from ultralytics.models.yolo.detect import DetectionTrainer
+        trainer = DetectionTrainer
+
+    class WorkersTrainer(trainer):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            overrides = kwargs.get('overrides') or {}
+            if overrides.get('workers') is not None:
+                self.args.workers = overrides['workers']
+
+    return WorkersTrainer
+
+
+def train(model=MODEL, data=DATA, epochs=EPOCHS, imgsz=IMGSZ, config_path=TRAIN_CONFIG, profile=False,
+          full_val_every=None, hyp=None, **overrides):
+    config = load_train_config(config_path)
+    config.update({k: v for k, v in overrides.items() if v is not None})
+    if hyp:
+        with open(hyp, 'r') as f:
+            config.update(yaml.safe_load(f) or {})
+        print(f"🎚️  Hyperparameters from {hyp}")
+    source = f"tuned ({config_path})" if Path(config_path).exists() else "defaults"
+    print(f"🏋️  Training {model} on {data}: batch {config['batch']}, workers {config['workers']}, "
+          f"cache {config['cache']}, threads {config['threads'] or 'auto'}/{config['interop_threads'] or 'auto'} "
+          f"[{source}]")
+
+    apply_threads(config.pop('threads'), config.pop('interop_threads'))
+    from ultralytics import YOLO
+
+    yolo = YOLO(model)
+    if profile:
+        from profiler import attach_profiler
+        attach_profiler(yolo)
+    if full_val_every:
+        from proxy_val import proxy_detection_trainer
+        config['trainer'] = proxy_detection_trainer(full_val_every)
+    config['trainer'] = keep_workers(config.get('trainer'))
+    yolo.train(data=str(data), epochs=epochs, imgsz=imgsz, device='cpu', patience=PATIENCE, **config)
+    return yolo
+
+
+def parse_cache(value):
+    """--cache value as Ultralytics expects it: False, 'ram' or 'disk'"""
+    if value.lower() in ('false', 'none', 'no', '0'):
+        return False
+    if value not in ('ram', 'disk'):
+        raise argparse.ArgumentTypeError("cache must be false, ram or disk")
+    return value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the detector with the tuned CPU settings')
+    parser.add_argument('--model', default=MODEL, help='Model to start from (.pt or .yaml)')
+    parser.add_argument('--data', default=DATA, help='Dataset YAML')
+    parser.add_argument('--epochs', type=int, default=EPOCHS, help='Training epochs')
+    parser.add_argument('--imgsz', type=int, default=IMGSZ, help='Training image size')
+    parser.add_argument('--config', type=Path, default=TRAIN_CONFIG, help='Tuned settings written by autotune.py')
+    parser.add_argument('--batch', type=int, help='Override the tuned batch size')
+    parser.add_argument('--workers', type=int, help='Override the tuned data loader workers')
+    parser.add_argument('--cache', type=parse_cache, help='Override the tuned cache mode (false, ram, disk)')
+    parser.add_argument('--threads', type=int, help='Override the tuned torch intra-op threads')
+    parser.add_argument('--name', help='Run name under runs/detect')
+    parser.add_argument('--profile', action='store_true',
+                        help='Time data loading vs forward/backward per epoch (profile.csv next to results.csv)')
+    parser.add_argument('--full-val-every', type=int,
+                        help="Data built by proxy_val.py: validate on the proxy each epoch, on val_full every N")
+    parser.add_argument('--hyp', type=Path, help='Hyperparameter YAML (e.g. runs/hpsearch/best_hyp.yaml)')
+    args = parser.parse_args(argv)
+
+    train(args.model, args.data, args.epochs, args.imgsz, args.config, args.profile, args.full_val_every, args.hyp,
+          batch=args.batch, workers=args.workers, cache=args.cache, threads=args.threads, name=args.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,86 +1,248 @@
 # Split between train and val folders
 
 from pathlib import Path
+from collections import Counter
 import random
+import json
 import os
 import sys
-import shutil
 import argparse
 
-
-# Define and parse user input arguments
-
-parser = argparse.ArgumentParser()
-parser.add_argument('--datapath', help='Path to data folder containing image and annotation files',
-                    required=True)
-parser.add_argument('--train_pct', help='Ratio of images to go to train folder; \
-                    the rest go to validation folder (example: ".8")',
-                    default=.8)
-
-args = parser.parse_args()
-
-data_path = args.datapath
-train_percent = float(args.train_pct)
-
-# Check for valid entries
-if not os.path.isdir(data_path):
-   print('Directory specified by --datapath not found. Verify the path is correct (and uses double back slashes if on Windows) and try again.')
-   sys.exit(0)
-if train_percent < .01 or train_percent > 0.99:
-   print('Invalid entry for train_pct. Please enter a number between .01 and .99.')
-   sys.exit(0)
-val_percent = 1 - train_percent
-
-# Define path to input dataset 
-input_image_path = os.path.join(data_path,'images')
-input_label_path = os.path.join(data_path,'labels')
-
-# Define paths to image and annotation folders
-cwd = os.getcwd()
-train_img_path = os.path.join(cwd,'data/train/images')
-train_txt_path = os.path.join(cwd,'data/train/labels')
-val_img_path = os.path.join(cwd,'data/validation/images')
-val_txt_path = os.path.join(cwd,'data/validation/labels')
-
-# Create folders if they don't already exist
-for dir_path in [train_img_path, train_txt_path, val_img_path, val_txt_path]:
-   if not os.path.exists(dir_path):
-      os.makedirs(dir_path)
-      print(f'Created folder at {dir_path}.')
-
-
-# Get list of all images and annotation files
-img_file_list = [path for path in Path(input_image_path).rglob('*')]
-txt_file_list = [path for path in Path(input_label_path).rglob('*')]
-
-print(f'Number of image files: {len(img_file_list)}')
-print(f'Number of annotation files: {len(txt_file_list)}')
-
-# Determine number of files to move to each folder
-file_num = len(img_file_list)
-train_num = int(file_num*train_percent)
-val_num = file_num - train_num
-print('Images moving to train: %d' % train_num)
-print('Images moving to validation: %d' % val_num)
-
-# Select files randomly and copy them to train or val folders
-for i, set_num in enumerate([train_num, val_num]):
-  for ii in range(set_num):
-    img_path = random.choice(img_file_list)
-    img_fn = img_path.name
-    base_fn = img_path.stem
-    txt_fn = base_fn + '.txt'
-    txt_path = os.path.join(input_label_path,txt_fn)
-
-    if i == 0: # Copy first set of files to train folders
-      new_img_path, new_txt_path = train_img_path, train_txt_path
-    elif i == 1: # Copy second set of files to the validation folders
-      new_img_path, new_txt_path = val_img_path, val_txt_path
-
-    shutil.copy(img_path, os.path.join(new_img_path,img_fn))
-    #os.rename(img_path, os.path.join(new_img_path,img_fn))
-    if os.path.exists(txt_path): # If txt path does not exist, this is a background image, so skip txt file
-      shutil.copy(txt_path,os.path.join(new_txt_path,txt_fn))
-      #os.rename(txt_path,os.path.join(new_txt_path,txt_fn))
-
-    img_file_list.remove(img_path)
+from dataset_utils import IMAGE_EXTENSIONS, LINK_MODES, link_file
+
+
+def list_files_by_key(folder, extensions=None):
+    """Map relative path without suffix (e.g. 'batch_1/000001') -> path for every file under folder.
+
+    Same-named files in different subfolders keep their own keys; two files
+    differing only in suffix (a.jpg and a.png) are an error, since their
+    label would be the same a.txt.
+    """
+    files = {}
+    for path in Path(folder).rglob('*'):
+        if extensions is not None and path.suffix.lower() not in extensions:
+            continue
+        if path.is_file():
+            key = path.relative_to(folder).with_suffix('').as_posix()
+            if key in files:
+                raise ValueError(f"{files[key]} and {path} would share the label {key}.txt")
+            files[key] = path
+    return files
+
+
+def read_class_set(label_path):
+    """Set of class ids used in a YOLO label file"""
+    classes = set()
+    with open(label_path, 'r') as f:
+        for line in f:
+            parts = line.split()
+            if parts:
+                classes.add(int(float(parts[0])))
+    return classes
+
+
+def random_split(names, train_percent, seed):
+    """Shuffle once and cut; O(n)"""
+    names = sorted(names)
+    random.Random(seed).shuffle(names)
+    train_num = int(len(names) * train_percent)
+    return {'train': names[:train_num], 'validation': names[train_num:]}
+
+
+def stratified_split(class_sets, train_percent, seed):
+    """Iterative multi-label stratification (Sechidis et al., 2011).
+
+    class_sets maps image name -> set of class ids. Labels are handled from
+    the rarest to the most common, and every image carrying the current label
+    goes to the split that still wants the most examples of it. Rare classes
+    therefore end up in both splits in proportion instead of by luck.
+    """
+    rng = random.Random(seed)
+    names = sorted(class_sets)
+    rng.shuffle(names)
+
+    ratios = {'train': train_percent, 'validation': 1 - train_percent}
+    splits = {split: [] for split in ratios}
+
+    label_counts = Counter()
+    images_by_label = {}
+    for name in names:
+        for class_id in class_sets[name]:
+            label_counts[class_id] += 1
+            images_by_label.setdefault(class_id, []).append(name)
+
+    wanted_size = {split: len(names) * r for split, r in ratios.items()}
+    wanted_label = {split: {c: n * r for c, n in label_counts.items()} for split, r in ratios.items()}
+    remaining = Counter(label_counts)
+    assigned = set()
+
+    def assign(name, split):
+        assigned.add(name)
+        splits[split].append(name)
+        wanted_size[split] -= 1
+        for class_id in class_sets[name]:
+            wanted_label[split][class_id] -= 1
+            remaining[class_id] -= 1
+
+    while True:
+        open_labels = [c for c, n in remaining.items() if n > 0]
+        if not open_labels:
+            break
+        class_id = min(open_labels, key=lambda c: (remaining[c], c))
+        for name in images_by_label[class_id]:
+            if name in assigned:
+                continue
+            split = max(ratios, key=lambda s: (wanted_label[s][class_id], wanted_size[s], rng.random()))
+            assign(name, split)
+
+    # Background images (no labels) just fill up the split sizes
+    for name in names:
+        if name not in assigned:
+            split = max(ratios, key=lambda s: (wanted_size[s], rng.random()))
+            assign(name, split)
+
+    return splits
+
+
+def write_manifest(manifest_path, data_path, splits, seed, train_percent, stratify):
+    manifest = {
+        'source': str(Path(data_path).absolute()),
+        'seed': seed,
+        'train_pct': train_percent,
+        'stratify': stratify,
+        'splits': splits,
+    }
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest_path
+
+
+def main(argv=None):
+    # Define and parse user input arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--datapath', help='Path to data folder containing image and annotation files',
+                        required=True)
+    parser.add_argument('--train_pct', help='Ratio of images to go to train folder; \
+                        the rest go to validation folder (example: ".8")',
+                        default=.8)
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the shuffle / stratification')
+    parser.add_argument('--stratify', action='store_true',
+                        help='Use iterative multi-label stratification on per-image class sets')
+    parser.add_argument('--link_mode', choices=LINK_MODES, default='copy',
+                        help='How files are placed in the split folders (falls back to copy)')
+    parser.add_argument('--output', default=os.path.join(os.getcwd(), 'data'),
+                        help='Folder that receives train/ and validation/')
+    parser.add_argument('--manifest', help='Where to write the split manifest (default: <output>/split_manifest.json)')
+    parser.add_argument('--from_manifest', help='Reproduce the split stored in an existing manifest')
+    parser.add_argument('--manifest_only', action='store_true',
+                        help='Only write the manifest, do not place any files')
+    parser.add_argument('--group_near_duplicates', action='store_true',
+                        help='Keep perceptual-hash near-duplicates and augmentations of one source in the same split')
+    parser.add_argument('--dedup_radius', type=int, default=6,
+                        help='Max pHash Hamming distance for --group_near_duplicates')
+    parser.add_argument('--dedup_cache', help='JSON file caching pHashes for --group_near_duplicates')
+
+    args = parser.parse_args(argv)
+
+    data_path = args.datapath
+    train_percent = float(args.train_pct)
+
+    # Check for valid entries
+    if not os.path.isdir(data_path):
+        print('Directory specified by --datapath not found. Verify the path is correct (and uses double back slashes if on Windows) and try again.')
+        sys.exit(0)
+    if train_percent < .01 or train_percent > 0.99:
+        print('Invalid entry for train_pct. Please enter a number between .01 and .99.')
+        sys.exit(0)
+
+    # Define path to input dataset
+    input_image_path = os.path.join(data_path, 'images')
+    input_label_path = os.path.join(data_path, 'labels')
+
+    # Get list of all images and annotation files
+    try:
+        images = list_files_by_key(input_image_path, IMAGE_EXTENSIONS)
+        labels = list_files_by_key(input_label_path, ['.txt'])
+    except ValueError as e:
+        print(f'Ambiguous file names: {e}')
+        sys.exit(1)
+
+    print(f'Number of image files: {len(images)}')
+    print(f'Number of annotation files: {len(labels)}')
+
+    class_sets = {key: read_class_set(labels[key]) if key in labels else set() for key in images}
+    seed, stratify = args.seed, args.stratify
+
+    if args.from_manifest:
+        with open(args.from_manifest) as f:
+            manifest = json.load(f)
+        seed, train_percent, stratify = manifest['seed'], manifest['train_pct'], manifest['stratify']
+        splits = {split: [Path(p).with_suffix('').as_posix() for p in files]
+                  for split, files in manifest['splits'].items()}
+        print(f'Reproducing split from {args.from_manifest}')
+    elif args.group_near_duplicates:
+        # Split whole duplicate groups so no near-copy of a val image stays in train
+        from find_duplicates import duplicate_groups
+        keys = sorted(images)
+        group_ids = duplicate_groups([images[key] for key in keys], args.dedup_radius, cache_file=args.dedup_cache)
+        members = {}
+        for key, group in zip(keys, group_ids):
+            members.setdefault(keys[group], []).append(key)
+        print(f'Grouped {len(keys)} images into {len(members)} near-duplicate groups')
+        group_class_sets = {key: set().union(*(class_sets[s] for s in group)) for key, group in members.items()}
+        if stratify:
+            group_splits = stratified_split(group_class_sets, train_percent, seed)
+        else:
+            group_splits = random_split(members, train_percent, seed)
+        splits = {split: [s for key in keys for s in members[key]] for split, keys in group_splits.items()}
+    elif args.stratify:
+        splits = stratified_split(class_sets, train_percent, seed)
+    else:
+        splits = random_split(images, train_percent, seed)
+
+    print('Images going to train: %d' % len(splits['train']))
+    print('Images going to validation: %d' % len(splits['validation']))
+
+    # Per-class image counts so rare classes can be checked in both splits
+    for split, keys in splits.items():
+        counts = Counter()
+        for key in keys:
+            counts.update(class_sets.get(key, ()))
+        print(f'  {split} images per class: {dict(sorted(counts.items()))}')
+
+    manifest_splits = {
+        split: [str(images[key].relative_to(input_image_path)) for key in keys if key in images]
+        for split, keys in splits.items()
+    }
+    manifest_path = args.manifest or os.path.join(args.output, 'split_manifest.json')
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    write_manifest(manifest_path, data_path, manifest_splits, seed, train_percent, stratify)
+    print(f'Wrote split manifest to {manifest_path}')
+
+    if args.manifest_only:
+        return
+
+    # Place the files (subfolders kept); missing labels are background images, so skip their txt
+    for split, keys in splits.items():
+        new_img_path = os.path.join(args.output, split, 'images')
+        new_txt_path = os.path.join(args.output, split, 'labels')
+        for dir_path in [new_img_path, new_txt_path]:
+            if not os.path.exists(dir_path):
+                os.makedirs(dir_path)
+                print(f'Created folder at {dir_path}.')
+
+        for key in keys:
+            img_path = images.get(key)
+            if img_path is None:
+                continue
+            img_dst = Path(new_img_path) / img_path.relative_to(input_image_path)
+            img_dst.parent.mkdir(parents=True, exist_ok=True)
+            link_file(img_path, img_dst, args.link_mode)
+            if key in labels:
+                txt_dst = Path(new_txt_path) / (key + '.txt')
+                txt_dst.parent.mkdir(parents=True, exist_ok=True)
+                link_file(labels[key], txt_dst, args.link_mode)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,33 @@
 # verify_dataset.py - UPDATED VERSION
 import json
 import os
+import struct
+import sys
+import argparse
 from pathlib import Path
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import random
 
 # ========== CONFIGURATION ==========
 DATASET_PATH = Path("/home/immaculatapatrickumoh/Documents/EcoWheels_Proj/Org_dataset")
+CACHE_FILE = DATASET_PATH / ".verify_cache.json"
+WORKERS = min(32, (os.cpu_count() or 1) * 4)
+BBOX_TOLERANCE = 1.0  # pixels
 # ===================================
 
+def set_dataset_path(path):
+    """Point the checks at another dataset folder"""
+    global DATASET_PATH, CACHE_FILE
+    DATASET_PATH = Path(path)
+    CACHE_FILE = DATASET_PATH / ".verify_cache.json"
+
+
+def set_cache_file(path):
+    global CACHE_FILE
+    CACHE_FILE = Path(path)
+
+
 def load_annotations():
     """Load the updated annotations file"""
     
@@ -165,6 +184,181 @@ def check_file_existence(data, sample_size=100):
     
     return existing_files, len(sample_indices), missing_files
 
+def read_image_header(path):
+    """Read (width, height, truncated) from the JPEG/PNG header without decoding.
+
+    Only the header and the last few bytes are read: a JPEG must end with the
+    EOI marker and a PNG with the IEND chunk, otherwise the file is truncated.
+    Raises ValueError for files that are not a readable JPEG/PNG, including
+    headers cut short.
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(32)
+
+            if head.startswith(b'\x89PNG\r\n\x1a\n'):
+                if head[12:16] != b'IHDR':
+                    raise ValueError("PNG without IHDR")
+                width, height = struct.unpack('>II', head[16:24])
+                f.seek(-12, os.SEEK_END)
+                truncated = b'IEND' not in f.read(12)
+                return width, height, truncated
+
+            if head.startswith(b'\xff\xd8'):
+                # Walk the marker segments until a start-of-frame marker
+                f.seek(2)
+                while True:
+                    marker = f.read(2)
+                    if len(marker) < 2 or marker[0] != 0xFF:
+                        raise ValueError("corrupt JPEG marker")
+                    while marker[1] == 0xFF:  # fill bytes
+                        marker = marker[1:] + f.read(1)
+                        if len(marker) < 2:
+                            raise ValueError("JPEG header cut short")
+                    code = marker[1]
+                    if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+                        continue
+                    length_bytes = f.read(2)
+                    if len(length_bytes) < 2:
+                        raise ValueError("JPEG header cut short")
+                    length = struct.unpack('>H', length_bytes)[0]
+                    if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+                        height, width = struct.unpack('>xHH', f.read(5))
+                        break
+                    f.seek(length - 2, os.SEEK_CUR)
+                f.seek(-2, os.SEEK_END)
+                truncated = f.read(2) != b'\xff\xd9'
+                return width, height, truncated
+    except struct.error as e:  # a segment cut short inside the header
+        raise ValueError(f"image header cut short: {e}") from e
+
+    raise ValueError("not a JPEG or PNG file")
+
+def decode_image(path):
+    """Fully decode an image (runs in a worker process); returns an error message or None"""
+    try:
+        from PIL import Image
+        with Image.open(path) as img:
+            img.load()
+        return None
+    except Exception as e:
+        return str(e) or e.__class__.__name__
+
+def image_path_for(filename):
+    """batch_X_name.jpg -> DATASET_PATH/batch_X/batch_X_name.jpg"""
+    parts = filename.split('_')
+    if len(parts) >= 2 and parts[1].isdigit():
+        return DATASET_PATH / f"batch_{parts[1]}" / filename
+    return DATASET_PATH / filename
+
+def load_verify_cache():
+    try:
+        with open(CACHE_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_verify_cache(cache):
+    tmp = CACHE_FILE.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmp, CACHE_FILE)
+
+def probe_file(path, cached):
+    """Stat + header probe of one file, reusing the cached result if mtime/size match"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return {'exists': False}
+
+    if cached and cached.get('mtime_ns') == st.st_mtime_ns and cached.get('size') == st.st_size:
+        return cached
+
+    result = {'exists': True, 'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+    try:
+        result['width'], result['height'], result['truncated'] = read_image_header(path)
+    except (OSError, ValueError, struct.error) as e:
+        result['error'] = str(e)
+    return result
+
+def check_full_integrity(data, workers=WORKERS, decode=False, use_cache=True):
+    """Check every image: existence, header, truncation, COCO size and bbox bounds"""
+    
+    print(f"\n🔬 FULL INTEGRITY CHECK")
+    print("-" * 40)
+    
+    cache = load_verify_cache() if use_cache else {}
+    images = data['images']
+    paths = [str(image_path_for(img['file_name'])) for img in images]
+    
+    print(f"Probing {len(paths):,} files with {workers} threads...")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        probes = list(pool.map(lambda p: probe_file(p, cache.get(p)), paths))
+    
+    reused = sum(1 for p, r in zip(paths, probes) if cache.get(p) is r)
+    print(f"  Reused {reused:,} cached results, probed {len(paths) - reused:,} files")
+    
+    if decode:
+        to_decode = [i for i, r in enumerate(probes)
+                     if r.get('exists') and 'error' not in r and 'decode_error' not in r
+                     and not r.get('decoded')]
+        print(f"Decoding {len(to_decode):,} images with {os.cpu_count()} processes...")
+        with ProcessPoolExecutor() as pool:
+            errors = pool.map(decode_image, [paths[i] for i in to_decode], chunksize=16)
+            for i, error in zip(to_decode, errors):
+                probes[i] = dict(probes[i])
+                if error:
+                    probes[i]['decode_error'] = error
+                else:
+                    probes[i]['decoded'] = True
+    
+    if use_cache:
+        save_verify_cache({p: r for p, r in zip(paths, probes) if r.get('exists')})
+    
+    anns_by_img = {}
+    for ann in data['annotations']:
+        anns_by_img.setdefault(ann['image_id'], []).append(ann)
+    
+    missing_files = []
+    issues = {'unreadable': [], 'truncated': [], 'decode_failed': [], 'size_mismatch': [], 'bbox_outside': []}
+    
+    for img, probe in zip(images, probes):
+        filename = img['file_name']
+        if not probe.get('exists'):
+            missing_files.append(filename)
+            continue
+        if 'error' in probe:
+            issues['unreadable'].append(f"{filename}: {probe['error']}")
+            continue
+        if probe['truncated']:
+            issues['truncated'].append(filename)
+        if 'decode_error' in probe:
+            issues['decode_failed'].append(f"{filename}: {probe['decode_error']}")
+        
+        width, height = probe['width'], probe['height']
+        if (img.get('width'), img.get('height')) != (width, height):
+            issues['size_mismatch'].append(
+                f"{filename}: COCO {img.get('width')}x{img.get('height')}, file {width}x{height}")
+        
+        for ann in anns_by_img.get(img['id'], []):
+            x, y, w, h = ann['bbox']
+            if (w <= 0 or h <= 0 or x < -BBOX_TOLERANCE or y < -BBOX_TOLERANCE
+                    or x + w > width + BBOX_TOLERANCE or y + h > height + BBOX_TOLERANCE):
+                issues['bbox_outside'].append(f"{filename}: annotation {ann['id']} bbox {ann['bbox']}")
+    
+    existing_files = len(images) - len(missing_files)
+    print(f"\n📊 Overall results:")
+    print(f"  Files checked: {len(images):,}")
+    print(f"  Files found: {existing_files:,}")
+    print(f"  Files missing: {len(missing_files):,}")
+    for name, found in issues.items():
+        marker = "⚠️ " if found else "✅"
+        print(f"  {marker} {name.replace('_', ' ')}: {len(found):,}")
+        for item in found[:5]:
+            print(f"      - {item}")
+    
+    return (existing_files, len(images), missing_files), issues
+
 def check_for_duplicates(data):
     """Check for duplicate filenames"""
     
@@ -259,7 +453,7 @@ def check_annotations_integrity(data):
     return len(images_without_annotations)
 
 def create_final_report(data, format_results, existence_results, 
-                       duplicate_count, batch_counts, missing_annotations):
+                       duplicate_count, batch_counts, missing_annotations, integrity_issues=None):
     """Create final verification report"""
     
     print(f"\n📋 CREATING FINAL VERIFICATION REPORT")
@@ -297,6 +491,15 @@ def create_final_report(data, format_results, existence_results,
         "-" * 40
     ]
     
+    # Add full integrity results
+    if integrity_issues is not None:
+        integrity_lines = ["INTEGRITY CHECK (all files)", "-" * 40]
+        for name, found in integrity_issues.items():
+            integrity_lines.append(f"{name.replace('_', ' ').capitalize()}: {len(found):,}")
+            integrity_lines.extend(f"  - {item}" for item in found[:20])
+        integrity_lines.append("")
+        report_lines[-2:-2] = integrity_lines  # before BATCH DISTRIBUTION
+    
     # Add batch distribution
     total_images = sum(batch_counts.values())
     for batch in sorted(batch_counts.keys(), key=lambda x: int(x.split('_')[1])):
@@ -326,7 +529,22 @@ def create_final_report(data, format_results, existence_results,
     
     return report_file, success_rate, format_success_rate
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Verify the renamed dataset before upload')
+    parser.add_argument('--full', action='store_true',
+                        help='Check every image (header, size, truncation, bboxes) instead of a 100-file sample')
+    parser.add_argument('--decode', action='store_true', help='With --full, also fully decode every image')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='Threads for the full check')
+    parser.add_argument('--no-cache', action='store_true', help='Ignore and do not update the mtime cache')
+    parser.add_argument('--dataset', type=Path, help=f'Dataset folder (default: {DATASET_PATH})')
+    parser.add_argument('--cache-file', type=Path, help='mtime cache file (default: <dataset>/.verify_cache.json)')
+    args = parser.parse_args(argv)
+
+    if args.dataset:
+        set_dataset_path(args.dataset)
+    if args.cache_file:
+        set_cache_file(args.cache_file)
+    
     print("=" * 60)
     print("🔍 COMPLETE DATASET VERIFICATION")
     print("=" * 60)
@@ -336,7 +554,7 @@ def main():
     
     if not data:
         print("❌ Failed to load annotations. Exiting.")
-        return
+        sys.exit(1)
     
     print(f"\n📊 Dataset loaded successfully:")
     print(f"  File: {ann_file.name}")
@@ -346,7 +564,12 @@ def main():
     
     # Run all checks
     format_results = check_filename_format(data)
-    existence_results = check_file_existence(data, sample_size=100)
+    integrity_issues = None
+    if args.full:
+        existence_results, integrity_issues = check_full_integrity(
+            data, args.workers, args.decode, not args.no_cache)
+    else:
+        existence_results = check_file_existence(data, sample_size=100)
     duplicate_count = check_for_duplicates(data)
     batch_counts = check_batch_distribution(data)
     missing_annotations = check_annotations_integrity(data)
@@ -354,7 +577,7 @@ def main():
     # Create final report
     report_file, success_rate, format_success_rate = create_final_report(
         data, format_results, existence_results, duplicate_count, 
-        batch_counts, missing_annotations
+        batch_counts, missing_annotations, integrity_issues
     )
     
     print("\n" + "=" * 60)
@@ -383,6 +606,8 @@ def main():
         print("Fix the issues before uploading to Roboflow.")
     
     print(f"\n📄 Detailed report: {report_file}")
+    if success_rate < 80:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file